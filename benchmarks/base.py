@@ -0,0 +1,39 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+import glob
+import os
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures')
+
+
+def fixture_files(subdir, pattern='*.yaml'):
+    return sorted(glob.glob(os.path.join(FIXTURES_DIR, subdir, pattern)))
+
+
+def bench(func, number=100, repeat=5):
+    '''Return the best per-call time (in seconds) of func over several runs'''
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def report(name, seconds, baseline=None, stream=None):
+    stream = stream or sys.stdout
+    line = '{:<48} {:>12.1f} us'.format(name, seconds * 1e6)
+    if baseline:
+        line += '  ({:.2f}x)'.format(baseline / seconds)
+    print(line, file=stream)
@@ -0,0 +1,60 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure the post-conversion cost of Client.convert_file
+
+Compares emitting the converted tree, re-parsing it to get plain data and
+emitting it again, against converting the tree to plain data directly and
+emitting it once.
+
+    python -m benchmarks.bench_convert_file
+'''
+
+from orquesta.specs.native.v1 import models as native_v1_models
+
+from benchmarks import base
+from orquestaconvert.utils import yaml_utils
+from orquestaconvert.workflows import base as workflows_base
+
+
+def emit_reparse_emit(orquesta_wf_data_ruamel):
+    orquesta_wf_data_str = yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+    orquesta_wf_data = yaml_utils.yaml_to_obj(orquesta_wf_data_str)
+    native_v1_models.instantiate(orquesta_wf_data)
+    return yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+
+
+def convert_emit(orquesta_wf_data_ruamel):
+    orquesta_wf_data = yaml_utils.ruamel_to_obj(orquesta_wf_data_ruamel)
+    native_v1_models.instantiate(orquesta_wf_data)
+    return yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+
+
+def main():
+    converted = []
+    for f in base.fixture_files('mistral'):
+        data, ruamel_data = yaml_utils.read_yaml(f)
+        name = [k for k in data if k != 'version'][0]
+        try:
+            converted.append(workflows_base.WorkflowConverter().convert(ruamel_data[name]))
+        except NotImplementedError:
+            continue
+
+    print('{} converted workflows from tests/fixtures/mistral'.format(len(converted)))
+    baseline = base.bench(lambda: [emit_reparse_emit(wf) for wf in converted], number=10)
+    base.report('emit + re-parse + emit', baseline)
+    base.report('ruamel_to_obj + emit', base.bench(lambda: [convert_emit(wf) for wf in converted],
+                                                   number=10), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure expression conversion throughput
+
+Compares the single pass BaseExpressionConverter.convert_string() against
+running the five conversions one after the other, in expressions per
+second, for Jinja and YAQL expressions typical of Mistral workflows.
+
+    python -m benchmarks.bench_convert_string
+'''
+
+from __future__ import print_function
+
+from benchmarks import base
+from orquestaconvert.expressions import jinja
+from orquestaconvert.expressions import yaql as yql
+
+JINJA_EXPRESSIONS = [
+    '_.test',
+    '_.vm_name + "-" + _.domain',
+    "task('create_vm').result.result.id",
+    'st2kv.system.vsphere.datacenter',
+    'env().st2_execution_id',
+    '_.hosts | length > 0 and _.retries < 3',
+    '{"url": env().st2_action_api_url, "id": _.record_id, "item": _.item}',
+    'zip([0, 1, 2], [3, 4, 5], _.all_the_things)',
+]
+YAQL_EXPRESSIONS = [
+    '$.test',
+    '$.vm_name + "-" + $.domain',
+    "task(create_vm).result.result.id",
+    'st2kv.system.vsphere.datacenter',
+    'env().st2_execution_id',
+    'len($.hosts) > 0 and $.retries < 3',
+    'dict(url => env().st2_action_api_url, id => $.record_id, item => $.item)',
+    '$.data.where($.status = "ok").select($.name)',
+]
+
+
+def convert_string_sequential(converter, expr, **kwargs):
+    # The original implementation, one regex pass per conversion
+    expr = converter.convert_context_vars(expr, **kwargs)
+    expr = converter.convert_task_result(expr)
+    expr = converter.convert_st2kv(expr)
+    expr = converter.convert_st2_execution_id(expr)
+    expr = converter.convert_st2_api_url(expr)
+    return expr
+
+
+def report_rate(name, seconds_per_batch, batch_size, baseline=None):
+    line = '{:<48} {:>12,.0f} expr/s'.format(name, batch_size / seconds_per_batch)
+    if baseline:
+        line += '  ({:.2f}x)'.format(baseline / seconds_per_batch)
+    print(line)
+
+
+def main():
+    for name, converter, expressions in [('jinja', jinja.JinjaExpressionConverter,
+                                          JINJA_EXPRESSIONS),
+                                         ('yaql', yql.YaqlExpressionConverter,
+                                          YAQL_EXPRESSIONS)]:
+        for expr in expressions:
+            expected = convert_string_sequential(converter, expr, item_vars=['item'])
+            assert converter.convert_string(expr, item_vars=['item']) == expected
+
+        def _sequential():
+            for expr in expressions:
+                convert_string_sequential(converter, expr, item_vars=['item'])
+
+        def _single_pass():
+            for expr in expressions:
+                converter.convert_string(expr, item_vars=['item'])
+
+        baseline = base.bench(_sequential, number=2000)
+        report_rate('{} sequential passes'.format(name), baseline, len(expressions))
+        report_rate('{} single pass'.format(name), base.bench(_single_pass, number=2000),
+                    len(expressions), baseline)
+
+
+if __name__ == '__main__':
+    main()
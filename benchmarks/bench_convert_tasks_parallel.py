@@ -0,0 +1,79 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure converting the tasks of a very big workflow in parallel
+
+Generates a Mistral workflow with 5,000 tasks, each with with-items, an
+action, input, publish and a couple of transitions, and converts its tasks
+serially and with worker processes. The expression cache is turned off, so
+every run converts every expression.
+
+    python -m benchmarks.bench_convert_tasks_parallel
+'''
+
+from __future__ import print_function
+
+import multiprocessing
+
+from benchmarks import base
+from orquestaconvert import expressions
+from orquestaconvert.utils import yaml_utils
+from orquestaconvert.workflows import base as workflows_base
+
+TASK_COUNT = 5000
+
+
+def generate_tasks(count):
+    tasks = []
+    for i in range(count):
+        tasks.append(
+            "  task{i}:\n"
+            "    with-items: host in <% $.hosts_{i} %>\n"
+            "    action: core.remote\n"
+            "    input:\n"
+            "      hosts: <% $.host %>\n"
+            "      cmd: run --id {{{{ _.id_{i} }}}} --flag <% $.flag %>\n"
+            "      env:\n"
+            "        RETRIES: 3\n"
+            "    publish:\n"
+            "      out_{i}: <% task(task{i}).result.stdout %>\n"
+            "      count: <% $.count + 1 %>\n"
+            "    on-success:\n"
+            "      - task{next}: <% $.out_{i} %>\n"
+            "      - done: <% not $.out_{i} %>\n"
+            "    on-error:\n"
+            "      - fail\n".format(i=i, next=i + 1))
+    _, data = yaml_utils.load_yaml('tasks:\n' + ''.join(tasks))
+    return data['tasks']
+
+
+def main():
+    expressions.EXPRESSION_CACHE.enabled = False
+    mistral_tasks = generate_tasks(TASK_COUNT)
+    converter = workflows_base.WorkflowConverter()
+    expr_converter = converter.expr_type_converter('jinja')
+
+    def _convert(jobs):
+        return converter.convert_tasks(mistral_tasks, expr_converter, set(), jobs=jobs)
+
+    serial = yaml_utils.obj_to_yaml(_convert(1))
+    print('{} tasks, {} CPUs'.format(TASK_COUNT, multiprocessing.cpu_count()))
+    baseline = base.bench(lambda: _convert(1), number=1, repeat=3)
+    base.report('serial', baseline)
+    for jobs in (2, 4, 8):
+        assert yaml_utils.obj_to_yaml(_convert(jobs)) == serial
+        base.report('{} jobs'.format(jobs), base.bench(lambda: _convert(jobs), number=1, repeat=3),
+                    baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure time and memory of converting large task input blocks
+
+Generates task inputs made of nested dicts and lists, mostly literal values
+with a few expressions, and converts them with each of the copy modes of
+expressions.convert_tree(). The memory reported is the peak allocated
+during the conversion, as measured by tracemalloc.
+
+    python -m benchmarks.bench_convert_tree
+'''
+
+from __future__ import print_function
+
+import copy
+import random
+import timeit
+import tracemalloc
+
+from benchmarks import base
+from orquestaconvert import expressions
+from orquestaconvert.expressions import mixed
+
+
+def generate_input(rnd, depth, width):
+    if depth == 0:
+        value = rnd.random()
+        if value < 0.05:
+            return '{{{{ _.var_{} }}}}'.format(rnd.randint(0, 100))
+        elif value < 0.1:
+            return '<% $.var_{} %>'.format(rnd.randint(0, 100))
+        elif value < 0.5:
+            return 'literal {}'.format(rnd.randint(0, 1000))
+        return rnd.randint(0, 1000)
+    if rnd.random() < 0.5:
+        return [generate_input(rnd, depth - 1, width) for _ in range(width)]
+    return dict(('key_{}'.format(i), generate_input(rnd, depth - 1, width)) for i in range(width))
+
+
+def measure(tree, copy_mode):
+    # IN_PLACE modifies the tree, so every run gets its own copy of it, and
+    # tracemalloc slows everything down, so time and memory are measured
+    # in separate runs
+    def _convert(tree):
+        mixed.MixedExpressionConverter.convert(tree, item_vars=['var_1'], copy_mode=copy_mode)
+
+    trees = [copy.deepcopy(tree) for _ in range(6)]
+    elapsed = min(timeit.timeit(lambda: _convert(trees.pop()), number=1) for _ in range(5))
+
+    tracemalloc.start()
+    _convert(trees.pop())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    rnd = random.Random(0)
+    for depth, width in [(4, 8), (6, 5), (200, 1)]:
+        tree = generate_input(rnd, depth, width)
+        print('input depth {}, width {}'.format(depth, width))
+        baseline = None
+        for copy_mode in expressions.COPY_MODES:
+            # warm up the expression cache, so only the traversal is measured
+            mixed.MixedExpressionConverter.convert(tree, item_vars=['var_1'])
+            elapsed, peak = measure(tree, copy_mode)
+            if baseline is None:
+                baseline = (elapsed, peak)
+            base.report('  {}'.format(copy_mode), elapsed, baseline[0])
+            print('  {:<46} {:>12.1f} KiB  ({:.2f}x)'.format(copy_mode + ' peak memory', peak / 1024.0,
+                                                             baseline[1] / float(peak)))
+
+
+if __name__ == '__main__':
+    main()
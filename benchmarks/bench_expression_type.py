@@ -0,0 +1,70 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure expression type detection
+
+Compares ExpressionConverter.expression_type(), which checks for the
+expression delimiters first, against asking every orquesta evaluator, for
+plain strings (the common case: keys and literal inputs) and expressions.
+
+    python -m benchmarks.bench_expression_type
+'''
+
+from __future__ import print_function
+
+import six
+
+import orquesta.expressions.base
+
+from benchmarks import base
+from orquestaconvert import expressions
+
+PLAIN_STRINGS = [
+    'vm_name', 'hostname', 'core.local', 'succeeded', 'https://example.com/api/v1',
+    'Some longer description of what this action input is for', 'true', '30',
+]
+EXPRESSIONS = [
+    '{{ _.vm_name }}', '<% $.hostname %>', '{% if _.x %}yes{% endif %}',
+    'prefix {{ _.a }} and <% $.b %>',
+]
+
+
+def evaluators_expression_type(expr):
+    # The original implementation
+    for name, evaluator in six.iteritems(orquesta.expressions.base.get_evaluators()):
+        if evaluator.has_expressions(str(expr)):
+            return name
+    return None
+
+
+def main():
+    converter = expressions.ExpressionConverter
+    for name, strings in [('plain strings', PLAIN_STRINGS), ('expressions', EXPRESSIONS)]:
+        for expr in strings:
+            assert converter.expression_type(expr) == evaluators_expression_type(expr)
+
+        def _evaluators():
+            for expr in strings:
+                evaluators_expression_type(expr)
+
+        def _delimiters():
+            for expr in strings:
+                converter.expression_type(expr)
+
+        baseline = base.bench(_evaluators, number=5000) / len(strings)
+        base.report('{}: every evaluator'.format(name), baseline)
+        base.report('{}: delimiters first'.format(name),
+                    base.bench(_delimiters, number=5000) / len(strings), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure extracting the context variables used by big workflow outputs
+
+Compares WorkflowConverter.extract_context_variables() against the
+original implementation, which recursed and built a new set at every
+level, for converted output blocks of increasing size. With a cold cache,
+the cache of variables per string is cleared before every run, with a warm
+one every string has already been searched, as when the same expressions
+are searched again.
+
+    python -m benchmarks.bench_extract_context_variables
+'''
+
+from __future__ import print_function
+
+import random
+
+import six
+
+from benchmarks import base
+from orquestaconvert.utils import type_utils
+from orquestaconvert.workflows import base as workflows_base
+
+
+def extract_recursive(obj):
+    # The original implementation
+    variable_names = set()
+    if isinstance(obj, type_utils.dict_types):
+        for key in obj.keys():
+            variable_names = variable_names | extract_recursive(key)
+        for val in obj.values():
+            variable_names = variable_names | extract_recursive(val)
+    elif isinstance(obj, list):
+        for element in obj:
+            variable_names = variable_names | extract_recursive(element)
+    elif isinstance(obj, six.string_types):
+        for mobj in workflows_base.CTX_RGX.finditer(obj):
+            variable_names.add(mobj.group(1) or mobj.group(2))
+    return variable_names
+
+
+def generate_output(rnd, depth, width):
+    if depth == 0:
+        value = rnd.random()
+        if value < 0.3:
+            return '{{{{ ctx().var_{} }}}}'.format(rnd.randint(0, 10 ** 6))
+        elif value < 0.5:
+            return '<% ctx().var_{0}.get(key) + ctx(var_{1}) %>'.format(rnd.randint(0, 10 ** 6),
+                                                                        rnd.randint(0, 10 ** 6))
+        elif value < 0.8:
+            return 'literal {}'.format(rnd.randint(0, 1000))
+        return rnd.randint(0, 1000)
+    if rnd.random() < 0.5:
+        return [generate_output(rnd, depth - 1, width) for _ in range(width)]
+    return dict(('key_{}'.format(i), generate_output(rnd, depth - 1, width)) for i in range(width))
+
+
+def main():
+    rnd = random.Random(0)
+    converter = workflows_base.WorkflowConverter()
+    for depth, width in [(1, 1000), (1, 10000), (3, 10), (4, 10), (5, 8), (300, 1)]:
+        output = generate_output(rnd, depth, width)
+        assert converter.extract_context_variables(output) == extract_recursive(output)
+
+        def _extract():
+            workflows_base.CONTEXT_VARIABLES_CACHE.clear()
+            converter.extract_context_variables(output)
+
+        print('output depth {}, width {}'.format(depth, width))
+        baseline = base.bench(lambda: extract_recursive(output), number=10)
+        base.report('  recursive', baseline)
+        base.report('  accumulator, cold cache', base.bench(_extract, number=10), baseline)
+        base.report('  accumulator, warm cache',
+                    base.bench(lambda: converter.extract_context_variables(output), number=10), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Compare scanning action metadata against fully loading it
+
+Generates a directory of action metadata files with large 'parameters'
+blocks and times PackClient.get_workflow_files() against loading every
+file with yaml.safe_load().
+
+    python -m benchmarks.bench_list_workflows
+'''
+
+import glob
+import os
+import shutil
+import tempfile
+
+import yaml
+
+from benchmarks import base
+from orquestaconvert import pack_client
+
+
+def full_load_get_workflow_files(workflow_type, action_directory):
+    # The original implementation
+    mistral_workflows = {}
+    for a_file in glob.glob('{}/*.yaml'.format(action_directory)):
+        with open(a_file, 'r') as f:
+            action_data = yaml.safe_load(f.read())
+        if action_data.get('runner_type') == workflow_type:
+            mistral_workflows[a_file] = os.path.join(
+                action_directory, *os.path.split(action_data.get('entry_point')))
+    return mistral_workflows
+
+
+def write_actions(directory, num_actions=200, num_parameters=100):
+    for i in range(num_actions):
+        with open(os.path.join(directory, 'action_{}.yaml'.format(i)), 'w') as f:
+            f.write('---\n'
+                    'name: action_{i}\n'
+                    'pack: bench\n'
+                    'runner_type: {runner}\n'
+                    'entry_point: workflows/action_{i}.yaml\n'
+                    'parameters:\n'.format(i=i, runner='mistral-v2' if i % 2 else 'orquesta'))
+            for p in range(num_parameters):
+                f.write('  param_{p}:\n'
+                        '    type: string\n'
+                        '    description: "Parameter number {p} of this action"\n'
+                        '    default: "value {p}"\n'
+                        '    required: false\n'.format(p=p))
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        write_actions(directory)
+        client = pack_client.PackClient()
+        expected = full_load_get_workflow_files('mistral-v2', directory)
+        assert expected == client.get_workflow_files('mistral-v2', directory)
+
+        print('200 action metadata files with 100 parameters each')
+        baseline = base.bench(lambda: full_load_get_workflow_files('mistral-v2', directory),
+                              number=1, repeat=3)
+        base.report('yaml.safe_load every file', baseline)
+        base.report('PackClient.get_workflow_files',
+                    base.bench(lambda: client.get_workflow_files('mistral-v2', directory),
+                               number=1, repeat=3),
+                    baseline)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure mixed expression conversion
+
+Compares the single scan MixedExpressionConverter.convert_string() against
+converting all of the Jinja expressions and then all of the YAQL
+expressions, for action strings and inputs made of several interpolated
+fragments. The expression cache is turned off, so every call converts.
+
+    python -m benchmarks.bench_mixed_convert_string
+'''
+
+from __future__ import print_function
+
+from benchmarks import base
+from orquestaconvert import expressions
+from orquestaconvert.expressions import mixed
+
+MIXED_STRINGS = [
+    'ping <% $.ping_flags %> {{ _.target_host }}',
+    'i in {{ _.test1 }}<% $.test2 %>{{ _.test3 }}<% $.test4 %>',
+    ' '.join('--{0} {{{{ _.{0} }}}}'.format(name) for name in 'abcdefghij'),
+    ' '.join('--{0} <% $.{0} %>'.format(name) for name in 'abcdefghij'),
+    'curl -X POST <% env().st2_action_api_url %>/executions/<% env().st2_execution_id %>',
+    'a plain string without any expressions in it at all',
+]
+
+
+def convert_sequential(expr, **kwargs):
+    # The original implementation, one pass per expression language
+    def _inner_convert_string(match):
+        return mixed.MixedExpressionConverter.convert_string_containing_expressions(match, **kwargs)
+    expr = mixed.JINJA_EXPR_RGX.sub(_inner_convert_string, expr)
+    return mixed.YAQL_EXPR_RGX.sub(_inner_convert_string, expr)
+
+
+def main():
+    expressions.EXPRESSION_CACHE.enabled = False
+    for expr in MIXED_STRINGS:
+        assert mixed.MixedExpressionConverter.convert_string(expr) == convert_sequential(expr)
+
+    def _sequential():
+        for expr in MIXED_STRINGS:
+            convert_sequential(expr)
+
+    def _single_scan():
+        for expr in MIXED_STRINGS:
+            mixed.MixedExpressionConverter.convert_string(expr)
+
+    baseline = base.bench(_sequential, number=500) / len(MIXED_STRINGS)
+    base.report('jinja pass, then yaql pass', baseline)
+    base.report('single scan', base.bench(_single_scan, number=500) / len(MIXED_STRINGS), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Microbenchmarks for reusing the cached YAML emitter in yaml_utils
+
+    python -m benchmarks.bench_obj_to_yaml
+'''
+
+import os
+
+import ruamel.yaml.comments
+import six
+
+from benchmarks import base
+from orquestaconvert.utils import yaml_utils
+
+CommentedMap = ruamel.yaml.comments.CommentedMap
+
+
+def fresh_emitter_obj_to_yaml(obj, indent=2):
+    # The original implementation: build and configure a new YAML instance
+    # for every document
+    stream = six.StringIO()
+    yaml_utils._new_yaml_emitter(indent).dump(obj, stream)
+    return stream.getvalue()
+
+
+def small_document():
+    return CommentedMap([('version', '1.0'), ('input', ['a', 'b']),
+                         ('output', [{'result': '{{ ctx().a }}'}])])
+
+
+def large_document(num_tasks=500):
+    tasks = CommentedMap()
+    for i in range(num_tasks):
+        tasks['task_{}'.format(i)] = CommentedMap([
+            ('action', 'core.noop'),
+            ('input', CommentedMap([('value', '{{{{ ctx().value_{} }}}}'.format(i))])),
+            ('next', [CommentedMap([('when', '{{ succeeded() }}'),
+                                    ('do', ['task_{}'.format(i + 1)])])]),
+        ])
+    return CommentedMap([('version', '1.0'), ('tasks', tasks)])
+
+
+def main():
+    for name, doc, number in [('small', small_document(), 500),
+                              ('large', large_document(), 5)]:
+        baseline = base.bench(lambda: fresh_emitter_obj_to_yaml(doc), number=number)
+        base.report('{}: new emitter per call'.format(name), baseline)
+        base.report('{}: cached emitter'.format(name),
+                    base.bench(lambda: yaml_utils.obj_to_yaml(doc), number=number), baseline)
+
+        with open(os.devnull, 'w') as devnull:
+            base.report('{}: cached emitter, direct to stream'.format(name),
+                        base.bench(lambda: yaml_utils.dump_yaml(doc, devnull), number=number),
+                        baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Compare yaml_utils.read_yaml against parsing every file twice
+
+    python -m benchmarks.bench_read_yaml
+'''
+
+import ruamel.yaml
+
+from benchmarks import base
+from orquestaconvert.utils import yaml_utils
+
+
+def double_parse(yaml_filename):
+    # The original implementation: a round-trip parse followed by a second,
+    # independent PyYAML parse of the same file
+    with open(yaml_filename, 'r') as stream:
+        ruamel_data = ruamel.yaml.round_trip_load(stream)
+    with open(yaml_filename, 'r') as stream:
+        data = yaml_utils.yaml_to_obj(stream)
+    return (data, ruamel_data)
+
+
+def main():
+    files = base.fixture_files('mistral')
+
+    def run_double_parse():
+        for f in files:
+            double_parse(f)
+
+    def run_read_yaml():
+        for f in files:
+            yaml_utils.read_yaml(f)
+
+    print('{} files from tests/fixtures/mistral'.format(len(files)))
+    baseline = base.bench(run_double_parse, number=20)
+    base.report('double parse (ruamel + PyYAML)', baseline)
+    base.report('yaml_utils.read_yaml (single parse)', base.bench(run_read_yaml, number=20),
+                baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure how long each command line mode takes to start up
+
+Runs each mode of orquestaconvert/client.py and pack_client.py in a fresh
+interpreter with `python -X importtime`, and reports the best wall time,
+the total time spent importing modules, and the slowest top level imports.
+The set of modules the cheap modes are allowed to import is enforced by
+tests/unit/test_startup_imports.py.
+
+    python -m benchmarks.bench_startup
+'''
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import timeit
+
+from benchmarks import base
+
+PACK_ACTIONS_DIR = os.path.join(base.FIXTURES_DIR, 'pack', 'pristine_actions')
+
+MODES = [
+    ('client.py --help', 'orquestaconvert.client', ['--help']),
+    ('pack_client.py --help', 'orquestaconvert.pack_client', ['--help']),
+    ('pack_client.py --list-workflows', 'orquestaconvert.pack_client',
+     ['--list-workflows=mistral-v2', '--actions-dir={}'.format(PACK_ACTIONS_DIR)]),
+    ('client.py (convert one workflow)', 'orquestaconvert.client',
+     [os.path.join(base.FIXTURES_DIR, 'mistral', 'nasa_apod_twitter_post.yaml')]),
+]
+
+
+def parse_importtime(stderr):
+    # Lines look like: "import time:  self [us] | cumulative | imported package"
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return imports
+
+
+def run_mode(module, args, repeat=5):
+    best = None
+    imports = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        process = subprocess.Popen([sys.executable, '-X', 'importtime', '-m', module] + args,
+                                   cwd=base.ROOT_DIR,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        _, stderr = process.communicate()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+            imports = parse_importtime(stderr)
+    return best, imports
+
+
+def main():
+    for name, module, args in MODES:
+        wall, imports = run_mode(module, args)
+        print(name)
+        base.report('  wall time', wall)
+        base.report('  total import time', sum(i[0] for i in imports) / 1e6)
+        # top level imports are the ones that aren't indented
+        top_level = [i for i in imports if not i[2].startswith('  ')]
+        for _, cumulative_us, import_name in sorted(top_level, reverse=True, key=lambda i: i[1])[:5]:
+            base.report('    {}'.format(import_name.strip()), cumulative_us / 1e6)
+
+
+if __name__ == '__main__':
+    main()
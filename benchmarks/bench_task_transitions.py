@@ -0,0 +1,84 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measure converting the transitions of tasks with many transitions
+
+Generates tasks with big publish and publish-on-error blocks and 60
+conditional transitions, and converts their transitions converting each
+publish block once per task, and once per transition (as it used to be).
+The expression cache is turned off, so every run converts every expression.
+
+    python -m benchmarks.bench_task_transitions
+'''
+
+from __future__ import print_function
+
+from benchmarks import base
+from orquestaconvert import expressions
+from orquestaconvert.utils import yaml_utils
+from orquestaconvert.workflows import base as workflows_base
+
+
+class PerTransitionConverter(workflows_base.WorkflowConverter):
+    # Converts the publish block again for every transition
+
+    def convert_task_transition_simple(self, transitions, publish, orquesta_expr, expr_converter,
+                                       converted_publish=None, conversions=None):
+        return super(PerTransitionConverter, self).convert_task_transition_simple(
+            transitions, publish, orquesta_expr, expr_converter, conversions=conversions)
+
+    def convert_task_transition_expr(self, task_name, expression_list, publish, orquesta_expr,
+                                     converted_publish=None, conversions=None):
+        transitions = []
+        for expr, task_list in expression_list.items():
+            transitions.extend(super(PerTransitionConverter, self).convert_task_transition_expr(
+                task_name, {expr: task_list}, publish, orquesta_expr, conversions=conversions))
+        return transitions
+
+
+def generate_task(publish_count, transition_count):
+    lines = ['publish:']
+    lines.extend('  var_{0}: <% task(t).result.items[{0}] + $.offset_{0} %>'.format(i)
+                 for i in range(publish_count))
+    lines.append('publish-on-error:')
+    lines.extend('  err_{0}: "{{{{ task(t).result.errors[{0}] ~ _.prefix_{0} }}}}"'.format(i)
+                 for i in range(publish_count))
+    for name in ('on-success', 'on-error', 'on-complete'):
+        lines.append('{}:'.format(name))
+        lines.extend('  - {0}_{1}: <% $.state = {1} %>'.format(name, i)
+                     for i in range(transition_count // 3))
+        lines.append('  - {}_always'.format(name))
+    _, data = yaml_utils.load_yaml('\n'.join(lines))
+    return data
+
+
+def main():
+    expressions.EXPRESSION_CACHE.enabled = False
+    expr_converter = workflows_base.WorkflowConverter().expr_type_converter('jinja')
+    for publish_count, transition_count in [(5, 60), (20, 60), (20, 150)]:
+        task = generate_task(publish_count, transition_count)
+
+        def _convert(converter):
+            return converter.convert_task_transitions('task_name', task, expr_converter, set())
+
+        per_transition = PerTransitionConverter()
+        once = workflows_base.WorkflowConverter()
+        assert _convert(per_transition) == _convert(once)
+
+        print('{} published variables, {} transitions'.format(publish_count, transition_count))
+        baseline = base.bench(lambda: _convert(per_transition), number=10)
+        base.report('  converted per transition', baseline)
+        base.report('  converted once per task', base.bench(lambda: _convert(once), number=10), baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Compare the lexer based YAQL converter against the regex based one
+
+Collects every YAQL expression body in the Mistral fixtures and converts
+all of them with YaqlExpressionConverter, and with
+YaqlTokenExpressionConverter, both with an empty plan cache (so every body is
+tokenized) and with a warm one. Then does the same for the strings the
+bodies came from, delimiters and all, through
+ExpressionConverter.convert_string() with each converter in CONVERTERS, the
+way a workflow conversion gets to them.
+
+    python -m benchmarks.bench_yaql_tokens
+'''
+
+from __future__ import print_function
+
+import re
+import six
+
+from benchmarks import base
+from orquestaconvert import expressions
+from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.expressions import yaql_tokens
+from orquestaconvert.utils import yaml_utils
+
+YAQL_BODY_REGEX = re.compile(r'<%(.*?)%>')
+
+
+def collect_bodies(obj, bodies, wrapped):
+    if isinstance(obj, dict):
+        for key, value in six.iteritems(obj):
+            collect_bodies(key, bodies, wrapped)
+            collect_bodies(value, bodies, wrapped)
+    elif isinstance(obj, list):
+        for value in obj:
+            collect_bodies(value, bodies, wrapped)
+    elif isinstance(obj, six.string_types):
+        matches = list(YAQL_BODY_REGEX.finditer(obj))
+        bodies.extend(m.group(1).strip() for m in matches)
+        if matches:
+            wrapped.append(obj)
+
+
+def main():
+    bodies = []
+    wrapped = []
+    for filename in base.fixture_files('mistral'):
+        collect_bodies(yaml_utils.read_yaml(filename)[0], bodies, wrapped)
+    print('{} YAQL expressions ({} unique)'.format(len(bodies), len(set(bodies))))
+
+    def _regex():
+        for body in bodies:
+            yql.YaqlExpressionConverter.convert_string(body, item_vars=['i'])
+
+    def _tokens():
+        for body in bodies:
+            yaql_tokens.YaqlTokenExpressionConverter.convert_string(body, item_vars=['i'])
+
+    def _tokens_cold():
+        yaql_tokens.PLAN_CACHE.clear()
+        _tokens()
+
+    baseline = base.bench(_regex, number=50)
+    base.report('regex converter', baseline)
+    base.report('lexer converter, cold plan cache', base.bench(_tokens_cold, number=50), baseline)
+    _tokens()
+    base.report('lexer converter, warm plan cache', base.bench(_tokens, number=50), baseline)
+
+    print('{} strings with YAQL expressions ({} unique)'.format(len(wrapped), len(set(wrapped))))
+    # time the converters, not the lookups in the expression cache
+    expressions.EXPRESSION_CACHE.enabled = False
+
+    def _wrapped():
+        for expr in wrapped:
+            expressions.ExpressionConverter.convert_string(expr, item_vars=['i'])
+
+    def _wrapped_tokens_cold():
+        yaql_tokens.PLAN_CACHE.clear()
+        _wrapped()
+
+    baseline = base.bench(_wrapped, number=50)
+    base.report('wrapped, regex converter', baseline)
+    expressions.CONVERTERS['yaql'] = yaql_tokens.YaqlTokenExpressionConverter
+    try:
+        base.report('wrapped, lexer converter, cold plan cache', base.bench(_wrapped_tokens_cold, number=50),
+                    baseline)
+        _wrapped()
+        base.report('wrapped, lexer converter, warm plan cache', base.bench(_wrapped, number=50), baseline)
+    finally:
+        expressions.CONVERTERS['yaql'] = yql.YaqlExpressionConverter
+
+
+if __name__ == '__main__':
+    main()
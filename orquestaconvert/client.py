@@ -15,16 +15,24 @@
 import argparse
 import sys
 
-from orquesta.specs.native.v1 import models as native_v1_models
-from orquestaconvert.specs.mistral.v2 import workflows as mistral_workflow
-from orquestaconvert.utils import yaml_utils
-from orquestaconvert.workflows import base as workflows_base
+from orquestaconvert.utils import profile_utils
+
+
+def _session_class():
+    # The session pulls in orquesta, the Mistral specs and the converters,
+    # which take a while to import. Importing it only when we're about to
+    # convert or validate something keeps --help (and pack_client.py
+    # --list-workflows, which imports this module) fast.
+    from orquestaconvert import session as conversion_session
+    return conversion_session.ConversionSession
 
 
 class Client(object):
 
-    def parser(self):
-        parser = argparse.ArgumentParser(description='Convert Mistral workflows to Orquesta')
+    def options_parser(self):
+        # the conversion options, without the filename, so they can also be
+        # parsed once for a whole pack by PackClient
+        parser = argparse.ArgumentParser(add_help=False)
         parser.add_argument('-v', '--verbose', default=False, action='store_true',
                             help='Print success message when validating, otherwise ignored')
         parser.add_argument('-e', '--expressions',
@@ -36,60 +44,62 @@ class Client(object):
                             help='Include unsupported attributes in the generated outputs')
         parser.add_argument('--validate', default=False, action='store_true',
                             help='Validate the Orquesta workflow')
+        parser.add_argument('--task-jobs', type=int, default=1, metavar='N',
+                            help=('Convert the tasks of very big workflows (1000 tasks or more) '
+                                  'using N worker processes'))
+        return parser
+
+    def parser(self):
+        parser = argparse.ArgumentParser(description='Convert Mistral workflows to Orquesta',
+                                         parents=[self.options_parser()])
+        parser.add_argument('--profile-phases', default=False, action='store_true',
+                            help='Print how long each phase of the conversion took to stderr')
+        parser.add_argument('--profile-format', default='table', choices=profile_utils.FORMATS,
+                            help='Format of the --profile-phases output')
         parser.add_argument('filename', metavar='FILENAME', nargs=1,
                             help='Path to the Mistral Workflow YAML file to convert')
         return parser
 
-    def validate_workflow_spec(self, wf_spec):
-        result = wf_spec.inspect_syntax()
-        if result:
-            raise ValueError(result)
+    def session(self, argv):
+        # parse the conversion options once, and return a session that
+        # converts any number of files with them
+        args = self.options_parser().parse_args(argv)
+        return _session_class().from_args(args)
 
-    def convert_file(self, filename, expr_type=None):
-        # parse the Mistral workflow from file
-        mistral_wf_data, mistral_wf_data_ruamel = yaml_utils.read_yaml(filename)
+    def _session(self, expr_type=None):
+        return _session_class()(expr_type=expr_type,
+                                force=self.args.force,
+                                verbose=self.args.verbose,
+                                task_jobs=self.args.task_jobs)
 
-        # validate the Mistral workflow before we start
-        mistral_wf_spec = mistral_workflow.instantiate(mistral_wf_data)
-        self.validate_workflow_spec(mistral_wf_spec)
+    def validate_workflow_spec(self, wf_spec):
+        _session_class()().validate_workflow_spec(wf_spec)
 
-        # convert Mistral -> Orquesta
-        mistral_wf = mistral_wf_data_ruamel[mistral_wf_spec.name]
-        workflow_converter = workflows_base.WorkflowConverter()
-        orquesta_wf_data_ruamel = workflow_converter.convert(mistral_wf, expr_type,
-                                                             force=self.args.force)
-        orquesta_wf_data_str = yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
-        orquesta_wf_data = yaml_utils.yaml_to_obj(orquesta_wf_data_str)
+    def convert_file_ruamel(self, filename, expr_type=None):
+        return self._session(expr_type).convert_file_ruamel(filename)
 
-        # validate we've generated a proper Orquesta workflow
-        orquesta_wf_spec = native_v1_models.instantiate(orquesta_wf_data)
-        if not self.args.force:
-            self.validate_workflow_spec(orquesta_wf_spec)
+    def convert_file(self, filename, expr_type=None):
+        return self._session(expr_type).convert_file(filename)
 
-        # write out the new Orquesta workflow to a YAML string
-        return yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+    def write_converted_file(self, filename, output_stream, expr_type=None):
+        self._session(expr_type).write_converted_file(filename, output_stream)
 
     def validate_file(self, filename):
-        # parse the Orquesta workflow from file
-        orquesta_wf_data, orquesta_wf_data_ruamel = yaml_utils.read_yaml(filename)
-
-        # validate the Orquesta workflow
-        orquesta_wf_spec = native_v1_models.instantiate(orquesta_wf_data)
-        self.validate_workflow_spec(orquesta_wf_spec)
-
-        if self.args.verbose:
-            print("Successfully validated workflow from {}".format(filename))
+        self._session().validate_file(filename)
 
     def run(self, argv, output_stream):
         # Write the file to the output_stream
         self.args = self.parser().parse_args(argv)
-        expr_type = self.args.expressions
+        session = _session_class().from_args(self.args)
+        profile = profile_utils.PhaseProfile() if self.args.profile_phases else None
         if self.args.validate:
             for f in self.args.filename:
-                self.validate_file(f)
+                session.validate_file(f)
         else:
             for f in self.args.filename:
-                output_stream.write(self.convert_file(f, expr_type))
+                session.write_converted_file(f, output_stream, profile=profile)
+            if profile:
+                profile.write(sys.stderr, self.args.profile_format)
         return 0
 
 
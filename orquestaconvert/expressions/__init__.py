@@ -10,6 +10,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import re
 import ruamel.yaml.comments
 import six
 import warnings
@@ -18,18 +20,274 @@ import orquesta.expressions.base
 
 from orquestaconvert.expressions import jinja
 from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.utils import cache_utils
 from orquestaconvert.utils import type_utils
 
 
+# The same expressions that the orquesta Jinja and YAQL evaluators look for
+# in has_expressions(), used when a string only has one kind of delimiter
+JINJA_EXPRESSION_REGEX = re.compile(r'{{.*?}}|{%.*?%}')
+YAQL_EXPRESSION_REGEX = re.compile(r'<%.*?%>')
+EXPRESSION_REGEXES = {
+    'jinja': JINJA_EXPRESSION_REGEX,
+    'yaql': YAQL_EXPRESSION_REGEX,
+}
+
+CONVERTERS = {
+    'jinja': jinja.JinjaExpressionConverter,
+    'yaql': yql.YaqlExpressionConverter,
+}
+
+# Returned by ExpressionConverter._delimiter_type() when a string has both
+# Jinja and YAQL delimiters in it
+MIXED = 'mixed'
+
+# The same expressions show up over and over again in workflows, so the
+# results of converting expression strings are cached. Use
+# EXPRESSION_CACHE.clear() to empty it, set EXPRESSION_CACHE.enabled = False
+# to turn it off, and EXPRESSION_CACHE.stats() to see how well it's doing.
+EXPRESSION_CACHE = cache_utils.LRUCache()
+
+
+CONTAINER_TYPES = type_utils.dict_types + (list,)
+
+# How convert_tree() builds the converted dicts and lists:
+# - COPY always builds new CommentedMaps and lists, this is the default
+# - COPY_ON_WRITE only builds new containers where something in them changed,
+#   and returns the other ones as they are, so they are shared with the input
+# - IN_PLACE converts the containers of the input themselves, for trees that
+#   the caller owns and doesn't need anymore
+# Only COPY gives the same YAML when the result is written out: the
+# containers the other modes return from the input still carry its ruamel
+# formatting (flow style, comments, anchors), so they are for results that
+# are only inspected, not emitted.
+COPY = 'copy'
+COPY_ON_WRITE = 'copy-on-write'
+IN_PLACE = 'in-place'
+COPY_MODES = [COPY, COPY_ON_WRITE, IN_PLACE]
+
+
+class _ConversionFrame(object):
+    # A dict or list that convert_tree() is in the middle of converting
+    __slots__ = ('container', 'items', 'converted', 'changed', 'key', 'value')
+
+    def __init__(self, container):
+        self.container = container
+        if isinstance(container, list):
+            self.items = enumerate(container)
+        else:
+            self.items = six.iteritems(container)
+        # the converted (key, value) pairs so far
+        self.converted = []
+        self.changed = False
+        # the key and value of the child container being converted
+        self.key = None
+        self.value = None
+
+
+def _scalar_changed(old, new):
+    return new is not old and (type(new) is not type(old) or new != old)
+
+
+def _build_container(frame, copy_mode):
+    container = frame.container
+    if copy_mode == COPY_ON_WRITE and not frame.changed:
+        return container
+
+    if isinstance(container, list):
+        values = [value for _, value in frame.converted]
+        if copy_mode == IN_PLACE:
+            container[:] = values
+            return container
+        return values
+
+    if copy_mode == IN_PLACE:
+        if any(_scalar_changed(key, new_key) for key, (new_key, _) in zip(container, frame.converted)):
+            # keep the order of the keys
+            container.clear()
+        for key, value in frame.converted:
+            container[key] = value
+        return container
+    converted = ruamel.yaml.comments.CommentedMap()
+    for key, value in frame.converted:
+        converted[key] = value
+    return converted
+
+
+def convert_tree(converter, expr, convert_keys, copy_mode=COPY, **kwargs):
+    '''Convert every scalar in a tree of dicts and lists
+
+    Scalars are converted with converter.convert_scalar(), and so are the
+    keys of dicts if convert_keys is set. The tree is walked with a stack
+    instead of recursion, so deeply nested documents don't run into the
+    recursion limit. See COPY_MODES for copy_mode.
+    '''
+    if copy_mode not in COPY_MODES:
+        raise ValueError("Unknown copy mode: {}".format(copy_mode))
+    if not isinstance(expr, CONTAINER_TYPES):
+        return converter.convert_scalar(expr, **kwargs)
+
+    stack = [_ConversionFrame(expr)]
+    while True:
+        frame = stack[-1]
+        for key, value in frame.items:
+            if convert_keys and not isinstance(frame.container, list):
+                new_key = converter.convert_scalar(key, **kwargs)
+                frame.changed = frame.changed or _scalar_changed(key, new_key)
+            else:
+                new_key = key
+            if isinstance(value, CONTAINER_TYPES):
+                # convert the child first, and come back to this one after
+                frame.key = new_key
+                frame.value = value
+                stack.append(_ConversionFrame(value))
+                break
+            new_value = converter.convert_scalar(value, **kwargs)
+            frame.changed = frame.changed or _scalar_changed(value, new_value)
+            frame.converted.append((new_key, new_value))
+        else:
+            stack.pop()
+            converted = _build_container(frame, copy_mode)
+            if not stack:
+                return converted
+            parent = stack[-1]
+            parent.changed = parent.changed or converted is not parent.value
+            parent.converted.append((parent.key, converted))
+
+
+def iter_expression_strings(tree, keys=True):
+    '''Yield every string in a tree of dicts and lists that may be an expression
+
+    That is every value (and key, if keys is set) with Jinja or YAQL
+    delimiters in it, in document order, duplicates included.
+    '''
+    stack = [tree]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, type_utils.dict_types):
+            # reversed, so they come off the stack in order
+            for key, value in reversed(list(six.iteritems(obj))):
+                stack.append(value)
+                if keys:
+                    stack.append(key)
+        elif isinstance(obj, list):
+            stack.extend(reversed(obj))
+        elif isinstance(obj, six.string_types) and ExpressionConverter._delimiter_type(obj):
+            yield obj
+
+
+def cached_convert_string(func):
+    '''Cache the results of a convert_string() classmethod in EXPRESSION_CACHE
+
+    Apply this below @classmethod. Results are keyed on the converter class,
+    the converters in CONVERTERS that it hands the expressions to, the
+    expression and its type (a ruamel scalar string that isn't an
+    expression is returned as is, so the type matters), and the item_vars.
+    Calls with any other keyword arguments aren't cached.
+
+    The decorated method also takes a conversions keyword argument, a dict
+    of results that were converted ahead of time, see convert_batch(). A
+    result in there is returned without looking at the cache.
+    '''
+    @functools.wraps(func)
+    def _cached(cls, expr, **kwargs):
+        conversions = kwargs.pop('conversions', None)
+        if any(k != 'item_vars' for k in kwargs) or not (conversions or EXPRESSION_CACHE.enabled):
+            return func(cls, expr, **kwargs)
+        key = expression_cache_key(cls, expr, kwargs.get('item_vars'))
+        if conversions and key in conversions:
+            return conversions[key]
+        if not EXPRESSION_CACHE.enabled:
+            return func(cls, expr, **kwargs)
+        return EXPRESSION_CACHE.get_or_compute(key, lambda: func(cls, expr, **kwargs))
+    return _cached
+
+
+def expression_cache_key(cls, expr, item_vars=None):
+    # CONVERTERS can be changed at any time (to use the lexer based converters), and
+    # results from before that mustn't be returned afterwards
+    converters = (CONVERTERS.get('jinja'), CONVERTERS.get('yaql'))
+    return (cls, converters, type(expr), expr, frozenset(item_vars or ()))
+
+
+def convert_batch(entries):
+    '''Convert a batch of (converter, expression, item_vars) at once
+
+    Every distinct entry is converted exactly once, however many times it
+    shows up. Returns a dict of the results, keyed the same way as
+    EXPRESSION_CACHE, which is meant to be passed as the conversions
+    argument of the conversions that come after, so they get the results
+    from it instead of converting those expressions again. Unlike the
+    cache, it holds every result, however many there are.
+
+    The converters are classes with a convert_string() decorated with
+    cached_convert_string(), and the entries have to match the calls that
+    look them up, see WorkflowConverter.expression_keys().
+    '''
+    conversions = {}
+    for converter, expr, item_vars in entries:
+        key = expression_cache_key(converter, expr, item_vars)
+        if key not in conversions:
+            conversions[key] = converter.convert_string(expr, item_vars=list(item_vars or ()))
+    return conversions
+
+
+class ParsedExpression(object):
+    '''An expression string that has been picked apart once
+
+    Converting an expression usually means working out which language it's
+    in, unwrapping it, converting the body, and wrapping it back up, and
+    each of those used to run its own regex over the same string. Get one
+    of these from ExpressionConverter.parse() and work on it instead.
+
+    - text: the original string
+    - dialect: 'jinja', 'yaql', or None if the string isn't an expression
+    - converter: the expression converter class for the dialect, or None
+    - spans: the (start, end) of each delimited expression in the text
+    - body: the text with the delimiters removed, the same thing that
+      unwrap_expression() returns
+    '''
+    __slots__ = ('text', 'dialect', 'converter', 'spans', 'body')
+
+    def __init__(self, text, dialect=None, converter=None, spans=None, body=None):
+        self.text = text
+        self.dialect = dialect
+        self.converter = converter
+        self.spans = spans or []
+        self.body = text if body is None else body
+
+    def __repr__(self):
+        return 'ParsedExpression({!r}, dialect={!r}, spans={!r})'.format(self.text,
+                                                                        self.dialect,
+                                                                        self.spans)
+
+    def convert_body(self, **kwargs):
+        '''Convert the unwrapped body, or return the text if it isn't an expression'''
+        if not self.converter:
+            return self.text
+        return self.converter.convert_string(self.body, **kwargs)
+
+    def wrap(self, body):
+        '''Wrap a new body in this expression's delimiters'''
+        return self.converter.wrap_expression(body)
+
+    def convert(self, **kwargs):
+        '''Convert the body and wrap it back up'''
+        if not self.converter:
+            return self.text
+        return self.wrap(self.convert_body(**kwargs))
+
+
 class ExpressionConverter(object):
 
     @classmethod
     def convert(cls, expr, **kwargs):
-        if (isinstance(expr, type_utils.dict_types)):
-            return cls.convert_dict(expr, **kwargs)
-        elif isinstance(expr, list):
-            return cls.convert_list(expr, **kwargs)
-        elif isinstance(expr, six.string_types):
+        # copy_mode is one of COPY_MODES
+        return convert_tree(cls, expr, True, **kwargs)
+
+    @classmethod
+    def convert_scalar(cls, expr, **kwargs):
+        if isinstance(expr, six.string_types):
             return cls.convert_string(expr, **kwargs)
         elif isinstance(expr, bool):
             return expr
@@ -58,30 +316,111 @@ class ExpressionConverter(object):
             return expr
 
     @classmethod
-    def expression_type(cls, expr):
+    def _delimiter_type(cls, text):
+        # Most strings we look at (keys, literal inputs, ...) aren't
+        # expressions at all, so check for the delimiters first, which is
+        # much cheaper than asking every orquesta evaluator. Returns the only
+        # expression language whose delimiters show up in the string, MIXED
+        # if both of them do, or None if neither does.
+        jinja_delimiters = '{{' in text or '{%' in text
+        yaql_delimiters = '<%' in text
+        if jinja_delimiters and yaql_delimiters:
+            return MIXED
+        elif jinja_delimiters:
+            return 'jinja'
+        elif yaql_delimiters:
+            return 'yaql'
+        return None
+
+    @classmethod
+    def _evaluator_type(cls, text):
         for name, evaluator in six.iteritems(orquesta.expressions.base.get_evaluators()):
-            if evaluator.has_expressions(str(expr)):
+            if evaluator.has_expressions(text):
                 return name
         return None
 
     @classmethod
-    def get_converter(cls, expr):
-        expr_type = cls.expression_type(expr)
-        if expr_type == 'jinja':
-            return jinja.JinjaExpressionConverter
-        elif expr_type == 'yaql':
-            return yql.YaqlExpressionConverter
+    def expression_type(cls, expr):
+        text = str(expr)
+        delimiter_type = cls._delimiter_type(text)
+        if delimiter_type == MIXED:
+            # Both kinds of delimiters, let the evaluators decide
+            return cls._evaluator_type(text)
+        elif delimiter_type and EXPRESSION_REGEXES[delimiter_type].search(text):
+            return delimiter_type
         return None
 
+    @classmethod
+    def get_converter(cls, expr):
+        return CONVERTERS.get(cls.expression_type(expr))
+
+    @classmethod
+    def parse(cls, expr):
+        '''Pick apart an expression string, see ParsedExpression'''
+        text = str(expr)
+        delimiter_type = cls._delimiter_type(text)
+        if delimiter_type == MIXED:
+            delimiter_type = cls._evaluator_type(text)
+            if not delimiter_type:
+                return ParsedExpression(expr)
+        elif not delimiter_type:
+            return ParsedExpression(expr)
+
+        converter = CONVERTERS[delimiter_type]
+        matches = list(converter.unwrap_pattern.finditer(text))
+        # Anything that unwrap_expression() would unwrap is an expression,
+        # so only strings like "{% if ... %}" that have nothing to unwrap
+        # need the full expression regex to tell what they are
+        if not matches:
+            if not EXPRESSION_REGEXES[delimiter_type].search(text):
+                return ParsedExpression(expr)
+            return ParsedExpression(expr, delimiter_type, converter)
+
+        # This builds the same string as unwrap_expression() does, without
+        # running the regex again
+        spans = []
+        body = []
+        position = 0
+        for match in matches:
+            body.append(text[position:match.start()])
+            body.append(converter._replace_unwrap(match))
+            spans.append(match.span())
+            position = match.end()
+        body.append(text[position:])
+        return ParsedExpression(expr, delimiter_type, converter, spans, ''.join(body))
+
+    @classmethod
+    def convert_many(cls, strings, dialect=None, item_vars=None):
+        '''Convert a batch of strings, returns a dict of string -> converted string
+
+        Every distinct string is converted exactly once, however many times
+        it shows up in strings. With no dialect, each string is converted
+        the same way convert_string() does it. With a dialect ('jinja' or
+        'yaql'), every string is converted as an expression in that
+        language, without the delimiter checks. To hand the results to a
+        workflow conversion, use convert_batch() instead.
+        '''
+        kwargs = {'item_vars': list(item_vars)} if item_vars else {}
+        if dialect is None:
+            convert_string = cls.convert_string
+        elif dialect in CONVERTERS:
+            convert_string = CONVERTERS[dialect].convert_string
+        else:
+            raise TypeError("Unknown expression type: {}".format(dialect))
+
+        converted = {}
+        for expr in strings:
+            if expr not in converted:
+                converted[expr] = convert_string(expr, **kwargs)
+        return converted
+
     @classmethod
     def unwrap_expression(cls, expr):
-        converter = cls.get_converter(expr)
-        if converter:
-            return converter.unwrap_expression(expr)
-        # this isn't a Jinja or YAQL expression, so return the raw string
-        return expr
+        # if this isn't a Jinja or YAQL expression, this is the raw string
+        return cls.parse(expr).body
 
     @classmethod
+    @cached_convert_string
     def convert_string(cls, expr, **kwargs):
         # - task('xxx').result -> result()
         #    if 'xxx' != current task name, error
@@ -97,11 +436,8 @@ class ExpressionConverter(object):
 
     @classmethod
     def convert_dict(cls, expr_dict, **kwargs):
-        converted = ruamel.yaml.comments.CommentedMap()
-        for k, expr in six.iteritems(expr_dict):
-            converted[cls.convert(k, **kwargs)] = cls.convert(expr, **kwargs)
-        return converted
+        return convert_tree(cls, expr_dict, True, **kwargs)
 
     @classmethod
     def convert_list(cls, expr_list, **kwargs):
-        return [cls.convert(expr, **kwargs) for expr in expr_list]
+        return convert_tree(cls, expr_list, True, **kwargs)
@@ -31,6 +31,18 @@ ST2_EXECUTION_ID_PATTERN = re.compile(ST2_EXECUTION_ID_REGEX)
 ST2_API_URL_REGEX = r"\benv\(\).st2_action_api_url\b"
 ST2_API_URL_PATTERN = re.compile(ST2_API_URL_REGEX)
 
+# The conversions done by convert_string(), in the order they used to be
+# applied, with the characters a match can start with. Each one is handled by
+# the _replace_<name>() classmethod, except 'context_vars', whose regex is
+# specific to each expression language.
+SCANNER_CONVERSIONS = [
+    ('context_vars', None, None),
+    ('task_result', TASK_RESULT_PATTERN, 't'),
+    ('st2kv', ST2KV_PATTERN, 's'),
+    ('st2_execution_id', ST2_EXECUTION_ID_PATTERN, 'e'),
+    ('st2_api_url', ST2_API_URL_PATTERN, 'e'),
+]
+
 
 @six.add_metaclass(abc.ABCMeta)
 class AbstractBaseExpressionConverter(object):
@@ -78,19 +90,90 @@ class AbstractBaseExpressionConverter(object):
 
 class BaseExpressionConverter(AbstractBaseExpressionConverter):
 
+    # The compiled regex that unwrap_expression() uses, with the expression
+    # body in group 2. Subclasses must set this.
+    unwrap_pattern = None
+
+    # The compiled regex matching context variables in this expression
+    # language, with the variable name in group 2, and the characters those
+    # matches start with. Subclasses must set these.
+    context_vars_pattern = None
+    context_vars_start = None
+
     @classmethod
     def _replace_unwrap(cls, match):
         return match.group(2).strip()
 
+    @classmethod
+    def _get_scanner(cls):
+        # Combine the regexes of all of the conversions into one alternation,
+        # with a named group per conversion, so convert_string() only has to
+        # scan the expression once. Compiled once per converter class.
+        scanner = cls.__dict__.get('_scanner')
+        if scanner is None:
+            if cls.context_vars_pattern is None:
+                raise NotImplementedError()
+            patterns = dict((name, pattern) for name, pattern, _ in SCANNER_CONVERSIONS)
+            patterns['context_vars'] = cls.context_vars_pattern
+            start = cls.context_vars_start + ''.join(s for _, _, s in SCANNER_CONVERSIONS if s)
+            # The lookahead lets the regex engine skip over characters that
+            # can't start any of the conversions without trying each of them
+            regex = '(?=[{}])(?:{})'.format(
+                re.escape(''.join(sorted(set(start)))),
+                '|'.join('(?P<{}>{})'.format(name, patterns[name].pattern)
+                         for name, _, _ in SCANNER_CONVERSIONS))
+            handlers = dict((name, getattr(cls, '_replace_' + name))
+                            for name, _, _ in SCANNER_CONVERSIONS if name != 'context_vars')
+            scanner = (re.compile(regex), patterns, handlers)
+            cls._scanner = scanner
+        return scanner
+
     @classmethod
     def convert_string(cls, expr, **kwargs):
-        # others?
-        expr = cls.convert_context_vars(expr, **kwargs)
-        expr = cls.convert_task_result(expr)
-        expr = cls.convert_st2kv(expr)
-        expr = cls.convert_st2_execution_id(expr)
-        expr = cls.convert_st2_api_url(expr)
-        return expr
+        # Does the same as running convert_context_vars(), convert_task_result(),
+        # convert_st2kv(), convert_st2_execution_id() and convert_st2_api_url()
+        # one after the other, but in a single pass over the expression.
+        #
+        # The one difference is that a construct that only appears after an
+        # earlier conversion rewrote part of the string isn't converted again,
+        # for instance the 'st2kv.x' in '_.st2kv.x' (which used to become
+        # "ctx().st2kv('x')"), or a construct that contains another one, like
+        # '_.x' in 'st2kv._.x'. Neither of those is a meaningful expression.
+        scanner, patterns, handlers = cls._get_scanner()
+        _replace_vars = cls._get_replace_vars(**kwargs)
+
+        def _replace(match):
+            name = match.lastgroup
+            # Match the conversion's own regex against just the matched text,
+            # so the _replace_*() handlers get the groups they expect
+            sub_match = patterns[name].match(match.group(name))
+            if name == 'context_vars':
+                return _replace_vars(sub_match)
+            return handlers[name](sub_match)
+
+        return scanner.sub(_replace, expr)
+
+    @classmethod
+    def _apply_plan(cls, expr, plan, **kwargs):
+        # Build the converted expression from a list of (start, end,
+        # context_var, replacement), as made by the converters that work from
+        # the tokens of an expression: the text between start and end is
+        # replaced with the replacement, or with the item() or ctx() accessor
+        # for context_var when it's set.
+        item_vars = kwargs.get('item_vars') or []
+        converted = []
+        position = 0
+        for start, end, context_var, replacement in plan:
+            converted.append(expr[position:start])
+            if context_var is None:
+                converted.append(replacement)
+            elif context_var in item_vars:
+                converted.append("item(" + context_var + ")")
+            else:
+                converted.append("ctx()." + context_var)
+            position = end
+        converted.append(expr[position:])
+        return ''.join(converted)
 
     @classmethod
     def _replace_item_vars(cls, match):
@@ -25,6 +25,10 @@ CONTEXT_VARS_PATTERN = re.compile(CONTEXT_VARS_REGEX)
 
 class JinjaExpressionConverter(expr_base.BaseExpressionConverter):
 
+    unwrap_pattern = UNWRAP_PATTERN
+    context_vars_pattern = CONTEXT_VARS_PATTERN
+    context_vars_start = '_'
+
     @classmethod
     def wrap_expression(cls, expr):
         return "{{ " + expr + " }}"
@@ -0,0 +1,177 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import jinja2
+
+from orquestaconvert.expressions import jinja
+from orquestaconvert.utils import cache_utils
+
+
+# The rewrite plan for each Jinja expression that has been tokenized, see
+# JinjaTokenExpressionConverter.get_plan()
+PLAN_CACHE = cache_utils.LRUCache()
+
+# Only used for its lexer. Without keep_trailing_newline the lexer drops a
+# trailing newline, and the tokens wouldn't add up to the expression.
+JINJA_ENV = jinja2.Environment(keep_trailing_newline=True)
+
+WORD_REGEX = re.compile(r'\w+$')
+TASK_NAME_REGEX = re.compile(r'["\']?\w+["\']?$')
+
+ST2_ENV_ATTRIBUTES = {
+    'st2_execution_id': 'ctx().st2.action_execution_id',
+    'st2_action_api_url': 'ctx().st2.api_url',
+}
+
+# Delimiters that mean an expression has to be tokenized as a template, and
+# not as the inside of a {{ }} block
+BLOCK_DELIMITERS = ('{{', '{%', '{#')
+
+
+class JinjaTokenExpressionConverter(jinja.JinjaExpressionConverter):
+    '''Converts Jinja expressions using the Jinja lexer instead of regexes
+
+    JinjaExpressionConverter rewrites '_.x', 'task(x).result', 'st2kv.x',
+    'env().st2_execution_id' and 'env().st2_action_api_url' with regexes,
+    which also rewrite them inside of string literals ("'_.x'") and the
+    plain text around {{ }} blocks, and happily match the middle of longer
+    names ('mytask(x).result') or method calls ('st2kv.system.x.items()').
+
+    This converter runs each expression through the jinja2 lexer once,
+    looks for those constructs in the name and operator tokens, and splices
+    the replacements into the original text, so everything else (spacing,
+    quoting, filters) is left alone.
+
+    The replacements are cached in PLAN_CACHE, keyed on the expression, as
+    in yaql_tokens.YaqlTokenExpressionConverter. Expressions that Jinja can't
+    tokenize are converted by JinjaExpressionConverter instead.
+
+    This converter isn't used by default. To use it for every Jinja
+    expression:
+
+        from orquestaconvert import expressions
+        from orquestaconvert.expressions import jinja_tokens
+
+        expressions.CONVERTERS['jinja'] = jinja_tokens.JinjaTokenExpressionConverter
+    '''
+
+    @classmethod
+    def tokenize(cls, expr):
+        # Returns a list of (start, type, value), where value is the text of
+        # the token, or None if Jinja can't tokenize expr
+        #
+        # Unwrapped expressions are tokenized as if they were inside of a
+        # {{ }} block, anything else as a template
+        state = None if any(d in expr for d in BLOCK_DELIMITERS) else 'variable'
+        try:
+            tokens = []
+            position = 0
+            for _, token_type, value in JINJA_ENV.lexer.tokeniter(expr, None, state=state):
+                tokens.append((position, token_type, value))
+                position += len(value)
+        except jinja2.exceptions.TemplateSyntaxError:
+            return None
+        # The lexer normalizes newlines, in which case the positions are off
+        if position != len(expr) or ''.join(t[2] for t in tokens) != expr:
+            return None
+        return tokens
+
+    @classmethod
+    def get_plan(cls, expr):
+        '''Returns the list of (start, end, context_var, replacement) for expr
+
+        When context_var is set, the replacement depends on whether the
+        variable is one of the item_vars. Returns None if Jinja can't
+        tokenize expr.
+        '''
+        return PLAN_CACHE.get_or_compute(expr, lambda: cls._build_plan(expr))
+
+    @classmethod
+    def _build_plan(cls, expr):
+        tokens = cls.tokenize(expr)
+        if tokens is None:
+            return None
+
+        def _token(index, types=None, value=None, regex=None):
+            # tokens[index] if it matches, whitespace is a token too, so
+            # consecutive tokens have nothing between them
+            if index >= len(tokens):
+                return None
+            token = tokens[index]
+            if types is not None and token[1] not in types:
+                return None
+            if value is not None and token[2] != value:
+                return None
+            if regex is not None and not regex.match(token[2]):
+                return None
+            return token
+
+        def _end(index):
+            return tokens[index][0] + len(tokens[index][2])
+
+        plan = []
+        index = 0
+        while index < len(tokens):
+            start, token_type, value = tokens[index]
+            index += 1
+            if token_type != 'name':
+                continue
+
+            if value == '_' and _token(index, ['operator'], '.') and _token(index + 1, regex=WORD_REGEX):
+                # _.name -> ctx().name or item(name)
+                plan.append((start, _end(index + 1), tokens[index + 1][2], None))
+                index += 2
+
+            elif value == 'task' and _token(index, ['operator'], '('):
+                # task(name).result -> result()
+                if all([_token(index + 1, ['name', 'string'], regex=TASK_NAME_REGEX),
+                        _token(index + 2, ['operator'], ')'),
+                        _token(index + 3, ['operator'], '.'),
+                        _token(index + 4, ['name'], 'result')]):
+                    plan.append((start, _end(index + 4), None, 'result()'))
+                    index += 5
+
+            elif value == 'st2kv':
+                # st2kv.a.b.c -> st2kv('a.b.c'), stopping at a method call
+                names = []
+                end = index
+                while _token(end, ['operator'], '.') and _token(end + 1, ['name']):
+                    if _token(end + 2, ['operator'], '('):
+                        break
+                    names.append(tokens[end + 1][2])
+                    end += 2
+                if names:
+                    plan.append((start, _end(end - 1), None, "st2kv('{}')".format('.'.join(names))))
+                    index = end
+
+            elif value == 'env':
+                # env().st2_execution_id -> ctx().st2.action_execution_id
+                # env().st2_action_api_url -> ctx().st2.api_url
+                if all([_token(index, ['operator'], '('),
+                        _token(index + 1, ['operator'], ')'),
+                        _token(index + 2, ['operator'], '.'),
+                        _token(index + 3, ['name'])]):
+                    attribute = tokens[index + 3][2]
+                    if attribute in ST2_ENV_ATTRIBUTES:
+                        plan.append((start, _end(index + 3), None, ST2_ENV_ATTRIBUTES[attribute]))
+                        index += 4
+
+        return plan
+
+    @classmethod
+    def convert_string(cls, expr, **kwargs):
+        plan = cls.get_plan(expr)
+        if plan is None:
+            return super(JinjaTokenExpressionConverter, cls).convert_string(expr, **kwargs)
+        return cls._apply_plan(expr, plan, **kwargs)
@@ -14,11 +14,8 @@ import re
 import six
 import warnings
 
-import ruamel.yaml.comments
-
 from orquestaconvert import expressions
 from orquestaconvert.expressions import base as expr_base
-from orquestaconvert.utils import type_utils
 
 
 # These regexes match Jinja and YAQL expressions, respectively. They are used
@@ -40,6 +37,12 @@ from orquestaconvert.utils import type_utils
 JINJA_EXPR_RGX = re.compile(r'(?P<expr>(?:{{)\s*.+?\s*(?:}}))')
 YAQL_EXPR_RGX = re.compile(r'(?P<expr>(?:<%)\s*.+?\s*(?:%>))')
 
+# Both of them in one regex, with a named group per expression language, so
+# convert_string() finds all of the expressions in a single pass
+MIXED_EXPR_RGX = re.compile(r'(?P<jinja>{})|(?P<yaql>{})'.format(
+    JINJA_EXPR_RGX.pattern.replace('?P<expr>', ''),
+    YAQL_EXPR_RGX.pattern.replace('?P<expr>', '')))
+
 
 class MixedExpressionConverter(expr_base.BaseExpressionConverter):
     '''Converter is used to convert all expressions
@@ -51,11 +54,12 @@ class MixedExpressionConverter(expr_base.BaseExpressionConverter):
 
     @classmethod
     def convert(cls, expr, **kwargs):
-        if (isinstance(expr, type_utils.dict_types)):
-            return cls.convert_dict(expr, **kwargs)
-        elif isinstance(expr, list):
-            return cls.convert_list(expr, **kwargs)
-        elif isinstance(expr, six.string_types):
+        # copy_mode is one of COPY_MODES
+        return expressions.convert_tree(cls, expr, False, **kwargs)
+
+    @classmethod
+    def convert_scalar(cls, expr, **kwargs):
+        if isinstance(expr, six.string_types):
             return cls.convert_string(expr, **kwargs)
         elif isinstance(expr, bool):
             return expr
@@ -85,30 +89,33 @@ class MixedExpressionConverter(expr_base.BaseExpressionConverter):
 
     @classmethod
     def convert_string_containing_expressions(cls, match, **kwargs):
-        expr = match.group('expr')
-        converter = expressions.ExpressionConverter.get_converter(expr)
-        if converter:
-            expr = converter.unwrap_expression(expr)
-            expr = converter.convert_string(expr, **kwargs)
-            expr = converter.wrap_expression(expr)
+        parsed = expressions.ExpressionConverter.parse(match.group('expr'))
+        return parsed.convert(**kwargs)
 
-        return expr
+    @classmethod
+    def convert_matched_expression(cls, match, **kwargs):
+        # The regex already knows which language the expression is in, and
+        # that the match starts and ends with its delimiters
+        converter = expressions.CONVERTERS[match.lastgroup]
+        expr = match.group(match.lastgroup)[2:-2].strip()
+        return converter.wrap_expression(converter.convert_string(expr, **kwargs))
 
     @classmethod
+    @expressions.cached_convert_string
     def convert_string(cls, expr, **kwargs):
+        # This used to convert all of the Jinja expressions, and then all of
+        # the YAQL expressions in the result. Scanning for both at once only
+        # differs when one kind of expression is inside of the other, like
+        # the '{{ ... }}' in "<% '{{ ... }}' %>", which is now converted as
+        # part of the YAQL expression that it's in.
         def _inner_convert_string(match):
-            return cls.convert_string_containing_expressions(match, **kwargs)
-        expr = JINJA_EXPR_RGX.sub(_inner_convert_string, expr)
-        expr = YAQL_EXPR_RGX.sub(_inner_convert_string, expr)
-        return expr
+            return cls.convert_matched_expression(match, **kwargs)
+        return MIXED_EXPR_RGX.sub(_inner_convert_string, expr)
 
     @classmethod
     def convert_dict(cls, expr_dict, **kwargs):
-        converted = ruamel.yaml.comments.CommentedMap()
-        for k, expr in six.iteritems(expr_dict):
-            converted[k] = cls.convert(expr, **kwargs)
-        return converted
+        return expressions.convert_tree(cls, expr_dict, False, **kwargs)
 
     @classmethod
     def convert_list(cls, expr_list, **kwargs):
-        return [cls.convert(expr, **kwargs) for expr in expr_list]
+        return expressions.convert_tree(cls, expr_list, False, **kwargs)
@@ -0,0 +1,192 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import orquesta.expressions.yql
+import yaql.language.exceptions
+
+from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.utils import cache_utils
+
+
+# The rewrite plan for each YAQL expression body that has been tokenized,
+# see YaqlTokenExpressionConverter.get_plan()
+PLAN_CACHE = cache_utils.LRUCache()
+
+# The <% %> blocks of a wrapped expression, tokenized one at a time, the same
+# blocks that orquesta finds in has_expressions()
+BLOCK_REGEX = re.compile(r'<%(.*?)%>', re.DOTALL)
+
+WORD_REGEX = re.compile(r'\w+')
+TASK_NAME_REGEX = re.compile(r'["\']?\w+["\']?')
+
+ST2_ENV_ATTRIBUTES = {
+    'st2_execution_id': 'ctx().st2.action_execution_id',
+    'st2_action_api_url': 'ctx().st2.api_url',
+}
+
+# Token types for names, that is anything that can come after a '.'
+NAME_TOKENS = ('KEYWORD_STRING', 'TRUE', 'FALSE', 'NULL')
+
+
+class YaqlTokenExpressionConverter(yql.YaqlExpressionConverter):
+    '''Converts YAQL expressions using the YAQL lexer instead of regexes
+
+    YaqlExpressionConverter rewrites '$.x', 'task(x).result', 'st2kv.x',
+    'env().st2_execution_id' and 'env().st2_action_api_url' with regexes,
+    which also rewrite them inside of string literals ("'$.x'"), and
+    happily match the middle of longer names ('mytask(x).result') or method
+    calls ('st2kv.system.x.where(...)').
+
+    This converter runs each expression body (each <% %> block of a wrapped
+    expression) through the lexer of the YAQL engine that orquesta uses, walks the tokens once to find those
+    constructs, and splices the replacements into the original text, so
+    everything else (spacing, quoting, parentheses) is left alone. The YAQL
+    AST can't be used for this, because it doesn't keep the positions of
+    its nodes in the text, and printing it doesn't give YAQL back.
+
+    What needs to be replaced in a body doesn't depend on the item_vars, so
+    the list of replacements (the plan) is cached in PLAN_CACHE, keyed on
+    the body. Bodies that YAQL can't tokenize are converted by
+    YaqlExpressionConverter instead.
+
+    This converter isn't used by default. To use it for every YAQL
+    expression:
+
+        from orquestaconvert import expressions
+        from orquestaconvert.expressions import yaql_tokens
+
+        expressions.CONVERTERS['yaql'] = yaql_tokens.YaqlTokenExpressionConverter
+    '''
+
+    @classmethod
+    def tokenize(cls, expr):
+        # lexers keep their position in the input, so every call gets its own
+        lexer = orquesta.expressions.yql.YAQLEvaluator._engine.lexer.clone()
+        lexer.input(expr)
+        return list(lexer)
+
+    @classmethod
+    def get_plan(cls, expr):
+        '''Returns the list of (start, end, context_var, replacement) for expr
+
+        When context_var is set, the replacement depends on whether the variable
+        is one of the item_vars. Returns None if YAQL can't tokenize expr.
+        '''
+        return PLAN_CACHE.get_or_compute(expr, lambda: cls._build_plan(expr))
+
+    @classmethod
+    def _build_plan(cls, expr):
+        blocks = list(BLOCK_REGEX.finditer(expr)) if '<%' in expr else []
+        if not blocks:
+            return cls._build_body_plan(expr)
+
+        # Only the inside of the blocks is YAQL, the text around them is
+        # left alone
+        plan = []
+        for block in blocks:
+            body_plan = cls._build_body_plan(block.group(1))
+            if body_plan is None:
+                return None
+            offset = block.start(1)
+            plan.extend((start + offset, end + offset, context_var, replacement)
+                        for start, end, context_var, replacement in body_plan)
+        return plan
+
+    @classmethod
+    def _build_body_plan(cls, expr):
+        try:
+            tokens = cls.tokenize(expr)
+        except yaql.language.exceptions.YaqlLexicalException:
+            return None
+
+        # the tokens that start at each position, to check that the tokens
+        # of a construct directly follow each other, with no whitespace
+        starts = dict((token.lexpos, index) for index, token in enumerate(tokens))
+
+        def _token_at(position, types=None, value=None):
+            index = starts.get(position)
+            if index is None:
+                return None
+            token = tokens[index]
+            if types is not None and token.type not in types:
+                return None
+            if value is not None and token.value != value:
+                return None
+            return token
+
+        def _dot_at(position):
+            token = _token_at(position, value='.')
+            return token is not None and token.type.startswith('OP_')
+
+        def _word_end(position):
+            match = WORD_REGEX.match(expr, position)
+            return match.end() if match else None
+
+        plan = []
+        # end of the last replacement, constructs can't overlap
+        covered = 0
+        for token in tokens:
+            start = token.lexpos
+            if start < covered:
+                continue
+
+            if token.type == 'DOLLAR' and token.value == '$' and _dot_at(start + 1):
+                # $.name -> ctx().name or item(name)
+                name_end = _word_end(start + 2)
+                if name_end is not None and _token_at(start + 2):
+                    plan.append((start, name_end, expr[start + 2:name_end], None))
+                    covered = name_end
+
+            elif token.type == 'FUNC' and token.value == 'task':
+                # task(name).result -> result()
+                name_match = TASK_NAME_REGEX.match(expr, start + 5)
+                if not name_match or not _token_at(start + 5, ('KEYWORD_STRING', 'QUOTED_STRING')):
+                    continue
+                name_end = name_match.end()
+                if all([_token_at(name_end, value=')'),
+                        _dot_at(name_end + 1),
+                        _token_at(name_end + 2, NAME_TOKENS, 'result')]):
+                    end = name_end + 2 + len('result')
+                    plan.append((start, end, None, 'result()'))
+                    covered = end
+
+            elif token.type == 'KEYWORD_STRING' and token.value == 'st2kv' and _dot_at(start + 5):
+                # st2kv.a.b.c -> st2kv('a.b.c'), stopping at a method call
+                names = []
+                end = start + 5
+                while _dot_at(end) and _token_at(end + 1, NAME_TOKENS):
+                    name_end = _word_end(end + 1)
+                    names.append(expr[end + 1:name_end])
+                    end = name_end
+                if names:
+                    plan.append((start, end, None, "st2kv('{}')".format('.'.join(names))))
+                    covered = end
+
+            elif token.type == 'FUNC' and token.value == 'env' and _token_at(start + 4, value=')'):
+                # env().st2_execution_id -> ctx().st2.action_execution_id
+                # env().st2_action_api_url -> ctx().st2.api_url
+                attribute = _dot_at(start + 5) and _token_at(start + 6, NAME_TOKENS)
+                if attribute and attribute.value in ST2_ENV_ATTRIBUTES:
+                    end = start + 6 + len(attribute.value)
+                    plan.append((start, end, None, ST2_ENV_ATTRIBUTES[attribute.value]))
+                    covered = end
+
+        return plan
+
+    @classmethod
+    def convert_string(cls, expr, **kwargs):
+        plan = cls.get_plan(expr)
+        if plan is None:
+            return super(YaqlTokenExpressionConverter, cls).convert_string(expr, **kwargs)
+        return cls._apply_plan(expr, plan, **kwargs)
@@ -13,15 +13,14 @@
 # limitations under the License.
 
 import argparse
+import collections
 import glob
 import os
 import shutil
-import six
 import sys
 
-import yaml
-
-from orquestaconvert import client
+from orquestaconvert.utils import cache_utils
+from orquestaconvert.utils import profile_utils
 from orquestaconvert.utils import yaml_utils
 
 
@@ -37,6 +36,67 @@ BACKUP_EXTENSION = 'orquestaconvert.bak.yaml'
 TMP_EXTENSION = 'orquesta.temp.yaml'
 
 
+# The expressions that --batch-expressions converted for this run, see
+# init_convert_worker()
+_conversions = None
+
+
+def init_convert_worker(conversions):
+    # Runs in each worker process (or in this one, without --jobs) before
+    # converting any workflows, to hand it the expressions of this run
+    global _conversions
+    _conversions = conversions
+
+
+def convert_workflow(convert_args):
+    # This is a module-level function so it can be pickled and run in worker
+    # processes. It converts one workflow into its temporary file, and returns
+    # the error message if that fails (or None on success), and the
+    # PhaseProfile of the conversion if profile_phases is set (or None).
+    # workflow is the parsed workflow, if it was parsed already, pickled with
+    # yaml_utils.dumps_ruamel() if it was sent to another process.
+    session, args, a_f, m_f, o_f, cache, profile_phases, workflow = convert_args
+
+    key = None
+    if cache:
+        try:
+            key = cache.key(args, [m_f, a_f])
+        except (IOError, OSError):
+            # Let the conversion itself report any problems with the files
+            pass
+        else:
+            hit, error = cache.get(key, o_f)
+            if hit:
+                return error, None
+
+    # This may run in a worker process, so the timings are collected here and
+    # sent back with the result, instead of into a profile shared by the pack
+    profile = profile_utils.PhaseProfile() if profile_phases else None
+    error = None
+    cacheable = True
+    try:
+        with open(o_f, 'w') as o_file:
+            if isinstance(workflow, bytes):
+                workflow = yaml_utils.loads_ruamel(workflow)
+            session.write_converted_file(m_f, o_file, profile=profile, workflow=workflow,
+                                         conversions=_conversions)
+    except (IOError, OSError) as e:
+        # Problems reading or writing the files may be gone on the next run,
+        # so only the conversion's own errors are cached
+        error = str(e)
+        cacheable = False
+    except Exception as e:
+        error = str(e)
+
+    if key and cacheable:
+        try:
+            cache.put(key, o_f, error)
+        except (IOError, OSError):
+            # Failing to cache a result is not a reason to fail the conversion
+            pass
+    return error, profile
+
+
 class PackClient(object):
     def parser(self):
         parser = argparse.ArgumentParser(description='Convert all Mistral workflows in a pack')
@@ -46,58 +106,231 @@ class PackClient(object):
                             help='List Mistral workflows in the pack and exit')
         parser.add_argument('--actions-dir', dest='actions_directory', default=None, type=str,
                             help='The action directory to convert')
+        parser.add_argument('--packs-dir', dest='packs_directory', default=None, type=str,
+                            help=('Convert every pack in this directory (eg: /opt/stackstorm/packs), '
+                                  'including actions in subdirectories of each actions directory'))
+        parser.add_argument('-j', '--jobs', default=1, type=int,
+                            help='Number of worker processes to convert workflows with')
+        parser.add_argument('--no-cache', default=False, action='store_true',
+                            help='Always convert every workflow, ignoring cached results')
+        parser.add_argument('--cache-dir', default=None, type=str,
+                            help=('Directory to cache conversion results in (default: '
+                                  '$XDG_CACHE_HOME/orquestaconvert or ~/.cache/orquestaconvert)'))
+        parser.add_argument('--cache-size', default=cache_utils.DEFAULT_MAX_SIZE // (1024 * 1024),
+                            type=int,
+                            help='Maximum size of the conversion cache, in megabytes')
+        parser.add_argument('--batch-expressions', default=False, action='store_true',
+                            help=('Parse every workflow in the pack, and convert every distinct '
+                                  'expression in them once, before converting the workflows, and '
+                                  'share the results with all of the worker processes'))
+        parser.add_argument('--profile-phases', default=False, action='store_true',
+                            help=('Print how long each phase of each conversion took, and the '
+                                  'p50/p95/max across the pack, to stderr'))
+        parser.add_argument('--profile-format', default='table', choices=profile_utils.FORMATS,
+                            help='Format of the --profile-phases output')
         return parser
 
-    def get_workflow_files(self, workflow_type, directory=None):
+    def iter_action_files(self, action_directory, recursive=False):
+        if recursive:
+            for root, dirs, files in os.walk(action_directory):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith('.yaml') and not name.startswith('.'):
+                        yield os.path.join(root, name)
+        else:
+            for a_file in sorted(glob.glob('{}/*.yaml'.format(action_directory))):
+                yield a_file
+
+    def iter_workflow_files(self, workflow_type, directory=None, recursive=False, errors=None):
+        # Files that can't be read are recorded in errors (error message -->
+        # list of files), when given, and skipped, so one broken file doesn't
+        # stop the discovery of all of the others
         action_directory = directory if directory else 'actions'
-        glob_string = '{}/*.yaml'.format(action_directory)
-        a_files = glob.glob(glob_string)
-        mistral_workflows = {}
-        for a_file in a_files:
-            with open(a_file, 'r') as f:
-                action_data = yaml.safe_load(f.read())
+        for a_file in self.iter_action_files(action_directory, recursive=recursive):
+            # Skip over files left behind by a previous, interrupted run
+            if a_file.endswith((BACKUP_EXTENSION, TMP_EXTENSION)):
+                continue
+
+            try:
+                action_data = yaml_utils.read_yaml_keys(a_file, ['runner_type', 'entry_point'])
+            except (IOError, OSError, yaml_utils.YAMLError) as e:
+                if errors is None:
+                    raise
+                errors.setdefault(str(e), []).append(a_file)
+                continue
             runner = action_data.get('runner_type')
 
             if runner == workflow_type:
-                mistral_workflows[a_file] = os.path.join(
+                yield a_file, os.path.join(
                     action_directory,
                     *os.path.split(action_data.get('entry_point')))
 
-        return mistral_workflows
+    def iter_pack_workflow_files(self, workflow_type, packs_directory, errors=None):
+        # Walk the actions directory (and everything below it) of every pack
+        # in packs_directory, eg: /opt/stackstorm/packs
+        for pack in sorted(os.listdir(packs_directory)):
+            action_directory = os.path.join(packs_directory, pack, 'actions')
+            if os.path.isdir(action_directory):
+                for files in self.iter_workflow_files(workflow_type, action_directory,
+                                                      recursive=True, errors=errors):
+                    yield files
+
+    def get_workflow_files(self, workflow_type, directory=None):
+        return dict(self.iter_workflow_files(workflow_type, directory))
+
+    def find_workflow_files(self, workflow_type, errors=None):
+        # Lazily discover the (action file, workflow file) pairs to work on,
+        # so conversion can start before discovery has finished
+        if self.args.packs_directory:
+            return self.iter_pack_workflow_files(workflow_type, self.args.packs_directory,
+                                                 errors=errors)
+        return self.iter_workflow_files(workflow_type, self.args.actions_directory,
+                                        errors=errors)
+
+    def report_exceptions(self, exceptions, message):
+        if exceptions:
+            sys.stderr.write("ERROR: {}\n".format(message))
+            for e, wfs in exceptions.items():
+                sys.stderr.write("ISSUE: {}\n".format(e))
+                sys.stderr.write("Affected files:\n")
+                for wf in wfs:
+                    sys.stderr.write("  - {}\n".format(wf))
+                sys.stderr.write("\n")
+
+        return len(exceptions)
+
+    def map_workflows(self, func, iterable, initializer=None, initargs=()):
+        # Lazily apply func to every item, yielding (item, result) pairs in
+        # order. With more than one job, a pool of worker processes does the
+        # work, but only a couple of items per worker are pulled from the
+        # iterable at a time, so memory stays bounded however many
+        # workflows are discovered. Each worker process runs
+        # initializer(*initargs) when it starts, or this one does, with one job.
+        jobs = self.args.jobs
+        if jobs <= 1:
+            if initializer:
+                initializer(*initargs)
+            for item in iterable:
+                yield item, func(item)
+            return
+
+        # Only import multiprocessing when we actually use it, it's one of the
+        # slower modules to import
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs, initializer, initargs)
+        try:
+            pending = collections.deque()
+            for item in iterable:
+                pending.append((item, pool.apply_async(func, (item,))))
+                if len(pending) >= 2 * jobs:
+                    item, result = pending.popleft()
+                    yield item, result.get()
+            while pending:
+                item, result = pending.popleft()
+                yield item, result.get()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def rollback_workflow(self, a_f, m_f):
+        # Anything could have happened, so we check for bad conditions
+        m_f_backup = '{}.{}'.format(m_f, BACKUP_EXTENSION)
+        a_f_backup = '{}.{}'.format(a_f, BACKUP_EXTENSION)
+        o_f = '{}.{}'.format(m_f, TMP_EXTENSION)
+
+        # Remove any partially written converted workflow file
+        if os.path.isfile(o_f):
+            os.remove(o_f)
+
+        # If we have a backup workflow file, revert it
+        if os.path.isfile(m_f_backup):
+            # Remove the converted workflow file
+            if os.path.isfile(m_f):
+                os.remove(m_f)
+            # Move the backup file back
+            os.rename(m_f_backup, m_f)
+
+        # If we have a backup action metadata file
+        if os.path.isfile(a_f_backup):
+            # Remove the converted metadata file
+            if os.path.isfile(a_f):
+                os.remove(a_f)
+            # Move the backup file back
+            os.rename(a_f_backup, a_f)
 
     def run(self, argv, output_stream, client=None):
         self.args, args = self.parser().parse_known_args(argv)
         wf_type = self.args.workflow_type
-        directory = self.args.actions_directory
+        # Errors from both discovering and converting the workflows, error
+        # message --> list of files
+        exceptions = {}
         if wf_type:
-            for action, workflow in self.get_workflow_files(wf_type, directory).items():
+            for action, workflow in self.find_workflow_files(wf_type, exceptions):
                 output_stream.write("{} --> {}\n".format(action, workflow))
-            return 0
+            return self.report_exceptions(exceptions, "Unable to list all workflows.")
+
+        # Parse the conversion options once for the whole pack, instead of
+        # running the client's argument parser for every workflow
+        session = client.session(args)
 
         if self.args.validate:
-            args.append('--validate')
-            filenames = self.get_workflow_files('orquesta', directory).values()
-            total = 0
-            for f in filenames:
-                fargs = list(args)
-                fargs.append(f)
-                total += client.run(fargs, output_stream)
-            return total
+            for _, f in self.find_workflow_files('orquesta', exceptions):
+                session.validate_file(f)
+            return self.report_exceptions(exceptions, "Unable to validate all Orquesta workflows.")
 
-        filenames = self.get_workflow_files('mistral-v2', directory)
+        # Converting the workflows is the expensive, CPU-bound part, so that
+        # is the only part that is spread out over the worker processes. Each
+        # conversion only writes its own temporary file; committing and
+        # rolling back is done here, one workflow at a time and in the same
+        # order as a serial run, so the results are deterministic.
+        cache = None
+        if not self.args.no_cache:
+            cache = cache_utils.ConversionCache(self.args.cache_dir or cache_utils.default_cache_dir(),
+                                                max_size=self.args.cache_size * 1024 * 1024)
 
-        exceptions = {}
-        for a_f, m_f in six.iteritems(filenames):
-            fargs = list(args)  # make a copy
-            fargs.append(m_f)
+        profile = profile_utils.PhaseProfile() if self.args.profile_phases else None
+        workflow_files = self.find_workflow_files('mistral-v2', exceptions)
+        workflows = {}
+        conversions = None
+        if self.args.batch_expressions:
+            # The expressions of all of the workflows are needed up front, so
+            # every workflow is parsed here, once, and kept around to be
+            # converted. Workflows that can't be parsed are left to the
+            # conversion, which reports the error.
+            workflow_files = list(workflow_files)
+            for _, m_f in workflow_files:
+                try:
+                    workflows[m_f] = session.read_workflow(m_f, profile=profile)
+                except Exception:
+                    pass
+            conversions = session.convert_expressions(list(workflows.values()))
+            if self.args.jobs > 1:
+                # pickle would drop the comments of the workflows
+                workflows = dict((m_f, yaml_utils.dumps_ruamel(workflow))
+                                 for m_f, workflow in workflows.items())
+
+        convert_args = (
+            (session, list(args), a_f, m_f, '{}.{}'.format(m_f, TMP_EXTENSION), cache,
+             self.args.profile_phases, workflows.pop(m_f, None))
+            for a_f, m_f in workflow_files
+        )
+
+        results = self.map_workflows(convert_workflow, convert_args, init_convert_worker, (conversions,))
+        for (_, _, a_f, m_f, _, _, _, _), (error, workflow_profile) in results:
+            if workflow_profile:
+                profile.merge(workflow_profile)
+
+            if error is not None:
+                self.rollback_workflow(a_f, m_f)
+                exceptions.setdefault(error, []).append(m_f)
+                continue
 
             # Get the backup filenames
             m_f_backup = '{}.{}'.format(m_f, BACKUP_EXTENSION)
             a_f_backup = '{}.{}'.format(a_f, BACKUP_EXTENSION)
             o_f = '{}.{}'.format(m_f, TMP_EXTENSION)  # Orquesta workflow file
 
-            # Convert the workflow and save the YAML string in output
-            output = six.moves.StringIO()
             # In this next block of code we are attempting to create a filesystem
             # transaction, where we either want to commit all of the changes to
             # disk or none of the changes.
@@ -110,12 +343,6 @@ class PackClient(object):
             # cleaning up after the different failure conditions in the except
             # block, and handle success conditions in the else block.
             try:
-                client.run(fargs, output)
-
-                # Write the workflow file
-                with open(o_f, 'w') as o_file:
-                    o_file.write(str(output.getvalue()))
-
                 # If the backup files already exist, they were created by a
                 # previous run. In that case, we want to preserve the original
                 # backup file, because it is more likely a valid Mistral
@@ -128,38 +355,21 @@ class PackClient(object):
                     # Move the existing metadata file to a backup
                     shutil.copy2(a_f, a_f_backup)
 
-                # Read the file into a dict, tweak the runner_type, and write
-                # the dict back into a string
+                # Read the file into a dict and tweak the runner_type
                 action_data, action_data_ruamel = yaml_utils.read_yaml(a_f)
                 action_data_ruamel['runner_type'] = 'orquesta'
-                write_data = yaml_utils.obj_to_yaml(action_data_ruamel)
 
                 # Promote/move the new workflow file into place
                 shutil.move(o_f, m_f)
 
-                # Rewrite the metadata file with the tweaked runner_rtype
+                # Rewrite the metadata file with the tweaked runner_type. If
+                # this fails part way through, the backup is restored below.
                 with open(a_f, 'w') as a_file:
-                    a_file.write(write_data)
+                    yaml_utils.dump_yaml(action_data_ruamel, a_file)
                 # SUCCESS!
 
             except Exception as e:
-                # Anything could have happened, so we check for bad conditions
-
-                # If we have a backup workflow file, revert it
-                if os.path.isfile(m_f_backup):
-                    # Remove the converted workflow file
-                    if os.path.isfile(m_f):
-                        os.remove(m_f)
-                    # Move the backup file back
-                    os.rename(m_f_backup, m_f)
-
-                # If we have a backup action metadata file
-                if os.path.isfile(a_f_backup):
-                    # Remove the converted metadata file
-                    if os.path.isfile(a_f):
-                        os.remove(a_f)
-                    # Move the backup file back
-                    os.rename(a_f_backup, a_f)
+                self.rollback_workflow(a_f, m_f)
 
                 # If we ever support just Python 3, we can add the exception
                 # directly to the dictionary value:
@@ -172,17 +382,18 @@ class PackClient(object):
                 os.remove(m_f_backup)
                 os.remove(a_f_backup)
 
-        if exceptions:
-            sys.stderr.write("ERROR: Unable to convert all Mistral workflows.\n")
-            for e, wfs in exceptions.items():
-                sys.stderr.write("ISSUE: {}\n".format(e))
-                sys.stderr.write("Affected files:\n")
-                for wf in wfs:
-                    sys.stderr.write("  - {}\n".format(wf))
-                sys.stderr.write("\n")
+        if cache:
+            cache.evict()
 
-        return len(exceptions)
+        if profile:
+            profile.write(sys.stderr, self.args.profile_format)
+
+        return self.report_exceptions(exceptions, "Unable to convert all Mistral workflows.")
 
 
 if __name__ == '__main__':
+    # Only the conversion and validation code paths use the client; it is
+    # passed in rather than imported at the top so listing workflows doesn't
+    # have to import it.
+    from orquestaconvert import client
     sys.exit(PackClient().run(sys.argv[1:], sys.stdout, client=client.Client()))
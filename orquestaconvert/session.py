@@ -0,0 +1,184 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+
+from orquesta.specs.native.v1 import models as native_v1_models
+from orquestaconvert import expressions
+from orquestaconvert.specs.mistral.v2 import workflows as mistral_workflow
+from orquestaconvert.utils import profile_utils
+from orquestaconvert.utils import type_utils
+from orquestaconvert.utils import yaml_utils
+from orquestaconvert.workflows import base as workflows_base
+
+
+class ConversionSession(object):
+    '''Converts or validates any number of workflows with one set of options
+
+    This is the library entry point for conversions: the options are given
+    once, when the session is created, and then every workflow is converted
+    with them, so tools that embed orquestaconvert don't pay for building and
+    running an argument parser for each file. Both command line clients are
+    thin wrappers around a session.
+
+    Sessions only hold plain option values, so they can be pickled and
+    shipped to worker processes.
+
+    The conversion methods take an optional profile_utils.PhaseProfile, to
+    record how long each phase of each conversion takes, and an optional
+    dict of expressions that were converted ahead of time, from
+    convert_expressions().
+
+    Example:
+
+        session = ConversionSession(expr_type='yaql')
+        for filename in filenames:
+            print(session.convert_file(filename))
+    '''
+
+    def __init__(self, expr_type=None, force=False, verbose=False, task_jobs=1):
+        # expr_type is the type of expressions ('jinja' or 'yaql') to use
+        # when inserting new expressions
+        # force includes unsupported attributes in the generated outputs and
+        # skips validating the generated Orquesta workflow
+        # verbose prints a success message for every validated workflow
+        # task_jobs is the number of worker processes to convert the tasks
+        # of very big workflows with
+        self.expr_type = expr_type
+        self.force = force
+        self.verbose = verbose
+        self.task_jobs = task_jobs
+
+    @classmethod
+    def from_args(cls, args):
+        # create a session from the options parsed by Client.options_parser()
+        return cls(expr_type=args.expressions,
+                   force=args.force,
+                   verbose=args.verbose,
+                   task_jobs=args.task_jobs)
+
+    def validate_workflow_spec(self, wf_spec):
+        result = wf_spec.inspect_syntax()
+        if result:
+            raise ValueError(result)
+
+    def _phase(self, profile, filename, name):
+        if profile is None:
+            return profile_utils.null_phase()
+        return profile.phase(filename, name)
+
+    def convert_data_ruamel(self, mistral_wf_data, mistral_wf_data_ruamel, profile=None,
+                            filename=None, conversions=None):
+        # validate the Mistral workflow before we start
+        with self._phase(profile, filename, profile_utils.MISTRAL_VALIDATE):
+            mistral_wf_spec = mistral_workflow.instantiate(mistral_wf_data)
+            self.validate_workflow_spec(mistral_wf_spec)
+
+        # convert Mistral -> Orquesta
+        cache = expressions.EXPRESSION_CACHE
+        hits, misses = cache.hits, cache.misses
+        with self._phase(profile, filename, profile_utils.CONVERT):
+            mistral_wf = mistral_wf_data_ruamel[mistral_wf_spec.name]
+            workflow_converter = workflows_base.WorkflowConverter()
+            orquesta_wf_data_ruamel = workflow_converter.convert(mistral_wf, self.expr_type,
+                                                                 force=self.force,
+                                                                 jobs=self.task_jobs,
+                                                                 conversions=conversions)
+        if profile is not None:
+            profile.count(profile_utils.EXPRESSION_CACHE_HITS, cache.hits - hits)
+            profile.count(profile_utils.EXPRESSION_CACHE_MISSES, cache.misses - misses)
+
+        # validate we've generated a proper Orquesta workflow
+        with self._phase(profile, filename, profile_utils.ORQUESTA_VALIDATE):
+            orquesta_wf_data = yaml_utils.ruamel_to_obj(orquesta_wf_data_ruamel)
+            orquesta_wf_spec = native_v1_models.instantiate(orquesta_wf_data)
+            if not self.force:
+                self.validate_workflow_spec(orquesta_wf_spec)
+
+        return orquesta_wf_data_ruamel
+
+    def read_workflow(self, filename, profile=None):
+        # parse the Mistral workflow from file, returns the plain data and
+        # the ruamel data, as yaml_utils.read_yaml() does
+        with self._phase(profile, filename, profile_utils.PARSE):
+            return yaml_utils.read_yaml(filename)
+
+    def convert_file_ruamel(self, filename, profile=None, workflow=None, conversions=None):
+        # workflow is what read_workflow() returned for filename, if the
+        # caller already parsed it
+        if workflow is None:
+            workflow = self.read_workflow(filename, profile=profile)
+        mistral_wf_data, mistral_wf_data_ruamel = workflow
+        return self.convert_data_ruamel(mistral_wf_data, mistral_wf_data_ruamel,
+                                        profile=profile, filename=filename,
+                                        conversions=conversions)
+
+    def convert_file(self, filename, profile=None):
+        # write out the new Orquesta workflow to a YAML string
+        orquesta_wf_data_ruamel = self.convert_file_ruamel(filename, profile=profile)
+        with self._phase(profile, filename, profile_utils.EMIT):
+            return yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+
+    def convert_yaml(self, stream, profile=None, filename='<string>'):
+        # convert a Mistral workflow that is already in memory, stream can be
+        # a YAML string or an open file, and return the Orquesta YAML string
+        with self._phase(profile, filename, profile_utils.PARSE):
+            mistral_wf_data, mistral_wf_data_ruamel = yaml_utils.load_yaml(stream)
+        orquesta_wf_data_ruamel = self.convert_data_ruamel(mistral_wf_data, mistral_wf_data_ruamel,
+                                                           profile=profile, filename=filename)
+        with self._phase(profile, filename, profile_utils.EMIT):
+            return yaml_utils.obj_to_yaml(orquesta_wf_data_ruamel)
+
+    def write_converted_file(self, filename, output_stream, profile=None, workflow=None,
+                             conversions=None):
+        # write out the new Orquesta workflow directly to the output stream,
+        # without building the whole YAML string in memory first
+        orquesta_wf_data_ruamel = self.convert_file_ruamel(filename, profile=profile,
+                                                           workflow=workflow,
+                                                           conversions=conversions)
+        with self._phase(profile, filename, profile_utils.EMIT):
+            yaml_utils.dump_yaml(orquesta_wf_data_ruamel, output_stream)
+
+    def validate_file(self, filename):
+        # parse the Orquesta workflow from file
+        orquesta_wf_data, orquesta_wf_data_ruamel = yaml_utils.read_yaml(filename)
+
+        # validate the Orquesta workflow
+        orquesta_wf_spec = native_v1_models.instantiate(orquesta_wf_data)
+        self.validate_workflow_spec(orquesta_wf_spec)
+
+        if self.verbose:
+            print("Successfully validated workflow from {}".format(filename))
+
+    def convert_expressions(self, workflows):
+        '''Convert every distinct expression in the given workflows at once
+
+        workflows are what read_workflow() returned for each of them. The
+        expressions are collected from all of the workflows first, so each
+        distinct expression is converted exactly once however many workflows
+        it shows up in. Returns the dict of converted expressions, to pass as
+        the conversions argument when converting those workflows, see
+        WorkflowConverter.expression_keys().
+        '''
+        workflow_converter = workflows_base.WorkflowConverter()
+
+        def _entries():
+            for _, mistral_wf_data_ruamel in workflows:
+                if not isinstance(mistral_wf_data_ruamel, type_utils.dict_types):
+                    continue
+                # The conversion only picks the workflow with the name from the
+                # spec, and the other top level keys aren't workflows at all
+                for mistral_wf in mistral_wf_data_ruamel.values():
+                    if isinstance(mistral_wf, type_utils.dict_types):
+                        for entry in workflow_converter.expression_keys(mistral_wf):
+                            yield entry
+        return expressions.convert_batch(_entries())
@@ -0,0 +1,241 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+
+import six
+
+import orquestaconvert
+
+# Converted workflows are stored as '<key>.yaml', and conversions that failed
+# are stored as '<key>.error' containing the error message
+OUTPUT_EXTENSION = '.yaml'
+ERROR_EXTENSION = '.error'
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+# Default number of entries kept by an LRUCache
+DEFAULT_MAX_ENTRIES = 10000
+
+
+_converter_version = None
+
+
+def converter_version():
+    '''Identify the converter that produces the cached results
+
+    The package version alone isn't bumped for every change, so it is
+    combined with a hash of the converter's source and the version of
+    orquesta, which the converted workflows are validated against.
+    '''
+    global _converter_version
+    if _converter_version is None:
+        # orquesta is only imported here, when a cache key is first needed
+        import orquesta
+
+        package_dir = os.path.dirname(os.path.abspath(orquestaconvert.__file__))
+        digest = hashlib.sha256()
+        for dirpath, dirnames, filenames in os.walk(package_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.py'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                with open(path, 'rb') as f:
+                    content = f.read()
+                relpath = os.path.relpath(path, package_dir).replace(os.sep, '/')
+                digest.update('{}:{}\n'.format(relpath, hashlib.sha256(content).hexdigest()).encode('utf-8'))
+        _converter_version = '{} {} orquesta {}'.format(
+            orquestaconvert.__version__, digest.hexdigest(), orquesta.__version__)
+    return _converter_version
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'orquestaconvert')
+
+
+class ConversionCache(object):
+    '''On-disk cache of workflow conversion results
+
+    Entries are keyed by a hash of the converter version (see
+    converter_version), the converter options and the content of the files that went into the conversion, so
+    any change to any of those is a cache miss. The cache is bounded to
+    max_size bytes; the least recently used entries are evicted first.
+
+    Entries are written to a temporary file and renamed into place, so
+    several processes can safely share one cache directory.
+    '''
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, options, filenames):
+        digest = hashlib.sha256()
+
+        def _update(data):
+            if isinstance(data, six.text_type):
+                data = data.encode('utf-8')
+            # length-prefix every part so different splits can't collide
+            digest.update('{}:'.format(len(data)).encode('utf-8'))
+            digest.update(data)
+
+        _update(converter_version())
+        _update(u'\0'.join(options))
+        for filename in filenames:
+            with open(filename, 'rb') as f:
+                _update(f.read())
+        return digest.hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key, output_filename):
+        '''Look up a conversion result
+
+        On a hit, copies the cached workflow to output_filename and returns
+        (True, None), or returns (True, error_message) for a conversion
+        that failed. Returns (False, None) on a miss.
+        '''
+        output_path = self._path(key, OUTPUT_EXTENSION)
+        error_path = self._path(key, ERROR_EXTENSION)
+        try:
+            if os.path.isfile(output_path):
+                shutil.copyfile(output_path, output_filename)
+                os.utime(output_path, None)
+                return (True, None)
+            if os.path.isfile(error_path):
+                with io.open(error_path, 'r', encoding='utf-8') as f:
+                    error = f.read()
+                os.utime(error_path, None)
+                return (True, error)
+        except (IOError, OSError):
+            # The entry was evicted out from under us; treat it as a miss
+            pass
+        return (False, None)
+
+    def put(self, key, output_filename=None, error=None):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with io.open(fd, 'wb') as f:
+                if error is None:
+                    with io.open(output_filename, 'rb') as o_file:
+                        shutil.copyfileobj(o_file, f)
+                else:
+                    f.write(six.text_type(error).encode('utf-8'))
+            extension = OUTPUT_EXTENSION if error is None else ERROR_EXTENSION
+            os.rename(tmp_path, self._path(key, extension))
+        except Exception:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith((OUTPUT_EXTENSION, ERROR_EXTENSION)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        # Remove least recently used entries until we fit in max_size
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class LRUCache(object):
+    '''In-memory cache that keeps the max_entries most recently used entries
+
+    Safe to share between threads. Counts hits and misses, so callers can
+    see how effective the cache is, and can be disabled, in which case
+    get_or_compute() always computes the value and nothing is stored.
+    '''
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, func):
+        if not self.enabled:
+            return func()
+
+        with self._lock:
+            try:
+                # Re-insert the entry to mark it as the most recently used
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries[key] = value
+                self.hits += 1
+                return value
+
+        # Compute outside of the lock, so other threads aren't held up; two
+        # threads missing on the same key at the same time both compute it
+        value = func()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        # Drop all entries and reset the counters
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return collections.OrderedDict([
+                ('hits', self.hits),
+                ('misses', self.misses),
+                ('entries', len(self._entries)),
+            ])
@@ -0,0 +1,163 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import json
+import math
+import timeit
+
+
+# The phases of converting a single workflow, in the order they run
+PARSE = 'parse'
+MISTRAL_VALIDATE = 'mistral validate'
+CONVERT = 'convert'
+ORQUESTA_VALIDATE = 'orquesta validate'
+EMIT = 'emit'
+PHASES = [PARSE, MISTRAL_VALIDATE, CONVERT, ORQUESTA_VALIDATE, EMIT]
+
+# Counters
+EXPRESSION_CACHE_HITS = 'expression cache hits'
+EXPRESSION_CACHE_MISSES = 'expression cache misses'
+
+FORMATS = ['table', 'json']
+
+
+def percentile(values, percent):
+    # nearest-rank percentile of a list of numbers
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+@contextlib.contextmanager
+def null_phase():
+    yield
+
+
+class PhaseProfile(object):
+    '''Collects how long each phase of each workflow conversion took
+
+    Timings are recorded per file, in seconds, using the highest resolution
+    timer available. Counters (eg: expression cache hits) are totalled over
+    all files. Timings recorded in another process (eg: a conversion worker)
+    can be merged back in with add() or merge().
+    '''
+
+    def __init__(self):
+        self.files = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, filename, name):
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            elapsed = timeit.default_timer() - start
+            timings = self.files.setdefault(filename, collections.OrderedDict())
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+    def add(self, filename, timings):
+        for name, elapsed in timings.items():
+            file_timings = self.files.setdefault(filename, collections.OrderedDict())
+            file_timings[name] = file_timings.get(name, 0.0) + elapsed
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        for filename, timings in other.files.items():
+            self.add(filename, timings)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def phases(self):
+        # The known phases first, in order, then anything else we've seen
+        names = list(PHASES)
+        for timings in self.files.values():
+            for name in timings:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def summary(self):
+        summary = collections.OrderedDict()
+        for name in self.phases() + ['total']:
+            if name == 'total':
+                values = [sum(timings.values()) for timings in self.files.values()]
+            else:
+                values = [timings[name] for timings in self.files.values() if name in timings]
+            summary[name] = collections.OrderedDict([
+                ('count', len(values)),
+                ('total', float(sum(values))),
+                ('p50', percentile(values, 50)),
+                ('p95', percentile(values, 95)),
+                ('max', max(values) if values else 0.0),
+            ])
+        return summary
+
+    def to_json(self):
+        return json.dumps(collections.OrderedDict([
+            ('files', self.files),
+            ('summary', self.summary()),
+            ('counters', self.counters),
+        ]), indent=2)
+
+    def format_table(self):
+        # One row per file, then the p50/p95/max/total of every phase across
+        # all files, all in milliseconds
+        names = self.phases() + ['total']
+        rows = []
+        for filename, timings in self.files.items():
+            row = [timings.get(name) for name in names[:-1]]
+            row.append(sum(timings.values()))
+            rows.append([filename] + row)
+
+        summary = self.summary()
+        for stat in ['p50', 'p95', 'max', 'total']:
+            rows.append([stat] + [summary[name][stat] if summary[name]['count'] else None
+                                  for name in names])
+
+        def _cell(value):
+            if value is None:
+                return '-'
+            if isinstance(value, float):
+                return '{:.3f}'.format(value * 1000)
+            return value
+
+        header = ['file (ms)'] + names
+        rows = [header] + [[_cell(value) for value in row] for row in rows]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+
+        lines = []
+        for i, row in enumerate(rows):
+            if i == len(self.files) + 1:
+                lines.append('  '.join('-' * width for width in widths))
+            cells = [row[0].ljust(widths[0])]
+            cells.extend(cell.rjust(width) for cell, width in zip(row[1:], widths[1:]))
+            lines.append('  '.join(cells).rstrip())
+
+        if self.counters:
+            lines.append('')
+            width = max(len(name) for name in self.counters)
+            for name, n in self.counters.items():
+                lines.append('{}  {}'.format(name.ljust(width), n))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, stream, output_format='table'):
+        if output_format == 'json':
+            stream.write(self.to_json() + '\n')
+        else:
+            stream.write(self.format_table())
@@ -10,40 +10,325 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import ruamel.yaml
-import ruamel.yaml.comments
+import collections
+import io
+import pickle
+import threading
+
 import six
 import yaml
-import yamlloader
+
+# ruamel.yaml and yamlloader are only needed to load, convert and dump whole
+# workflows, and they take a while to import, so they are imported the first
+# time they are used instead of here. That keeps scanning action metadata
+# (eg: pack_client.py --list-workflows) fast to start.
+
+
+# Prefer libyaml's parser for scanning, but don't require it
+_ScanLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# PyYAML's (YAML 1.1) tags for plain scalars
+_yaml11_resolver = yaml.resolver.Resolver()
+
+
+# the error raised for files that aren't valid YAML
+YAMLError = yaml.YAMLError
+
+
+class AmbiguousYamlError(Exception):
+    pass
+
+
+def _ruamel():
+    import ruamel.yaml
+    import ruamel.yaml.comments
+    import ruamel.yaml.composer
+    import ruamel.yaml.nodes
+    import ruamel.yaml.scalarbool
+    import ruamel.yaml.scalarfloat
+    import ruamel.yaml.scalarint
+    import ruamel.yaml.scalarstring
+    return ruamel
 
 
 def yaml_to_obj(stream):
+    import yamlloader
     return yaml.load(stream, Loader=yamlloader.ordereddict.CSafeLoader)
 
 
-def read_yaml(yaml_filename):
-    # parse data in a format that preserves ordering
+def ruamel_to_obj(obj):
+    '''Convert a ruamel round-trip tree into plain Python structures
+
+    CommentedMap becomes OrderedDict, CommentedSeq becomes list, and the
+    ruamel scalar subclasses (ScalarFloat, ScalarInt, the ScalarString
+    family, ...) are converted back to their builtin base types. This gives
+    the same shape of data that yaml_to_obj() would produce, without having
+    to emit and then re-parse the tree.
+
+    The scalars keep the values ruamel gave them, which follow the YAML 1.2
+    rules, so use load_yaml() to get the plain view of a parsed document.
+    '''
+    return _ruamel_to_obj(obj, _ruamel().yaml)
+
+
+def _ruamel_to_obj(obj, ryaml):
+    if isinstance(obj, dict):
+        return collections.OrderedDict(
+            (_ruamel_to_obj(k, ryaml), _ruamel_to_obj(v, ryaml)) for k, v in six.iteritems(obj))
+    elif isinstance(obj, list):
+        return [_ruamel_to_obj(v, ryaml) for v in obj]
+    elif isinstance(obj, ryaml.comments.CommentedSet):
+        return set(_ruamel_to_obj(v, ryaml) for v in obj)
+    elif isinstance(obj, ryaml.scalarstring.ScalarString):
+        return six.text_type(obj)
+    elif isinstance(obj, ryaml.scalarbool.ScalarBoolean):
+        return bool(obj)
+    elif isinstance(obj, ryaml.scalarint.ScalarInt):
+        return int(obj)
+    elif isinstance(obj, ryaml.scalarfloat.ScalarFloat):
+        return float(obj)
+    return obj
+
+
+def _skip_node(loader, event):
+    # consume the rest of the node that starts with event
+    depth = 1 if isinstance(event, yaml.CollectionStartEvent) else 0
+    while depth:
+        event = loader.get_event()
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+
+
+def _scalar_string(event):
+    # return the string value of a scalar event, or raise if it would be
+    # anything other than a string after a full load
+    if not isinstance(event, yaml.ScalarEvent) or event.tag is not None:
+        raise AmbiguousYamlError()
+    if event.implicit[0]:
+        # plain scalars may resolve to null, bool, int, float, timestamps, ...
+        tag = _yaml11_resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+        if tag != 'tag:yaml.org,2002:str':
+            raise AmbiguousYamlError()
+    return event.value
+
+
+def scan_yaml_keys(stream, keys):
+    '''Return the string values of the given top-level keys of a YAML mapping
+
+    This walks the parser's event stream instead of constructing the whole
+    document, skips over the values of all other keys, and stops as soon
+    as every requested key has been found. Raises AmbiguousYamlError if the
+    document can't be answered from the events alone (the root isn't a
+    mapping, a requested value isn't a string, merge keys or aliases are
+    involved, ...).
+    '''
+    keys = set(keys)
+    found = {}
+    loader = _ScanLoader(stream)
+    try:
+        loader.get_event()  # StreamStartEvent
+        if not isinstance(loader.get_event(), yaml.DocumentStartEvent):
+            raise AmbiguousYamlError()
+        if not isinstance(loader.get_event(), yaml.MappingStartEvent):
+            raise AmbiguousYamlError()
+
+        while len(found) < len(keys):
+            key_event = loader.get_event()
+            if isinstance(key_event, yaml.MappingEndEvent):
+                break
+            if isinstance(key_event, yaml.AliasEvent):
+                raise AmbiguousYamlError()
+            if isinstance(key_event, yaml.ScalarEvent) and key_event.value == '<<':
+                raise AmbiguousYamlError()
+
+            _skip_node(loader, key_event)
+            value_event = loader.get_event()
+            if isinstance(key_event, yaml.ScalarEvent) and key_event.value in keys:
+                found[_scalar_string(key_event)] = _scalar_string(value_event)
+            else:
+                _skip_node(loader, value_event)
+    finally:
+        loader.dispose()
+    return found
+
+
+def read_yaml_keys(yaml_filename, keys):
+    # pull a few top-level string values out of a YAML file without
+    # parsing all of it, falling back to a full parse when the quick
+    # scan can't give a reliable answer
     with open(yaml_filename, 'r') as stream:
-        # safe load with ordered dicts
-        ruamel_data = ruamel.yaml.round_trip_load(stream)
+        try:
+            return scan_yaml_keys(stream, keys)
+        except AmbiguousYamlError:
+            pass
 
-    # parse YAML into a dict
     with open(yaml_filename, 'r') as stream:
-        data = yaml_to_obj(stream)
+        data = yaml.safe_load(stream)
+    if not isinstance(data, dict):
+        return {}
+    return dict((k, data[k]) for k in keys if k in data)
+
+
+_round_trip_loader = None
+
+
+def _get_round_trip_loader():
+    # ruamel's round-trip loader, which also records the tag that PyYAML
+    # would give each plain scalar, as ruamel resolves them with the YAML 1.2
+    # rules (eg: 'yes' is a string and 010 is 10) and PyYAML, like
+    # StackStorm, with the YAML 1.1 rules (True and 8)
+    global _round_trip_loader
+    if _round_trip_loader is None:
+        ryaml = _ruamel().yaml
+
+        class RoundTripLoader(ryaml.RoundTripLoader):
+            def __init__(self, stream):
+                ryaml.RoundTripLoader.__init__(self, stream)
+                self.yaml11_tags = {}
+
+            def compose_scalar_node(self, anchor):
+                event = self.parser.peek_event()
+                node = ryaml.composer.Composer.compose_scalar_node(self, anchor)
+                if event.tag is None or event.tag == u'!':
+                    self.yaml11_tags[id(node)] = _yaml11_resolver.resolve(
+                        yaml.ScalarNode, event.value, event.implicit)
+                return node
+
+        _round_trip_loader = RoundTripLoader
+    return _round_trip_loader
+
+
+def _yaml11_node(node, yaml11_tags, nodes, ryaml):
+    # copy a ruamel node graph into a PyYAML one, keeping the aliases
+    if id(node) in nodes:
+        return nodes[id(node)]
+    if isinstance(node, ryaml.nodes.ScalarNode):
+        copy = yaml.ScalarNode(yaml11_tags.get(id(node), node.tag), node.value, style=node.style)
+    elif isinstance(node, ryaml.nodes.SequenceNode):
+        copy = yaml.SequenceNode(node.tag, [], flow_style=node.flow_style)
+        nodes[id(node)] = copy
+        copy.value.extend(_yaml11_node(v, yaml11_tags, nodes, ryaml) for v in node.value)
+    else:
+        copy = yaml.MappingNode(node.tag, [], flow_style=node.flow_style)
+        nodes[id(node)] = copy
+        copy.value.extend((_yaml11_node(k, yaml11_tags, nodes, ryaml),
+                           _yaml11_node(v, yaml11_tags, nodes, ryaml))
+                          for k, v in node.value)
+    nodes[id(node)] = copy
+    return copy
+
+
+def load_yaml(stream):
+    # parse data in a format that preserves ordering, then build the plain
+    # dict view from the same parse instead of parsing the document again,
+    # with the same (YAML 1.1) values that yaml_to_obj() would give
+    # stream can be a string or an open file
+    loader = _get_round_trip_loader()(stream)
+    try:
+        node = loader.get_single_node()
+        if node is None:
+            return (None, None)
+        # the nodes have to be copied first, constructing the round-trip
+        # data removes the merge keys from them
+        yaml11_node = _yaml11_node(node, loader.yaml11_tags, {}, _ruamel().yaml)
+        ruamel_data = loader.construct_document(node)
+    finally:
+        loader.dispose()
+
+    import yamlloader
+    data = yamlloader.ordereddict.SafeLoader('').construct_document(yaml11_node)
 
     return (data, ruamel_data)
 
 
-def obj_to_yaml(obj, indent=2):
+def read_yaml(yaml_filename):
+    with open(yaml_filename, 'r') as stream:
+        return load_yaml(stream)
+
+
+# ruamel YAML instances are not safe to share between threads while dumping,
+# so each thread gets its own set of configured emitters, keyed by indent
+_emitters = threading.local()
+
+
+def _new_yaml_emitter(indent):
     # use this different library because PyYAML doesn't handle indenting properly
     # rt = round-trip
-    ruyaml = ruamel.yaml.YAML(typ='rt')
+    ruyaml = _ruamel().yaml.YAML(typ='rt')
     ruyaml.explicit_start = True
     # this crazyness basically sets indents to 'indent'
     # 'sequence' is always supposed to be 'offset' + 2
     ruyaml.indent(mapping=indent, sequence=(indent + 2), offset=indent)
     # prevent line-wrap
     ruyaml.width = 99999999999
+    return ruyaml
+
+
+def get_yaml_emitter(indent=2):
+    cache = getattr(_emitters, 'cache', None)
+    if cache is None:
+        cache = _emitters.cache = {}
+    ruyaml = cache.get(indent)
+    if ruyaml is None:
+        ruyaml = cache[indent] = _new_yaml_emitter(indent)
+    return ruyaml
+
+
+def dump_yaml(obj, stream, indent=2):
+    # write the YAML for obj straight into stream (eg: an open file)
+    try:
+        get_yaml_emitter(indent).dump(obj, stream)
+    except Exception:
+        # don't reuse an emitter that may have been left in a half-dumped state
+        _emitters.cache.pop(indent, None)
+        raise
+
+
+def obj_to_yaml(obj, indent=2):
     stream = six.StringIO()
-    ruyaml.dump(obj, stream)
+    dump_yaml(obj, stream, indent=indent)
     return stream.getvalue()
+
+
+def _reduce_commented(obj):
+    # pickle's default for the ruamel containers only keeps their __dict__,
+    # but the comments are kept in __slots__, so include those as well
+    slots = {}
+    for cls in type(obj).__mro__:
+        cls_slots = getattr(cls, '__slots__', ())
+        if isinstance(cls_slots, six.string_types):
+            cls_slots = (cls_slots,)
+        for attr in cls_slots:
+            if attr not in ('__dict__', '__weakref__') and hasattr(obj, attr):
+                slots[attr] = getattr(obj, attr)
+    state = (getattr(obj, '__dict__', None) or None, slots)
+    if isinstance(obj, dict):
+        return (type(obj), (), state, None, iter(list(obj.items())))
+    return (type(obj), (), state, iter(list(obj)), None)
+
+
+class _RuamelPickler(pickle.Pickler):
+    dispatch_table = {}
+
+
+def dumps_ruamel(obj):
+    '''Pickle a ruamel round-trip tree (or anything containing one)
+
+    Unlike pickle.dumps(), this keeps the comments, so that the tree emits
+    the same YAML after loads_ruamel() as before. Used to ship parts of a
+    workflow to worker processes and back.
+    '''
+    if not _RuamelPickler.dispatch_table:
+        comments = _ruamel().yaml.comments
+        dispatch_table = dict(six.moves.copyreg.dispatch_table)
+        for cls in (comments.CommentedMap, comments.CommentedOrderedMap, comments.CommentedSeq):
+            dispatch_table[cls] = _reduce_commented
+        _RuamelPickler.dispatch_table = dispatch_table
+    stream = io.BytesIO()
+    _RuamelPickler(stream, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return stream.getvalue()
+
+
+def loads_ruamel(data):
+    return pickle.loads(data)
@@ -10,6 +10,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import re
 import six
 import warnings
@@ -21,8 +22,10 @@ from orquestaconvert.expressions import base as expr_base
 from orquestaconvert.expressions import jinja
 from orquestaconvert.expressions import mixed
 from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.utils import cache_utils
 from orquestaconvert.utils import task_utils
 from orquestaconvert.utils import type_utils
+from orquestaconvert.utils import yaml_utils
 
 WORKFLOW_TYPES = [
     'direct',
@@ -69,9 +72,114 @@ WITH_ITEMS_EXPR_RGX = re.compile(WITH_ITEMS_PATTERN)
 CTX_PATTERN = r'\bctx(?:(?:\(\))?\.get)?\([\'"]?(\w+)[\'"]?(?:,\s*[\'"]?[^\'")]+[\'"]?)?\s*\)|\bctx\(\).(\w+)\b'
 CTX_RGX = re.compile(CTX_PATTERN)
 
+# The context variables referenced by each string that has been searched
+# for them, the same strings are searched over and over again: the workflow
+# output, and then every transition condition of every task
+CONTEXT_VARIABLES_CACHE = cache_utils.LRUCache()
+
+# The references to context variables that are replaced by the expression
+# the variable is published with, when the variable is referenced in the
+# condition of the same transition. {names} is an alternation of the
+# variable names.
+#
+# Replace double parentheses
+# ((ctx().variable))    ->  (result().result['variable'] + 1)
+#
+# Don't add in parentheses if they already exist
+# (ctx().variable)      ->  (result().result['variable'] + 1)
+#
+# Keep double enclosing internal parentheses
+# (ctx(variable))       ->  (result().result['variable'] + 1)
+#
+# Keep surrounding context and add surrounding parentheses
+# (ctx().variable ...   ->  ((result().result['variable'] + 1) ...
+# ... ctx().variable)   ->  ... (result().result['variable'] + 1))
+# ...ctx().variable...  ->  ...(result().result['variable'] + 1)...
+VARIABLE_REFERENCE_PATTERN = (r'\(\(ctx\(\)\.(?P<double_parens>{names})\)\)'
+                              r'|\(ctx\(\)\.(?P<parens>{names})\)'
+                              r'|\(ctx\((?P<internal_parens>{names})\)\)'
+                              r'|(?<=.)\bctx\(\)\.(?P<bare>{names})\b(?=.)')
+
+# Compiled VARIABLE_REFERENCE_PATTERNs, by the set of variable names
+VARIABLE_REFERENCE_RGX_CACHE = cache_utils.LRUCache(max_entries=1000)
+
+# With more than one job, the tasks of workflows with at least this many
+# tasks are converted in chunks of TASK_CHUNK_SIZE tasks by worker
+# processes. Starting the workers and shipping the tasks to them and back
+# costs more than converting a smaller workflow.
+PARALLEL_TASKS_THRESHOLD = 1000
+TASK_CHUNK_SIZE = 250
+
+
+class ConversionContext(object):
+    '''The options and state of converting one workflow
+
+    Created by convert_tasks() and passed down to everything that converts
+    a part of a task, so that the WorkflowConverter itself doesn't hold any
+    state and one converter can convert several workflows at the same time.
+    '''
+    __slots__ = ('expr_converter', 'wf_vars', 'force', 'conversions')
+
+    def __init__(self, expr_converter, wf_vars=None, force=False, conversions=None):
+        self.expr_converter = expr_converter
+        # the context variables used in the workflow output
+        self.wf_vars = wf_vars if wf_vars is not None else set()
+        self.force = force
+        # expressions that were converted ahead of time, see
+        # WorkflowConverter.expression_keys()
+        self.conversions = conversions
+
+    def task(self, task_name):
+        return TaskContext(task_name, conversions=self.conversions)
+
+
+class TaskContext(object):
+    '''The state of converting one task'''
+    __slots__ = ('task_name', 'item_vars', 'conversions')
+
+    def __init__(self, task_name=None, item_vars=None, conversions=None):
+        self.task_name = task_name
+        # The variables in with-items expressions need to be accessed using
+        # the `item(var)` syntax, not the usual `ctx().var` syntax, so we
+        # use this list to keep track of which variables are within the
+        # task context
+        self.item_vars = item_vars if item_vars is not None else []
+        self.conversions = conversions
+
+
+def variable_reference_rgx(variable_names):
+    variable_names = frozenset(variable_names)
+
+    def _compile():
+        names = '|'.join(re.escape(name) for name in sorted(variable_names))
+        return re.compile(VARIABLE_REFERENCE_PATTERN.format(names=names))
+    return VARIABLE_REFERENCE_RGX_CACHE.get_or_compute(variable_names, _compile)
+
+
+# The (tasks, conversion context) of the workflow that a worker process
+# converts chunks of, see WorkflowConverter.convert_tasks_parallel()
+_worker_tasks = None
+
+
+def init_task_worker(payload):
+    global _worker_tasks
+    if isinstance(payload, bytes):
+        payload = yaml_utils.loads_ruamel(payload)
+    _worker_tasks = payload
+
+
+def convert_task_chunk(chunk):
+    # Runs in a worker process, converts the tasks from start to end and
+    # pickles them with yaml_utils.dumps_ruamel(), so that the comments in
+    # them survive the trip back
+    tasks, conversion_ctx = _worker_tasks
+    start, end = chunk
+    converter = WorkflowConverter()
+    return yaml_utils.dumps_ruamel([(task_name, converter.convert_task(task_name, m_task_spec, conversion_ctx))
+                                    for task_name, m_task_spec in tasks[start:end]])
+
 
 class WorkflowConverter(object):
-    task_with_item_vars = []
 
     def group_task_transitions(self, mistral_transition_list):
         expr_transitions = ruamel.yaml.comments.CommentedMap()
@@ -108,25 +216,36 @@ class WorkflowConverter(object):
     def dict_to_list(self, d):
         return [{k: v} for k, v in six.iteritems(d)]
 
+    def publish_to_list(self, converted_publish):
+        # The converted publish block is shared by all of the transitions of
+        # a task, so each one gets its own copy of the dicts and lists in it,
+        # otherwise ruamel writes them out as anchors and aliases
+        return [{k: copy.deepcopy(v) if isinstance(v, expressions.CONTAINER_TYPES) else v}
+                for k, v in six.iteritems(converted_publish)]
+
     def extract_context_variables(self, obj):
         # given an object that contains Orquesta YAQL or Jinja expressions (eg: contain 'ctx()'),
         # extract all variable names into a set
         variable_names = set()
-        if isinstance(obj, type_utils.dict_types):
-            for key in obj.keys():
-                variable_names = variable_names | self.extract_context_variables(key)
-            for val in obj.values():
-                variable_names = variable_names | self.extract_context_variables(val)
-        elif isinstance(obj, list):
-            for element in obj:
-                variable_names = variable_names | self.extract_context_variables(element)
-        elif isinstance(obj, six.string_types):
-            for mobj in CTX_RGX.finditer(obj):
-                match = mobj.group(1) or mobj.group(2)
-                variable_names.add(match)
+        stack = [obj]
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, type_utils.dict_types):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, list):
+                stack.extend(obj)
+            elif isinstance(obj, six.string_types) and 'ctx' in obj:
+                variable_names.update(self.string_context_variables(obj))
         return variable_names
 
-    def convert_task_transition_simple(self, transitions, publish, orquesta_expr, expr_converter):
+    def string_context_variables(self, string):
+        def _extract():
+            return frozenset(name or attr_name for name, attr_name in CTX_RGX.findall(string))
+        return CONTEXT_VARIABLES_CACHE.get_or_compute(string, _extract)
+
+    def convert_task_transition_simple(self, transitions, publish, orquesta_expr, expr_converter,
+                                       converted_publish=None, conversions=None):
         # if this is a simple name of a task:
         # on-success:
         #   - do_thing_a
@@ -145,10 +264,13 @@ class WorkflowConverter(object):
         if orquesta_expr:
             simple_transition['when'] = expr_converter.wrap_expression(orquesta_expr)
 
-        # add in published variables
+        # add in published variables, converted_publish is publish that has
+        # already been converted
         if publish:
-            publish_converted = expressions.ExpressionConverter.convert_dict(publish)
-            simple_transition['publish'] = self.dict_to_list(publish_converted)
+            if converted_publish is None:
+                converted_publish = expressions.ExpressionConverter.convert_dict(publish,
+                                                                                 conversions=conversions)
+            simple_transition['publish'] = self.publish_to_list(converted_publish)
 
         # add in the transition list
         if transitions:
@@ -156,7 +278,8 @@ class WorkflowConverter(object):
 
         return simple_transition
 
-    def convert_task_transition_expr(self, task_name, expression_list, publish, orquesta_expr):
+    def convert_task_transition_expr(self, task_name, expression_list, publish, orquesta_expr,
+                                     converted_publish=None, conversions=None):
         # group all complex expressions by their common expression
         # this way we can keep all of the transitions with the same
         # expressions in the same `when:` condition
@@ -176,25 +299,29 @@ class WorkflowConverter(object):
         #   - when: "{{ succeeded() and not _.x }}"
         #     do:
         #       - do_thing_c
+        #
+        # every one of them publishes the same variables, so only convert
+        # them once (if converted_publish doesn't already have them), and
+        # not at all if there aren't any transitions
+        if publish and expression_list and converted_publish is None:
+            converted_publish = expressions.ExpressionConverter.convert_dict(publish, conversions=conversions)
+
         transitions = []
         for expr, task_list in six.iteritems(expression_list):
             expr_transition = ruamel.yaml.comments.CommentedMap()
-            expr_converted = expressions.ExpressionConverter.convert(expr)
+            expr_converted = expressions.ExpressionConverter.convert(expr, conversions=conversions)
 
             # for some transitions (on-complete) the orquesta_expr may be empty
             # so only add it in, if it's necessary
             if orquesta_expr:
-                converter = expressions.ExpressionConverter.get_converter(expr_converted)
-                expr_converted = converter.unwrap_expression(expr_converted)
-                o_expr = '{} and ({})'.format(orquesta_expr, expr_converted)
-                o_expr = converter.wrap_expression(o_expr)
+                parsed = expressions.ExpressionConverter.parse(expr_converted)
+                o_expr = parsed.wrap('{} and ({})'.format(orquesta_expr, parsed.body))
             else:
                 o_expr = expr_converted
 
             expr_transition['when'] = o_expr
             if publish:
-                converted_publish = expressions.ExpressionConverter.convert_dict(publish)
-                expr_transition['publish'] = [{k: v} for k, v in converted_publish.items()]
+                expr_transition['publish'] = self.publish_to_list(converted_publish)
 
                 expr_transition['when'] = self.replace_immediately_referenced_variables(task_name,
                                                                                         expr_transition['when'],
@@ -212,43 +339,21 @@ class WorkflowConverter(object):
         variables_in_publish = set(publish_dict.keys())
 
         immediately_referenced_variables = variables_in_when & variables_in_publish
+        if not immediately_referenced_variables:
+            return when_expr
 
         # Replace the context variable references in the 'when'
         # expression with their expression from the 'publish' block
-        for variable in immediately_referenced_variables:
+        when_expr_type = expressions.ExpressionConverter.expression_type(when_expr)
+        replacements = {}
+        for variable in sorted(immediately_referenced_variables):
             # First off, make sure they are the same type of expression,
             # we don't want to inject a Jinja expression in the middle
             # of a YAQL expression
-            when_expr_type = expressions.ExpressionConverter.expression_type(when_expr)
-            publish_expr_type = expressions.ExpressionConverter.expression_type(publish_dict[variable])
-
-            if when_expr_type == publish_expr_type:
+            publish_expr = expressions.ExpressionConverter.parse(publish_dict[variable])
+            if when_expr_type == publish_expr.dialect:
                 # Grab the variable expression
-                converter = expressions.ExpressionConverter.get_converter(publish_dict[variable])
-                unwrapped_expr = converter.unwrap_expression(publish_dict[variable])
-
-                # Replace double parentheses
-                # ((ctx().variable))    ->  (result().result['variable'] + 1)
-                variable_reference_dp = r'\(\(ctx\(\).{var}\)\)'.format(var=variable)
-                when_expr = re.sub(variable_reference_dp, "({})".format(unwrapped_expr), when_expr)
-
-                # Don't add in parentheses if they already exist
-                # (ctx().variable)      ->  (result().result['variable'] + 1)
-                variable_reference_dp = r'\(ctx\(\).{var}\)'.format(var=variable)
-                when_expr = re.sub(variable_reference_dp, "({})".format(unwrapped_expr), when_expr)
-
-                # Keep surrounding context and add surrounding parentheses
-                # (ctx().variable ...   ->  ((result().result['variable'] + 1) ...
-                # ... ctx().variable)   ->  ... (result().result['variable'] + 1))
-                # ...ctx().variable...  ->  ...(result().result['variable'] + 1)...
-                variable_reference_ep = r'(.)\bctx\(\).{var}\b(.)'.format(var=variable)
-                when_expr = re.sub(variable_reference_ep, r"\1({})\2".format(unwrapped_expr), when_expr)
-
-                # Keep double enclosing internal parentheses
-                # (ctx(variable))  ->  (result().result['variable'] + 1)
-                variable_reference_eip = r'\(ctx\({var}\)\)'.format(var=variable)
-                when_expr = re.sub(variable_reference_eip, "({})".format(unwrapped_expr), when_expr)
-
+                replacements[variable] = "({})".format(publish_expr.body)
             else:
                 warnings.warn("The transition \"{when_expr}\" in {task_name} "
                               "references the '{variable}' context variable, "
@@ -257,8 +362,15 @@ class WorkflowConverter(object):
                               "expression in the transition."
                               .format(when_expr=when_expr,
                                       task_name=task_name,
-                                      variable=variable)),
-        return when_expr
+                                      variable=variable))
+
+        if not replacements:
+            return when_expr
+
+        # Replace every reference to every one of the variables in one pass
+        def _replace(match):
+            return replacements[match.group(match.lastgroup)]
+        return variable_reference_rgx(replacements).sub(_replace, when_expr)
 
     def default_task_transition_map(self):
         transitions = ruamel.yaml.comments.CommentedMap()
@@ -282,7 +394,7 @@ class WorkflowConverter(object):
                 o_task_spec['next'][i]['do'] = new_dos
         return o_task_spec
 
-    def convert_task_transitions(self, task_name, m_task_spec, expr_converter, wf_vars):
+    def convert_task_transitions(self, task_name, m_task_spec, expr_converter, wf_vars, conversions=None):
         # group all complex expressions by their common expression
         # this way we can keep all of the transitions with the same
         # expressions in the same `when:` condition
@@ -342,6 +454,23 @@ class WorkflowConverter(object):
         if m_task_spec.get('publish-on-error'):
             transitions['on-error']['publish'] = m_task_spec['publish-on-error']
 
+        def _converted_publish(m_transition_name):
+            # Convert each publish block once, the first time a transition
+            # needs it, and all of the transitions that publish it share the
+            # converted variables. Blocks that no transition publishes aren't
+            # converted at all, so they don't warn about their expressions.
+            data = transitions[m_transition_name]
+            if data.get('converted_publish') is None:
+                if m_transition_name == 'on-complete':
+                    # which is the same as merging the converted ones
+                    converted = _converted_publish('on-success').copy()
+                    converted.update(_converted_publish('on-error'))
+                else:
+                    converted = expressions.ExpressionConverter.convert_dict(data['publish'],
+                                                                             conversions=conversions)
+                data['converted_publish'] = converted
+            return data['converted_publish']
+
         if m_task_spec.get('on-complete'):
             # Handling on-complete publishing is more complicated, because the
             # dictionaries from publish and publish-on-error need to be
@@ -381,33 +510,42 @@ class WorkflowConverter(object):
 
             publish_to_workflow_context = bool(wf_vars & set(data.get('publish').keys()))
 
+            converted_publish = None
+            if data.get('publish') and (trans_simple or trans_expr or publish_to_workflow_context):
+                converted_publish = _converted_publish(m_transition_name)
+
             # Create a transition for the simple task lists
             if trans_simple or publish_to_workflow_context:
                 o_trans_simple = self.convert_task_transition_simple(trans_simple,
                                                                      data.get('publish'),
                                                                      data['orquesta_expr'],
-                                                                     expr_converter)
+                                                                     expr_converter,
+                                                                     converted_publish,
+                                                                     conversions)
                 o_task_spec['next'].append(o_trans_simple)
 
             # Create multiple transitions, one for each unique expression
             o_trans_expr_list = self.convert_task_transition_expr(task_name,
                                                                   trans_expr,
                                                                   data.get('publish'),
-                                                                  data['orquesta_expr'])
+                                                                  data['orquesta_expr'],
+                                                                  converted_publish,
+                                                                  conversions)
             o_task_spec['next'].extend(o_trans_expr_list)
 
         o_task_spec = self.normalize_transition_task_names(o_task_spec)
 
         return o_task_spec if o_task_spec['next'] else ruamel.yaml.comments.CommentedMap()
 
-    def convert_action(self, m_action):
+    def convert_action(self, m_action, task_ctx=None):
+        task_ctx = task_ctx if task_ctx is not None else TaskContext()
         if m_action in UNSUPPORTED_MISTRAL_ACTIONS:
             raise NotImplementedError(("Action '{}' is not supported in orquesta.").
                                       format(m_action))
 
         o_action = MISTRAL_ACTION_CONVERSION_TABLE.get(m_action, m_action)
 
-        kwargs = {'item_vars': self.task_with_item_vars}
+        kwargs = {'item_vars': task_ctx.item_vars, 'conversions': task_ctx.conversions}
         return mixed.MixedExpressionConverter.convert_string(o_action, **kwargs)
 
     def convert_retry(self, m_retry, task_name):
@@ -451,28 +589,25 @@ class WorkflowConverter(object):
         with_continue = None
         with_break = None
         if m_retry.get('continue-on'):
-            continue_expr = m_retry['continue-on']
-            continue_converter = expressions.ExpressionConverter.get_converter(continue_expr)
+            continue_expr = expressions.ExpressionConverter.parse(m_retry['continue-on'])
+            continue_converter = continue_expr.converter
             if not continue_converter:
                 raise NotImplementedError("Could not convert continue-on expression: {converter} "
                                           "in task '{task_name}'"
                                           .format(converter=continue_converter,
                                                   task_name=task_name))
-            continue_expr = continue_converter.unwrap_expression(continue_expr)
-            continue_expr = continue_converter.convert_string(continue_expr)
-            with_continue = 'succeeded() and ({continue_expr})'.format(continue_expr=continue_expr)
+            with_continue = ('succeeded() and ({continue_expr})'
+                             .format(continue_expr=continue_expr.convert_body()))
 
         if m_retry.get('break-on'):
-            break_expr = m_retry['break-on']
-            break_converter = expressions.ExpressionConverter.get_converter(break_expr)
+            break_expr = expressions.ExpressionConverter.parse(m_retry['break-on'])
+            break_converter = break_expr.converter
             if not break_converter:
                 raise NotImplementedError("Could not convert break-on expression: {converter} "
                                           "in task '{task_name}'"
                                           .format(converter=break_converter,
                                                   task_name=task_name))
-            break_expr = break_converter.unwrap_expression(break_expr)
-            break_expr = break_converter.convert_string(break_expr)
-            with_break = 'failed() and not ({break_expr})'.format(break_expr=break_expr)
+            with_break = 'failed() and not ({break_expr})'.format(break_expr=break_expr.convert_body())
 
         if with_continue and with_break:
             # The converters are classes themselves
@@ -495,11 +630,15 @@ class WorkflowConverter(object):
 
         return o_retry
 
-    def convert_input(self, input_):
-        kwargs = {'item_vars': self.task_with_item_vars}
+    def convert_input(self, input_, task_ctx=None):
+        # The input is written out, so it has to be a copy (the default): the
+        # unchanged parts of a copy-on-write conversion would keep their flow
+        # style, comments and anchors from the Mistral workflow
+        task_ctx = task_ctx if task_ctx is not None else TaskContext()
+        kwargs = {'item_vars': task_ctx.item_vars, 'conversions': task_ctx.conversions}
         return mixed.MixedExpressionConverter.convert_dict(input_, **kwargs)
 
-    def convert_with_items_expr(self, expression, expr_converter):
+    def convert_with_items_expr(self, expression, expr_converter, task_ctx=None):
         # Convert all with-items attributes
         #
         # with-items:
@@ -534,6 +673,7 @@ class WorkflowConverter(object):
         #
         # with:
         #   items: i in <% [0, 1, 2, 3] %>
+        task_ctx = task_ctx if task_ctx is not None else TaskContext()
         converter = None
         var_list = []
         expr_list = []
@@ -547,13 +687,11 @@ class WorkflowConverter(object):
             m = WITH_ITEMS_EXPR_RGX.match(expr_item)
             if m:
                 var = m.group('var')
-                expr = m.group('expr')
-                converter = expressions.ExpressionConverter.get_converter(expr)
-                if converter:
-                    expr = converter.unwrap_expression(expr)
-                    expr = converter.convert_string(expr)
+                parsed = expressions.ExpressionConverter.parse(m.group('expr'))
+                if parsed.converter:
+                    converter = parsed.converter
                 var_list.append(var)
-                expr_list.append(expr)
+                expr_list.append(parsed.convert_body())
             else:
                 raise NotImplementedError("Unrecognized with-items expression: '{}'".
                                           format(expr_item))
@@ -572,17 +710,17 @@ class WorkflowConverter(object):
 
         # We need to save the list of expression variables for when we convert
         # item access to item() instead of ctx()
-        self.task_with_item_vars.extend(var_list)
+        task_ctx.item_vars.extend(var_list)
 
         return "{vars} in {wrapped_expr}".format(
             vars=', '.join(var_list),
             wrapped_expr=converter.wrap_expression(expr_list_string))
 
-    def convert_with_items(self, m_task_spec, expr_converter):
+    def convert_with_items(self, m_task_spec, expr_converter, task_ctx=None):
         with_items = m_task_spec['with-items']
 
         with_attr = {
-            'items': self.convert_with_items_expr(with_items, expr_converter),
+            'items': self.convert_with_items_expr(with_items, expr_converter, task_ctx),
         }
 
         if m_task_spec.get('concurrency'):
@@ -590,59 +728,94 @@ class WorkflowConverter(object):
 
             # Only try to convert the concurrency expression if it's a str
             if isinstance(concurrency_expr, six.string_types):
-                converter = expressions.ExpressionConverter.get_converter(concurrency_expr)
-                if converter:
-                    concurrency_expr = converter.unwrap_expression(concurrency_expr)
-                    concurrency_expr = converter.convert_string(concurrency_expr)
-                    concurrency_expr = converter.wrap_expression(concurrency_expr)
+                concurrency_expr = expressions.ExpressionConverter.parse(concurrency_expr).convert()
             with_attr['concurrency'] = concurrency_expr
 
         return with_attr
 
-    def convert_tasks(self, mistral_wf_tasks, expr_converter, wf_vars, force=False):
-        orquesta_wf_tasks = ruamel.yaml.comments.CommentedMap()
-        for task_name, m_task_spec in six.iteritems(mistral_wf_tasks):
-            # The variables in with-items expressions need to be accessed using
-            # the `item(var)` syntax, not the usual `ctx().var` syntax, so we
-            # use this list to keep track of which variables are within the
-            # task context
-            self.task_with_item_vars = []
-            o_task_spec = ruamel.yaml.comments.CommentedMap()
-            if force:
-                for attr in TASK_UNSUPPORTED_ATTRIBUTES:
-                    val = m_task_spec.get(attr)
-                    if val:
-                        o_task_spec[attr] = val
-            else:
-                for attr in TASK_UNSUPPORTED_ATTRIBUTES:
-                    if attr in m_task_spec:
-                        raise NotImplementedError(("Task '{}' contains an attribute '{}'"
-                                                   " that is not supported in orquesta.").
-                                                  format(task_name, attr))
+    def convert_task(self, task_name, m_task_spec, conversion_ctx):
+        task_ctx = conversion_ctx.task(task_name)
+        o_task_spec = ruamel.yaml.comments.CommentedMap()
+        if conversion_ctx.force:
+            for attr in TASK_UNSUPPORTED_ATTRIBUTES:
+                val = m_task_spec.get(attr)
+                if val:
+                    o_task_spec[attr] = val
+        else:
+            for attr in TASK_UNSUPPORTED_ATTRIBUTES:
+                if attr in m_task_spec:
+                    raise NotImplementedError(("Task '{}' contains an attribute '{}'"
+                                               " that is not supported in orquesta.").
+                                              format(task_name, attr))
 
-            if m_task_spec.get('with-items'):
-                o_task_spec['with'] = self.convert_with_items(m_task_spec, expr_converter)
+        if m_task_spec.get('with-items'):
+            o_task_spec['with'] = self.convert_with_items(m_task_spec, conversion_ctx.expr_converter,
+                                                          task_ctx)
 
-            if m_task_spec.get('action'):
-                o_task_spec['action'] = self.convert_action(m_task_spec['action'])
+        if m_task_spec.get('action'):
+            o_task_spec['action'] = self.convert_action(m_task_spec['action'], task_ctx)
 
-            if m_task_spec.get('retry'):
-                o_task_spec['retry'] = self.convert_retry(m_task_spec['retry'], task_name)
+        if m_task_spec.get('retry'):
+            o_task_spec['retry'] = self.convert_retry(m_task_spec['retry'], task_name)
 
-            if m_task_spec.get('join'):
-                o_task_spec['join'] = m_task_spec['join']
+        if m_task_spec.get('join'):
+            o_task_spec['join'] = m_task_spec['join']
 
-            if m_task_spec.get('input'):
-                o_task_spec['input'] = self.convert_input(m_task_spec['input'])
+        if m_task_spec.get('input'):
+            o_task_spec['input'] = self.convert_input(m_task_spec['input'], task_ctx)
 
-            o_task_transitions = self.convert_task_transitions(
-                task_name, m_task_spec, expr_converter, wf_vars)
-            o_task_spec.update(o_task_transitions)
+        o_task_transitions = self.convert_task_transitions(
+            task_name, m_task_spec, conversion_ctx.expr_converter, conversion_ctx.wf_vars,
+            conversions=conversion_ctx.conversions)
+        o_task_spec.update(o_task_transitions)
 
+        return o_task_spec
+
+    def convert_tasks(self, mistral_wf_tasks, expr_converter, wf_vars, force=False, jobs=1,
+                      conversions=None):
+        conversion_ctx = ConversionContext(expr_converter, wf_vars, force=force, conversions=conversions)
+        # Every task is converted on its own, so big workflows can be split
+        # up between worker processes, as long as we aren't one already
+        # (eg: converting a whole pack with pack_client.py --jobs)
+        parallel = jobs > 1 and len(mistral_wf_tasks) >= PARALLEL_TASKS_THRESHOLD
+        if parallel:
+            # Only import multiprocessing when we actually use it, it's one
+            # of the slower modules to import
+            import multiprocessing
+            parallel = not multiprocessing.current_process().daemon
+        if parallel:
+            o_tasks = self.convert_tasks_parallel(mistral_wf_tasks, conversion_ctx, jobs)
+        else:
+            o_tasks = ((task_name, self.convert_task(task_name, m_task_spec, conversion_ctx))
+                       for task_name, m_task_spec in six.iteritems(mistral_wf_tasks))
+
+        orquesta_wf_tasks = ruamel.yaml.comments.CommentedMap()
+        for task_name, o_task_spec in o_tasks:
             orquesta_wf_tasks[task_utils.translate_task_name(task_name)] = o_task_spec
 
         return orquesta_wf_tasks
 
+    def convert_tasks_parallel(self, mistral_wf_tasks, conversion_ctx, jobs):
+        # Yields (task_name, o_task_spec) in the same order as the tasks in
+        # the Mistral workflow
+        import multiprocessing
+        payload = (list(six.iteritems(mistral_wf_tasks)), conversion_ctx)
+        # Forked workers already have the tasks, otherwise they have to be
+        # pickled, which is slow for ruamel trees (and pickle would drop
+        # their comments)
+        if multiprocessing.get_start_method() != 'fork':
+            payload = yaml_utils.dumps_ruamel(payload)
+        chunks = [(start, start + TASK_CHUNK_SIZE)
+                  for start in range(0, len(mistral_wf_tasks), TASK_CHUNK_SIZE)]
+        pool = multiprocessing.Pool(jobs, init_task_worker, (payload,))
+        try:
+            for data in pool.imap(convert_task_chunk, chunks):
+                for item in yaml_utils.loads_ruamel(data):
+                    yield item
+        finally:
+            pool.terminate()
+            pool.join()
+
     def expr_type_converter(self, expr_type):
         if expr_type is None:
             expr_converter = jinja.JinjaExpressionConverter()
@@ -660,7 +833,66 @@ class WorkflowConverter(object):
             raise TypeError("Unknown expression class type: {}".format(type(expr_type)))
         return expr_converter
 
-    def convert(self, mistral_wf, expr_type=None, force=False):
+    def expression_keys(self, mistral_wf):
+        '''Yield (converter, expression, item_vars) for the expressions in mistral_wf
+
+        These are the expressions that convert() looks up in its conversions,
+        with the converter and item_vars it looks them up with, so that
+        expressions.convert_batch() of them gives the conversions for
+        convert(). Expressions that convert() takes apart before converting
+        them (with-items, retry, concurrency) are left out, as are the parts
+        that convert() rejects.
+        '''
+        for key in ('input', 'vars', 'output'):
+            for expr in expressions.iter_expression_strings(mistral_wf.get(key) or []):
+                yield (expressions.ExpressionConverter, expr, None)
+
+        for m_task_spec in six.itervalues(mistral_wf.get('tasks') or {}):
+            if not isinstance(m_task_spec, type_utils.dict_types):
+                continue
+
+            item_vars = []
+            with_items = m_task_spec.get('with-items')
+            for expr_item in (with_items if isinstance(with_items, list) else [with_items]):
+                m = WITH_ITEMS_EXPR_RGX.match(expr_item) if isinstance(expr_item, six.string_types) else None
+                if m:
+                    item_vars.append(m.group('var'))
+
+            m_action = m_task_spec.get('action')
+            if isinstance(m_action, six.string_types):
+                o_action = MISTRAL_ACTION_CONVERSION_TABLE.get(m_action, m_action)
+                if expressions.ExpressionConverter._delimiter_type(o_action):
+                    yield (mixed.MixedExpressionConverter, o_action, item_vars)
+
+            # the mixed converter leaves the keys of the input alone
+            for expr in expressions.iter_expression_strings(m_task_spec.get('input') or {}, keys=False):
+                yield (mixed.MixedExpressionConverter, expr, item_vars)
+
+            # publish blocks are only converted when a transition publishes
+            # them, or they may be published to the workflow output, see
+            # convert_task_transitions()
+            for key, m_transition_name in (('publish', 'on-success'), ('publish-on-error', 'on-error')):
+                if any([m_task_spec.get(m_transition_name),
+                        m_task_spec.get('on-complete'),
+                        mistral_wf.get('output')]):
+                    for expr in expressions.iter_expression_strings(m_task_spec.get(key) or {}):
+                        yield (expressions.ExpressionConverter, expr, None)
+
+            # the conditions of the transitions, see group_task_transitions()
+            for key in ('on-success', 'on-error', 'on-complete'):
+                transitions = m_task_spec.get(key)
+                if not isinstance(transitions, list):
+                    continue
+                for transition in transitions:
+                    if isinstance(transition, type_utils.dict_types):
+                        for expr in expressions.iter_expression_strings(list(transition.values())):
+                            yield (expressions.ExpressionConverter, expr, None)
+
+    def convert(self, mistral_wf, expr_type=None, force=False, jobs=1, conversions=None):
+        # jobs is the number of worker processes to convert the tasks of big
+        # workflows with, see PARALLEL_TASKS_THRESHOLD
+        # conversions are the expressions that were converted ahead of time,
+        # see expression_keys()
         variables_used_in_output = set()
         expr_converter = self.expr_type_converter(expr_type)
         orquesta_wf = ruamel.yaml.comments.CommentedMap()
@@ -687,14 +919,16 @@ class WorkflowConverter(object):
                                           format(mistral_wf['type']))
 
         if mistral_wf.get('input'):
-            orquesta_wf['input'] = expressions.ExpressionConverter.convert_list(mistral_wf['input'])
+            orquesta_wf['input'] = expressions.ExpressionConverter.convert_list(mistral_wf['input'],
+                                                                                conversions=conversions)
 
         if mistral_wf.get('vars'):
-            expression_vars = expressions.ExpressionConverter.convert_dict(mistral_wf['vars'])
+            expression_vars = expressions.ExpressionConverter.convert_dict(mistral_wf['vars'],
+                                                                           conversions=conversions)
             orquesta_wf['vars'] = self.dict_to_list(expression_vars)
 
         if mistral_wf.get('output'):
-            output = expressions.ExpressionConverter.convert_dict(mistral_wf['output'])
+            output = expressions.ExpressionConverter.convert_dict(mistral_wf['output'], conversions=conversions)
             orquesta_wf['output'] = self.dict_to_list(output)
 
             variables_used_in_output = self.extract_context_variables(output)
@@ -704,8 +938,24 @@ class WorkflowConverter(object):
                 mistral_wf['tasks'],
                 expr_converter,
                 variables_used_in_output,
-                force=force)
+                force=force,
+                jobs=jobs,
+                conversions=conversions)
             if o_tasks:
                 orquesta_wf['tasks'] = o_tasks
 
         return orquesta_wf
+
+    def convert_many(self, mistral_wfs, expr_type=None, force=False, threads=None):
+        # Convert several workflows with a pool of threads (one per CPU by
+        # default) sharing this converter, and return the Orquesta workflows
+        # in the same order. If any of them can't be converted, the first
+        # error is raised once the others are done.
+        import multiprocessing.pool
+        pool = multiprocessing.pool.ThreadPool(threads)
+        try:
+            return pool.map(lambda mistral_wf: self.convert(mistral_wf, expr_type, force=force),
+                            mistral_wfs)
+        finally:
+            pool.close()
+            pool.join()
@@ -16,6 +16,7 @@ import os
 import shutil
 import six
 import sys
+import tempfile
 import unittest2
 import yaml
 
@@ -156,6 +157,12 @@ class BasePackClientRunTestCase(BaseCLITestCase):
 
         self.maxDiff = None
 
+        # Keep conversion results cached by the pack client out of the
+        # user's cache directory, and away from other tests
+        self.cache_home = tempfile.mkdtemp()
+        self._orig_xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = self.cache_home
+
         if os.path.isdir(self.m_actions_dir):
             shutil.rmtree(self.m_actions_dir)
 
@@ -167,6 +174,12 @@ class BasePackClientRunTestCase(BaseCLITestCase):
         if os.path.isdir(self.m_actions_dir):
             shutil.rmtree(self.m_actions_dir)
 
+        shutil.rmtree(self.cache_home, ignore_errors=True)
+        if self._orig_xdg_cache_home is None:
+            os.environ.pop('XDG_CACHE_HOME', None)
+        else:
+            os.environ['XDG_CACHE_HOME'] = self._orig_xdg_cache_home
+
     def _hash_directory(self, directory, files):
         '''Hash files in a directory for comparison, returns a dictinary of hashes
 
@@ -13,12 +13,14 @@
 from __future__ import print_function
 
 import filecmp
+import json
 import os
 import six
 import sys
 
 from orquestaconvert import client
 from orquestaconvert import pack_client
+from orquestaconvert.utils import profile_utils
 
 from tests import base_test_case
 
@@ -80,8 +82,8 @@ class PackClientRunTestCase(base_test_case.BasePackClientRunTestCase):
                           .format(action_file=action_file, wf_file=wf_file),
                           out)
 
-    def test_partially_convert_pack(self):
-        args = ['-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)]
+    def test_partially_convert_pack(self, extra_args=None):
+        args = ['-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)] + (extra_args or [])
         result = self.pack_client.run(args, self.stdout, client=self.client)
 
         # Check the exit code
@@ -127,12 +129,26 @@ class PackClientRunTestCase(base_test_case.BasePackClientRunTestCase):
 
         self._validate_dirs(self.m_actions_dir, self.o_actions_dir)
 
-    def test_completely_convert_pack(self):
+    def test_partially_convert_pack_in_parallel(self):
+        self.test_partially_convert_pack(extra_args=['--jobs', '2'])
+
+    def test_partially_convert_pack_parallel_report_matches_serial(self):
+        self.test_partially_convert_pack()
+        serial_err = self.stderr.getvalue()
+
+        # Start over from the pristine actions
+        self.tearDown()
+        self.setUp()
+
+        self.test_partially_convert_pack(extra_args=['--jobs', '4'])
+        self.assertEqual(serial_err, self.stderr.getvalue())
+
+    def test_completely_convert_pack(self, extra_args=None):
         for afile in self.action_failing_files:
             os.remove(os.path.join(self.m_actions_dir, afile))
             os.remove(os.path.join(self.m_wfs_dir, afile))
 
-        args = ['-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)]
+        args = ['-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)] + (extra_args or [])
         result = self.pack_client.run(args, self.stdout, client=self.client)
 
         self.assertEqual(0, result)
@@ -148,6 +164,32 @@ class PackClientRunTestCase(base_test_case.BasePackClientRunTestCase):
 
         self._validate_dirs(self.m_actions_dir, self.o_actions_dir)
 
+    def test_completely_convert_pack_in_parallel(self):
+        self.test_completely_convert_pack(extra_args=['--jobs', '2'])
+
+    def test_convert_pack_profile_phases(self):
+        for afile in self.action_failing_files:
+            os.remove(os.path.join(self.m_actions_dir, afile))
+            os.remove(os.path.join(self.m_wfs_dir, afile))
+
+        args = ['--no-cache', '--jobs', '2', '--profile-phases', '--profile-format=json',
+                '-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(0, result)
+
+        # The timings of every workflow came back from the worker processes
+        profile = json.loads(self.stderr.getvalue())
+        self.assertEqual(sorted(profile['files'].keys()),
+                         sorted(os.path.join(self.m_wfs_dir, wf) for wf in self.action_passing_files))
+        for timings in profile['files'].values():
+            self.assertEqual(list(timings.keys()), profile_utils.PHASES)
+        self.assertEqual(profile['summary']['total']['count'], len(self.action_passing_files))
+        # and so did the expression cache counters
+        self.assertGreater(profile['counters'][profile_utils.EXPRESSION_CACHE_HITS], 0)
+
+        self._validate_dirs(self.m_actions_dir, self.o_actions_dir)
+
     def test_validate_nothing(self):
         args = ['--validate', '--actions-dir={}'.format(self.m_actions_dir)]
         result = self.pack_client.run(args, self.stdout, client=self.client)
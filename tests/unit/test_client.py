@@ -10,9 +10,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import mock
 
 from orquestaconvert import client
+from orquestaconvert.utils import profile_utils
+from orquestaconvert.utils import yaml_utils
 
 from tests import base_test_case
 
@@ -62,9 +65,54 @@ class TestClient(base_test_case.BaseCLITestCase):
                             'nasa_apod_twitter_post_yaql.yaml',
                             'nasa_apod_twitter_post_yaql.yaml')
 
+    def test_run_profile_phases(self):
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        client.Client().run(['--profile-phases', '--profile-format=json', fixture_path], self.stdout)
+
+        # the converted workflow is unchanged, the timings go to stderr
+        self.assertEqual(self.stdout.getvalue(),
+                         self.get_fixture_content('orquesta/nasa_apod_twitter_post.yaml'))
+        profile = json.loads(self.stderr.getvalue())
+        self.assertEqual(list(profile['files'].keys()), [fixture_path])
+        self.assertEqual(list(profile['files'][fixture_path].keys()), profile_utils.PHASES)
+
+    def test_run_profile_phases_table(self):
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        client.Client().run(['--profile-phases', fixture_path], self.stdout)
+
+        lines = self.stderr.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('file (ms)'))
+        self.assertTrue(lines[1].startswith(fixture_path))
+        self.assertEqual([line.split()[0] for line in lines[3:7]], ['p50', 'p95', 'max', 'total'])
+        self.assertTrue(lines[-2].startswith(profile_utils.EXPRESSION_CACHE_HITS))
+        self.assertTrue(lines[-1].startswith(profile_utils.EXPRESSION_CACHE_MISSES))
+
     def test_validate_workflow_spec_raises(self):
         wf_spec = mock.MagicMock()
         wf_spec.inspect_syntax.return_value = "some error string"
 
         with self.assertRaises(ValueError):
             self.client.validate_workflow_spec(wf_spec)
+
+    def test_convert_file_emits_once(self):
+        self.client.args = self.client.parser().parse_args(['file.yaml'])
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+
+        with mock.patch.object(yaml_utils, 'obj_to_yaml',
+                               wraps=yaml_utils.obj_to_yaml) as obj_to_yaml, \
+                mock.patch.object(yaml_utils, 'yaml_to_obj',
+                                  wraps=yaml_utils.yaml_to_obj) as yaml_to_obj:
+            result = self.client.convert_file(fixture_path)
+
+        self.assertEqual(obj_to_yaml.call_count, 1)
+        self.assertEqual(yaml_to_obj.call_count, 0)
+        self.assertEqual(result, self.get_fixture_content('orquesta/nasa_apod_twitter_post.yaml'))
+
+    def test_write_converted_file(self):
+        self.client.args = self.client.parser().parse_args(['file.yaml'])
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+
+        self.client.write_converted_file(fixture_path, self.stdout)
+
+        self.assertEqual(self.stdout.getvalue(),
+                         self.get_fixture_content('orquesta/nasa_apod_twitter_post.yaml'))
@@ -10,11 +10,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import mock
+import random
 import re
+import ruamel.yaml.scalarstring
+import six
+import sys
+
+import orquesta.expressions.base
 
 from orquestaconvert import expressions
 from orquestaconvert.expressions import jinja
+from orquestaconvert.expressions import mixed
 from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.expressions import yaql_tokens
 
 from tests import base_test_case
 
@@ -90,6 +99,31 @@ class TestExpressions(base_test_case.BaseTestCase):
         result = expressions.ExpressionConverter.expression_type(expr)
         self.assertIsNone(result)
 
+    def test_expression_type_plain_string_skips_evaluators(self):
+        with mock.patch.object(orquesta.expressions.base, 'get_evaluators') as get_evaluators:
+            for expr in ['test', 'a {b} c', '50%', 'x < y', '{ "a": 1 }']:
+                self.assertIsNone(expressions.ExpressionConverter.expression_type(expr))
+            self.assertEqual(get_evaluators.call_count, 0)
+
+    def test_expression_type_unclosed(self):
+        for expr in ['{{ _.test', '{% if', '<% $.test', '{{ _.a\n }}', '<% $.a %']:
+            self.assertIsNone(expressions.ExpressionConverter.expression_type(expr), expr)
+
+    def test_expression_type_matches_evaluators(self):
+        def _expression_type(expr):
+            # The original implementation, asking every evaluator
+            for name, evaluator in six.iteritems(orquesta.expressions.base.get_evaluators()):
+                if evaluator.has_expressions(str(expr)):
+                    return name
+            return None
+
+        fragments = ['{{', '}}', '{%', '%}', '<%', '%>', '{', '}', '<', '%', '_.x', ' ', '\n']
+        rnd = random.Random(0)
+        for _ in range(2000):
+            expr = ''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 8)))
+            self.assertEqual(expressions.ExpressionConverter.expression_type(expr),
+                             _expression_type(expr), repr(expr))
+
     def test_get_converter_jinja(self):
         expr = "{{ _.test }}"
         result = expressions.ExpressionConverter.get_converter(expr)
@@ -120,6 +154,47 @@ class TestExpressions(base_test_case.BaseTestCase):
         result = expressions.ExpressionConverter.unwrap_expression(expr)
         self.assertEqual(result, 'test')
 
+    def test_parse_jinja(self):
+        parsed = expressions.ExpressionConverter.parse("a {{ _.test }} b\n{{ _.other }}")
+        self.assertEqual(parsed.dialect, 'jinja')
+        self.assertIs(parsed.converter, jinja.JinjaExpressionConverter)
+        self.assertEqual(parsed.spans, [(2, 14), (17, 30)])
+        self.assertEqual(parsed.body, "a _.test b\n_.other")
+        self.assertEqual(parsed.convert(), "{{ a ctx().test b\nctx().other }}")
+
+    def test_parse_yaql(self):
+        parsed = expressions.ExpressionConverter.parse("<% $.test %>")
+        self.assertEqual(parsed.dialect, 'yaql')
+        self.assertEqual(parsed.spans, [(0, 12)])
+        self.assertEqual(parsed.body, "$.test")
+        self.assertEqual(parsed.convert_body(item_vars=['test']), "item(test)")
+        self.assertEqual(parsed.wrap('succeeded()'), "<% succeeded() %>")
+
+    def test_parse_none(self):
+        parsed = expressions.ExpressionConverter.parse("test")
+        self.assertIsNone(parsed.dialect)
+        self.assertIsNone(parsed.converter)
+        self.assertEqual(parsed.spans, [])
+        self.assertEqual(parsed.body, "test")
+        self.assertEqual(parsed.convert(), "test")
+
+    def test_parse_nothing_to_unwrap(self):
+        parsed = expressions.ExpressionConverter.parse("{% if _.test %}x{% endif %}")
+        self.assertEqual(parsed.dialect, 'jinja')
+        self.assertEqual(parsed.spans, [])
+        self.assertEqual(parsed.body, "{% if _.test %}x{% endif %}")
+
+    def test_parse_matches_unwrap(self):
+        fragments = ['{{', '}}', '{%', '%}', '<%', '%>', '_.x', '$.y', ' ', '\n']
+        rnd = random.Random(0)
+        for _ in range(2000):
+            expr = ''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 8)))
+            parsed = expressions.ExpressionConverter.parse(expr)
+            converter = expressions.ExpressionConverter.get_converter(expr)
+            self.assertIs(parsed.converter, converter, repr(expr))
+            expected = converter.unwrap_expression(expr) if converter else expr
+            self.assertEqual(parsed.body, expected, repr(expr))
+
     def test_convert_dict(self):
         expr = {
             "jinja_str": "{{ _.test_jinja }}",
@@ -220,3 +295,231 @@ class TestExpressions(base_test_case.BaseTestCase):
         expr = "<% $.test %>"
         result = expressions.ExpressionConverter.convert_string(expr)
         self.assertEqual(result, "<% ctx().test %>")
+
+
+class TestConvertTree(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def _tree(self):
+        return {
+            "static": {"a": [1, 2, {"b": "plain"}], "c": None},
+            "dynamic": ["x", {"d": "{{ _.d }}"}],
+            "{{ _.key }}": True,
+        }
+
+    def test_convert_deeply_nested(self):
+        expr = "{{ _.leaf }}"
+        for _ in range(sys.getrecursionlimit() * 2):
+            expr = {"nested": [expr]}
+        result = expressions.ExpressionConverter.convert(expr)
+        for _ in range(sys.getrecursionlimit() * 2):
+            result = result["nested"][0]
+        self.assertEqual(result, "{{ ctx().leaf }}")
+
+    def test_copy(self):
+        tree = self._tree()
+        result = expressions.ExpressionConverter.convert(tree)
+        self.assertEqual(result, {
+            "static": {"a": [1, 2, {"b": "plain"}], "c": None},
+            "dynamic": ["x", {"d": "{{ ctx().d }}"}],
+            "{{ ctx().key }}": True,
+        })
+        self.assertIsInstance(result["static"], ruamel.yaml.comments.CommentedMap)
+        self.assertIsNot(result["static"], tree["static"])
+        self.assertIsNot(result["static"]["a"], tree["static"]["a"])
+        self.assertEqual(tree, self._tree())
+
+    def test_copy_on_write(self):
+        tree = self._tree()
+        result = expressions.ExpressionConverter.convert(tree, copy_mode=expressions.COPY_ON_WRITE)
+        self.assertEqual(result, expressions.ExpressionConverter.convert(self._tree()))
+        self.assertIs(result["static"], tree["static"])
+        self.assertIsNot(result["dynamic"], tree["dynamic"])
+        self.assertIsNot(result["dynamic"][1], tree["dynamic"][1])
+        self.assertEqual(tree, self._tree())
+
+    def test_copy_on_write_unchanged(self):
+        tree = self._tree()
+        del tree["dynamic"]
+        del tree["{{ _.key }}"]
+        result = expressions.ExpressionConverter.convert(tree, copy_mode=expressions.COPY_ON_WRITE)
+        self.assertIs(result, tree)
+
+    def test_in_place(self):
+        tree = self._tree()
+        tree["last"] = "<% $.last %>"
+        dynamic = tree["dynamic"]
+        result = expressions.ExpressionConverter.convert(tree, copy_mode=expressions.IN_PLACE)
+        self.assertIs(result, tree)
+        self.assertIs(result["dynamic"], dynamic)
+        self.assertEqual(dynamic, ["x", {"d": "{{ ctx().d }}"}])
+        # renamed keys stay where they were
+        self.assertEqual(list(result.keys()), ["static", "dynamic", "{{ ctx().key }}", "last"])
+        self.assertEqual(result["last"], "<% ctx().last %>")
+
+    def test_mixed_copy_on_write(self):
+        tree = self._tree()
+        result = mixed.MixedExpressionConverter.convert(tree, item_vars=['d'],
+                                                        copy_mode=expressions.COPY_ON_WRITE)
+        self.assertIs(result["static"], tree["static"])
+        self.assertEqual(result["dynamic"], ["x", {"d": "{{ item(d) }}"}])
+        # mixed expressions don't convert keys
+        self.assertIn("{{ _.key }}", result)
+
+    def test_unknown_copy_mode(self):
+        with self.assertRaises(ValueError):
+            expressions.ExpressionConverter.convert({}, copy_mode='deep')
+
+
+class TestExpressionCache(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(TestExpressionCache, self).setUp()
+        expressions.EXPRESSION_CACHE.clear()
+
+    def tearDown(self):
+        super(TestExpressionCache, self).tearDown()
+        expressions.EXPRESSION_CACHE.enabled = True
+        expressions.EXPRESSION_CACHE.clear()
+
+    def test_convert_string_cached(self):
+        for _ in range(3):
+            result = expressions.ExpressionConverter.convert_string('<% $.test %>')
+            self.assertEqual(result, '<% ctx().test %>')
+
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_convert_string_cache_key_item_vars(self):
+        converter = expressions.ExpressionConverter
+        self.assertEqual(converter.convert_string('{{ _.test }}', item_vars=['test']),
+                         '{{ item(test) }}')
+        self.assertEqual(converter.convert_string('{{ _.test }}'), '{{ ctx().test }}')
+        self.assertEqual(converter.convert_string('{{ _.test }}', item_vars=('test',)),
+                         '{{ item(test) }}')
+
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_convert_string_cache_key_type(self):
+        quoted = ruamel.yaml.scalarstring.DoubleQuotedScalarString('literal')
+
+        self.assertIs(type(expressions.ExpressionConverter.convert_string('literal')), str)
+        self.assertIs(expressions.ExpressionConverter.convert_string(quoted), quoted)
+
+    def test_convert_string_cache_key_converters(self):
+        expr = "<% 'mytask(x).result' + $.a %>"
+        self.assertEqual(expressions.ExpressionConverter.convert_string(expr),
+                         "<% 'myresult()' + ctx().a %>")
+
+        with mock.patch.dict(expressions.CONVERTERS, {'yaql': yaql_tokens.YaqlTokenExpressionConverter}):
+            self.assertEqual(expressions.ExpressionConverter.convert_string(expr),
+                             "<% 'mytask(x).result' + ctx().a %>")
+
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 2))
+
+    def test_mixed_convert_string_cached(self):
+        expr = '{{ _.a }} and <% $.b %>'
+        for _ in range(2):
+            self.assertEqual(mixed.MixedExpressionConverter.convert_string(expr),
+                             '{{ ctx().a }} and <% ctx().b %>')
+
+        # the mixed converter and the expression converter don't share entries
+        expressions.ExpressionConverter.convert_string(expr)
+
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 2))
+
+    def test_disabled(self):
+        expressions.EXPRESSION_CACHE.enabled = False
+        for _ in range(2):
+            self.assertEqual(expressions.ExpressionConverter.convert_string('<% $.test %>'),
+                             '<% ctx().test %>')
+
+        self.assertEqual(len(expressions.EXPRESSION_CACHE), 0)
+
+    def test_convert_many(self):
+        strings = ['<% $.a %>', '{{ _.b }}', 'literal', '<% $.a %>', '{{ _.b }}']
+        with mock.patch.object(jinja.JinjaExpressionConverter, 'convert_string',
+                               wraps=jinja.JinjaExpressionConverter.convert_string) as convert_string:
+            converted = expressions.ExpressionConverter.convert_many(strings)
+
+        self.assertEqual(converted, {
+            '<% $.a %>': '<% ctx().a %>',
+            '{{ _.b }}': '{{ ctx().b }}',
+            'literal': 'literal',
+        })
+        self.assertEqual(convert_string.call_count, 1)
+
+        # and converting them again is served from the cache
+        self.assertEqual(expressions.ExpressionConverter.convert_string('<% $.a %>'), '<% ctx().a %>')
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_convert_many_item_vars(self):
+        converted = expressions.ExpressionConverter.convert_many(['{{ _.a }}'], item_vars=['a'])
+        self.assertEqual(converted, {'{{ _.a }}': '{{ item(a) }}'})
+
+    def test_convert_many_dialect(self):
+        converted = expressions.ExpressionConverter.convert_many(['$.a', '_.b'], dialect='yaql')
+        self.assertEqual(converted, {'$.a': 'ctx().a', '_.b': '_.b'})
+
+    def test_convert_many_unknown_dialect(self):
+        with self.assertRaises(TypeError):
+            expressions.ExpressionConverter.convert_many(['$.a'], dialect='python')
+
+    def test_convert_batch(self):
+        entries = [
+            (expressions.ExpressionConverter, '<% $.a %>', None),
+            (expressions.ExpressionConverter, '<% $.a %>', ['a']),
+            (mixed.MixedExpressionConverter, '<% $.a %>', ('a',)),
+            (expressions.ExpressionConverter, '<% $.a %>', []),
+        ]
+        conversions = expressions.convert_batch(entries)
+
+        self.assertEqual(sorted(conversions.values()), ['<% ctx().a %>', '<% item(a) %>', '<% item(a) %>'])
+        self.assertEqual(conversions[expressions.expression_cache_key(mixed.MixedExpressionConverter,
+                                                                      '<% $.a %>', ['a'])],
+                         '<% item(a) %>')
+
+    def test_convert_string_conversions(self):
+        key = expressions.expression_cache_key(expressions.ExpressionConverter, '<% $.a %>', ['a'])
+        conversions = {key: 'converted elsewhere'}
+        converter = expressions.ExpressionConverter
+
+        self.assertEqual(converter.convert_string('<% $.a %>', item_vars=['a'], conversions=conversions),
+                         'converted elsewhere')
+        # with other item_vars, or another converter, the result doesn't apply
+        self.assertEqual(converter.convert_string('<% $.a %>', conversions=conversions), '<% ctx().a %>')
+        self.assertEqual(mixed.MixedExpressionConverter.convert_string('<% $.a %>', item_vars=['a'],
+                                                                       conversions=conversions),
+                         '<% item(a) %>')
+        # and the conversions are passed down to every scalar of a tree
+        self.assertEqual(converter.convert_dict({'x': ['<% $.a %>']}, item_vars=['a'], conversions=conversions),
+                         {'x': ['converted elsewhere']})
+
+        # the results from the conversions never went through the cache
+        stats = expressions.EXPRESSION_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['entries']), (0, 3))
+
+    def test_convert_string_conversions_cache_disabled(self):
+        expressions.EXPRESSION_CACHE.enabled = False
+        key = expressions.expression_cache_key(expressions.ExpressionConverter, '<% $.a %>')
+        conversions = {key: 'converted elsewhere'}
+
+        self.assertEqual(expressions.ExpressionConverter.convert_string('<% $.a %>', conversions=conversions),
+                         'converted elsewhere')
+        self.assertEqual(expressions.ExpressionConverter.convert_string('<% $.b %>', conversions=conversions),
+                         '<% ctx().b %>')
+
+    def test_iter_expression_strings(self):
+        tree = [
+            {'<% $.key %>': ['literal', '{{ _.a }}', {'b': '<% $.b %>'}, 1, None]},
+            {'c': '{{ _.a }}'},
+        ]
+        self.assertEqual(list(expressions.iter_expression_strings(tree)),
+                         ['<% $.key %>', '{{ _.a }}', '<% $.b %>', '{{ _.a }}'])
+        self.assertEqual(list(expressions.iter_expression_strings(tree, keys=False)),
+                         ['{{ _.a }}', '<% $.b %>', '{{ _.a }}'])
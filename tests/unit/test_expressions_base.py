@@ -10,7 +10,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
+
 from orquestaconvert.expressions import base as expr_base
+from orquestaconvert.expressions import jinja
+from orquestaconvert.expressions import yaql as yql
 
 from tests import base_test_case
 
@@ -69,3 +73,69 @@ class BaseExpressionsTestCase(base_test_case.BaseTestCase):
     def test_convert_static_context_vars_raises(self):
         with self.assertRaises(NotImplementedError):
             expr_base.BaseExpressionConverter.convert_context_vars('junk')
+
+
+def convert_string_sequential(converter, expr, **kwargs):
+    # The original implementation of BaseExpressionConverter.convert_string(),
+    # one full pass over the expression per conversion
+    expr = converter.convert_context_vars(expr, **kwargs)
+    expr = converter.convert_task_result(expr)
+    expr = converter.convert_st2kv(expr)
+    expr = converter.convert_st2_execution_id(expr)
+    expr = converter.convert_st2_api_url(expr)
+    return expr
+
+
+# Building blocks for the fuzz test: things that should be converted, things
+# that look like them but should be left alone, and plain expression syntax
+FUZZ_TOKENS = [
+    '_.foo', '_.bar_baz', '_.test_.other', '_.item', '_.x1', 'a_.b', '__.c', '_',
+    '$.foo', '$.bar_baz', '$.item', '$.x1', '$', '$$.y',
+    "task('abc').result", 'task("abc").result.x', 'task(abc).result', "task('a b').result",
+    'task().result', 'st2kv.system.a.b', 'st2kv.user.x', 'st2kv', 'xst2kv.y',
+    'env().st2_execution_id', 'env().st2_execution_idx', 'xenv().st2_execution_id',
+    'env().st2_action_api_url', 'env()xst2_action_api_url', 'env()',
+    'result()', 'ctx().foo', 'item(foo)', 'foo', 'len', '1', "'str'", '"_.quoted"',
+]
+FUZZ_SEPARATORS = [' ', ' + ', ', ', ' == ', '(', ')', '[', ']', ' | ', ' and ', ': ']
+
+
+class ConvertStringEquivalenceTestCase(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def _assert_equivalent(self, converter, seed):
+        rnd = random.Random(seed)
+        for _ in range(500):
+            parts = []
+            for _ in range(rnd.randint(1, 12)):
+                parts.append(rnd.choice(FUZZ_TOKENS))
+                parts.append(rnd.choice(FUZZ_SEPARATORS))
+            expr = ''.join(parts)
+            item_vars = rnd.sample(['foo', 'item', 'x1', 'bar_baz'], rnd.randint(0, 2))
+
+            self.assertEqual(converter.convert_string(expr, item_vars=item_vars),
+                             convert_string_sequential(converter, expr, item_vars=item_vars),
+                             expr)
+
+    def test_jinja_matches_sequential(self):
+        self._assert_equivalent(jinja.JinjaExpressionConverter, 1)
+
+    def test_yaql_matches_sequential(self):
+        self._assert_equivalent(yql.YaqlExpressionConverter, 2)
+
+    def test_single_pass(self):
+        expr = ("_.a + $.b + task('t').result + st2kv.system.c + "
+                "env().st2_execution_id + env().st2_action_api_url")
+        self.assertEqual(jinja.JinjaExpressionConverter.convert_string(expr, item_vars=['a']),
+                         "item(a) + $.b + result() + st2kv('system.c') + "
+                         "ctx().st2.action_execution_id + ctx().st2.api_url")
+        self.assertEqual(yql.YaqlExpressionConverter.convert_string(expr),
+                         "_.a + ctx().b + result() + st2kv('system.c') + "
+                         "ctx().st2.action_execution_id + ctx().st2.api_url")
+
+    def test_scanner_is_compiled_once_per_converter(self):
+        jinja_scanner = jinja.JinjaExpressionConverter._get_scanner()
+        yaql_scanner = yql.YaqlExpressionConverter._get_scanner()
+
+        self.assertIs(jinja.JinjaExpressionConverter._get_scanner(), jinja_scanner)
+        self.assertIsNot(jinja_scanner, yaql_scanner)
@@ -0,0 +1,110 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import mock
+import os
+import re
+import six
+
+from orquestaconvert.expressions import jinja
+from orquestaconvert.expressions import jinja_tokens
+from orquestaconvert.utils import yaml_utils
+
+from tests import base_test_case
+from tests.unit import test_expressions_jinja
+
+
+class TestExpressionsJinjaTokensEquivalence(test_expressions_jinja.TestExpressionsJinja):
+    __test__ = True
+
+    converter = jinja_tokens.JinjaTokenExpressionConverter
+
+
+class TestExpressionsJinjaTokens(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(TestExpressionsJinjaTokens, self).setUp()
+        jinja_tokens.PLAN_CACHE.clear()
+
+    def tearDown(self):
+        jinja_tokens.PLAN_CACHE.clear()
+        super(TestExpressionsJinjaTokens, self).tearDown()
+
+    def assertConverted(self, expr, expected, **kwargs):
+        result = jinja_tokens.JinjaTokenExpressionConverter.convert_string(expr, **kwargs)
+        self.assertEqual(result, expected)
+
+    def test_convert_unwrapped(self):
+        self.assertConverted("_.test + _.test2", "item(test) + ctx().test2", item_vars=['test'])
+
+    def test_convert_keeps_formatting(self):
+        self.assertConverted("{{  _.hosts|join(',')   ~ st2kv.system.a }}",
+                             "{{  ctx().hosts|join(',')   ~ st2kv('system.a') }}")
+
+    def test_convert_skips_string_literals(self):
+        self.assertConverted("{{ _.x ~ '_.y' ~ \"task('a').result st2kv.b\" }}",
+                             "{{ ctx().x ~ '_.y' ~ \"task('a').result st2kv.b\" }}")
+
+    def test_convert_skips_text_outside_of_blocks(self):
+        self.assertConverted("_.x is {{ _.x }}", "_.x is {{ ctx().x }}")
+
+    def test_convert_statements(self):
+        self.assertConverted("{% for i in _.items %}{{ i }}{% endfor %}",
+                             "{% for i in ctx().items %}{{ i }}{% endfor %}")
+
+    def test_convert_skips_longer_names(self):
+        self.assertConverted("{{ mytask('a').result ~ task('a').results ~ my_st2kv.x ~ a_.x }}",
+                             "{{ mytask('a').result ~ task('a').results ~ my_st2kv.x ~ a_.x }}")
+
+    def test_convert_st2kv_stops_at_method_call(self):
+        self.assertConverted("{{ st2kv.system.hosts.split(',') }}",
+                             "{{ st2kv('system.hosts').split(',') }}")
+
+    def test_convert_falls_back_to_regexes(self):
+        # '?' isn't Jinja, so this can't be tokenized
+        expr = "{{ _.test ? _.other }}"
+        self.assertIsNone(jinja_tokens.JinjaTokenExpressionConverter.get_plan(expr))
+        self.assertConverted(expr, "{{ ctx().test ? ctx().other }}")
+
+    def test_plan_cached(self):
+        with mock.patch.object(jinja_tokens.JinjaTokenExpressionConverter, 'tokenize',
+                               wraps=jinja_tokens.JinjaTokenExpressionConverter.tokenize) as tokenize:
+            self.assertConverted("{{ _.a + _.b }}", "{{ ctx().a + item(b) }}", item_vars=['b'])
+            self.assertConverted("{{ _.a + _.b }}", "{{ item(a) + ctx().b }}", item_vars=['a'])
+            self.assertEqual(tokenize.call_count, 1)
+
+    def test_fixtures_match_regex_converter(self):
+        exprs = set()
+
+        def _collect(obj):
+            if isinstance(obj, dict):
+                for key, value in six.iteritems(obj):
+                    _collect(key)
+                    _collect(value)
+            elif isinstance(obj, list):
+                for value in obj:
+                    _collect(value)
+            elif isinstance(obj, six.string_types):
+                exprs.update(m.group(0) for m in re.finditer(r'{{.*?}}|{%.*?%}', obj))
+
+        mistral_dir = os.path.join(self.get_fixture_path('mistral'), '*.yaml')
+        for filename in glob.glob(mistral_dir):
+            _collect(yaml_utils.read_yaml(filename)[0])
+
+        self.assertTrue(exprs)
+        for expr in exprs:
+            self.assertEqual(
+                jinja_tokens.JinjaTokenExpressionConverter.convert_string(expr, item_vars=['i']),
+                jinja.JinjaExpressionConverter.convert_string(expr, item_vars=['i']),
+                expr)
@@ -10,6 +10,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import random
 import re
 
 from orquestaconvert.expressions import mixed
@@ -102,3 +103,28 @@ class TestExpressionsMixed(base_test_case.BaseTestCase):
         with self.assertWarnsRegex(SyntaxWarning, expected_warning_regex):
             result = mixed.MixedExpressionConverter.convert(expr_obj)
         self.assertEqual(result, expr_obj)
+
+    def test_convert_string_nested(self):
+        s = "<% $.a + '{{ _.b }}' %> {{ _.c }}"
+        result = mixed.MixedExpressionConverter.convert(s)
+        self.assertEqual(result, "<% ctx().a + '{{ _.b }}' %> {{ ctx().c }}")
+
+    def test_convert_string_matches_sequential(self):
+        def _convert_sequential(expr):
+            # The original implementation, converting all of the Jinja
+            # expressions and then all of the YAQL expressions
+            def _inner_convert_string(match):
+                return mixed.MixedExpressionConverter.convert_string_containing_expressions(
+                    match, item_vars=['x'])
+            expr = mixed.JINJA_EXPR_RGX.sub(_inner_convert_string, expr)
+            return mixed.YAQL_EXPR_RGX.sub(_inner_convert_string, expr)
+
+        # no fragment can turn into a delimiter next to another one, and
+        # expressions don't nest
+        fragments = ['{{ _.x }}', '{{_.y + _.x}}', '<% $.x %>', '<%$.y%>', 'action ', ' ',
+                     '\n', '_.x', '$.y', '}}', '%>', '{ "a": 1 }']
+        rnd = random.Random(0)
+        for _ in range(2000):
+            expr = ''.join(rnd.choice(fragments) for _ in range(rnd.randint(0, 8)))
+            self.assertEqual(mixed.MixedExpressionConverter.convert_string(expr, item_vars=['x']),
+                             _convert_sequential(expr), repr(expr))
@@ -0,0 +1,155 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import mock
+import os
+import re
+import six
+
+from orquestaconvert import expressions
+from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.expressions import yaql_tokens
+from orquestaconvert.utils import yaml_utils
+
+from tests import base_test_case
+
+
+class TestExpressionsYaqlTokens(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(TestExpressionsYaqlTokens, self).setUp()
+        yaql_tokens.PLAN_CACHE.clear()
+
+    def tearDown(self):
+        yaql_tokens.PLAN_CACHE.clear()
+        super(TestExpressionsYaqlTokens, self).tearDown()
+
+    def assertConverted(self, expr, expected, **kwargs):
+        result = yaql_tokens.YaqlTokenExpressionConverter.convert_string(expr, **kwargs)
+        self.assertEqual(result, expected)
+
+    def test_convert_context_vars(self):
+        self.assertConverted("$.test", "ctx().test")
+
+    def test_convert_context_and_item_vars(self):
+        self.assertConverted("$.test + $.test2 - $.long_var",
+                             "item(test) + ctx().test2 - ctx().long_var",
+                             item_vars=['test'])
+
+    def test_convert_function_context_vars(self):
+        self.assertConverted("zip([0, 1, 2], [3, 4, 5], $.all_the_things)",
+                             "zip([0, 1, 2], [3, 4, 5], ctx().all_the_things)")
+
+    def test_convert_task_result(self):
+        self.assertConverted("task(create_vm).result.id", "result().id")
+        self.assertConverted("task('create_vm').result.id", "result().id")
+
+    def test_convert_st2kv(self):
+        self.assertConverted("st2kv.system.vsphere.datacenter",
+                             "st2kv('system.vsphere.datacenter')")
+
+    def test_convert_st2_env(self):
+        self.assertConverted("env().st2_execution_id + env().st2_action_api_url",
+                             "ctx().st2.action_execution_id + ctx().st2.api_url")
+
+    def test_convert_keeps_formatting(self):
+        self.assertConverted("$.data.where($.status  =  'ok').select( $.name )",
+                             "ctx().data.where(ctx().status  =  'ok').select( ctx().name )")
+
+    def test_convert_skips_string_literals(self):
+        self.assertConverted("$.x + '$.y' + \"task(a).result st2kv.b\"",
+                             "ctx().x + '$.y' + \"task(a).result st2kv.b\"")
+
+    def test_convert_skips_longer_names(self):
+        self.assertConverted("mytask(a).result + task(a).results + my_st2kv.x",
+                             "mytask(a).result + task(a).results + my_st2kv.x")
+
+    def test_convert_st2kv_stops_at_method_call(self):
+        self.assertConverted("st2kv.system.hosts.where($ != null)",
+                             "st2kv('system.hosts').where($ != null)")
+
+    def test_convert_falls_back_to_regexes(self):
+        # '|' isn't YAQL, so this can't be tokenized
+        expr = "$.operations|length"
+        self.assertIsNone(yaql_tokens.YaqlTokenExpressionConverter.get_plan(expr))
+        self.assertConverted(expr, "ctx().operations|length")
+
+    def test_convert_wrapped(self):
+        self.assertConverted("<% 'mytask(x).result' + $.a %>",
+                             "<% 'mytask(x).result' + ctx().a %>")
+
+    def test_convert_wrapped_blocks(self):
+        # each block is tokenized on its own, and the text around them isn't YAQL
+        self.assertConverted("$.x is <% $.a + $.i %> and <%task(t).result%>",
+                             "$.x is <% ctx().a + item(i) %> and <%result()%>",
+                             item_vars=['i'])
+
+    def test_convert_wrapped_falls_back_to_regexes(self):
+        expr = "<% $.a %> <% $.operations|length %>"
+        self.assertIsNone(yaql_tokens.YaqlTokenExpressionConverter.get_plan(expr))
+        self.assertConverted(expr, "<% ctx().a %> <% ctx().operations|length %>")
+
+    def test_expression_converter_uses_ast_converter(self):
+        converter = expressions.ExpressionConverter
+        with mock.patch.dict(expressions.CONVERTERS, {'yaql': yaql_tokens.YaqlTokenExpressionConverter}):
+            self.assertEqual(converter.convert_string("<% 'mytask(x).result' + $.a %>"),
+                             "<% 'mytask(x).result' + ctx().a %>")
+            self.assertEqual(converter.convert_string("<% st2kv.system.x %> and <% $.i %>", item_vars=['i']),
+                             "<% st2kv('system.x') %> and <% item(i) %>")
+
+    def test_plan_cached(self):
+        with mock.patch.object(yaql_tokens.YaqlTokenExpressionConverter, 'tokenize',
+                               wraps=yaql_tokens.YaqlTokenExpressionConverter.tokenize) as tokenize:
+            self.assertConverted("$.a + $.b", "ctx().a + item(b)", item_vars=['b'])
+            self.assertConverted("$.a + $.b", "item(a) + ctx().b", item_vars=['a'])
+            self.assertEqual(tokenize.call_count, 1)
+
+    def test_fixtures_match_regex_converter(self):
+        bodies = set()
+        wrapped = set()
+
+        def _collect(obj):
+            if isinstance(obj, dict):
+                for key, value in six.iteritems(obj):
+                    _collect(key)
+                    _collect(value)
+            elif isinstance(obj, list):
+                for value in obj:
+                    _collect(value)
+            elif isinstance(obj, six.string_types):
+                matches = list(re.finditer(r'<%(.*?)%>', obj))
+                bodies.update(m.group(1).strip() for m in matches)
+                if matches:
+                    wrapped.add(obj)
+
+        mistral_dir = os.path.join(self.get_fixture_path('mistral'), '*.yaml')
+        for filename in glob.glob(mistral_dir):
+            _collect(yaml_utils.read_yaml(filename)[0])
+
+        self.assertTrue(bodies)
+        for body in bodies:
+            self.assertEqual(
+                yaql_tokens.YaqlTokenExpressionConverter.convert_string(body, item_vars=['i']),
+                yql.YaqlExpressionConverter.convert_string(body, item_vars=['i']),
+                body)
+
+        # and the same through ExpressionConverter, with the delimiters
+        self.assertTrue(wrapped)
+        for expr in wrapped:
+            expected = expressions.ExpressionConverter.convert_string(expr, item_vars=['i'])
+            with mock.patch.dict(expressions.CONVERTERS, {'yaql': yaql_tokens.YaqlTokenExpressionConverter}):
+                self.assertEqual(
+                    expressions.ExpressionConverter.convert_string(expr, item_vars=['i']),
+                    expected,
+                    expr)
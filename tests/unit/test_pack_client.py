@@ -13,8 +13,12 @@
 from __future__ import print_function
 
 import mock
+import os
+import shutil
+import six
 
 from orquestaconvert import pack_client
+from orquestaconvert.utils import yaml_utils
 
 from tests import base_test_case
 
@@ -26,7 +30,7 @@ class PackClientTestCase(base_test_case.BasePackClientRunTestCase):
         super(PackClientTestCase, self).setUp()
 
         self.client = mock.MagicMock()
-        self.client.run = mock.MagicMock(return_value=0)
+        self.session = self.client.session.return_value
         self.pack_client = pack_client.PackClient()
 
     def test_get_mistral_workflow_files_in_p_dir(self):
@@ -47,7 +51,7 @@ class PackClientTestCase(base_test_case.BasePackClientRunTestCase):
 
         self.assertEqual(result, 0)
 
-        self.assertEqual(self.client.run.call_count, 0)
+        self.assertEqual(self.session.validate_file.call_count, 0)
 
     def test_validate_orquesta(self):
         args = ['--validate', '--actions-dir={}'.format(self.o_actions_dir)]
@@ -55,13 +59,14 @@ class PackClientTestCase(base_test_case.BasePackClientRunTestCase):
 
         self.assertEqual(result, 0)
 
-        self.assertEqual(self.client.run.call_count, len(self.action_passing_files))
+        self.client.session.assert_called_once_with([])
+        self.assertEqual(self.session.validate_file.call_count, len(self.action_passing_files))
 
         calls = [
-            mock.call(['--validate', wf], self.stdout)
+            mock.call(wf)
             for wf in self.orquesta_action_wfs.values()
         ]
-        self.client.run.assert_has_calls(calls, any_order=True)
+        self.session.validate_file.assert_has_calls(calls, any_order=True)
 
     def test_convert_pack(self):
         args = ['-e', 'yaql', '--actions-dir={}'.format(self.m_actions_dir)]
@@ -69,11 +74,257 @@ class PackClientTestCase(base_test_case.BasePackClientRunTestCase):
 
         self.assertEqual(result, 0)
 
-        self.assertEqual(self.client.run.call_count, len(self.action_files))
+        # The options are parsed once for the whole pack
+        self.client.session.assert_called_once_with(['-e', 'yaql'])
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files))
 
-        expected = [
-            ['-e', 'yaql', wf]
-            for wf in self.action_wfs.values()
+        self.assertItemsEqual(
+            [call_args[0][0] for call_args in self.session.write_converted_file.call_args_list],
+            list(self.action_wfs.values()))
+
+    def test_convert_pack_streams_into_temp_file(self):
+        def _convert(filename, output_stream, profile=None, **kwargs):
+            self.assertEqual(output_stream.name,
+                             '{}.{}'.format(filename, pack_client.TMP_EXTENSION))
+            output_stream.write('converted: {}\n'.format(filename))
+
+        self.session.write_converted_file.side_effect = _convert
+        args = ['--actions-dir={}'.format(self.m_actions_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 0)
+        for wf in self.action_wfs.values():
+            with open(wf, 'r') as f:
+                self.assertEqual(f.read(), 'converted: {}\n'.format(wf))
+            self.assertFalse(os.path.exists('{}.{}'.format(wf, pack_client.TMP_EXTENSION)))
+
+    def test_convert_pack_partial_write_rolls_back(self):
+        def _convert(filename, output_stream, profile=None, **kwargs):
+            output_stream.write('partial')
+            raise ValueError('conversion blew up')
+
+        self.session.write_converted_file.side_effect = _convert
+        args = ['--actions-dir={}'.format(self.m_actions_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 1)
+        self.assertIn('ISSUE: conversion blew up\n', self.stderr.getvalue())
+        for a_f, wf in self.action_wfs.items():
+            self.assertFalse(os.path.exists('{}.{}'.format(wf, pack_client.TMP_EXTENSION)))
+            self.assertFalse(os.path.exists('{}.{}'.format(wf, pack_client.BACKUP_EXTENSION)))
+            self.assertFalse(os.path.exists('{}.{}'.format(a_f, pack_client.BACKUP_EXTENSION)))
+        self.assertEqual(self._hash_directory(self.m_actions_dir, self.action_files),
+                         self._hash_directory(self.p_actions_dir, self.action_files))
+
+    def _reset_m_actions_dir(self):
+        shutil.rmtree(self.m_actions_dir)
+        shutil.copytree(self.p_actions_dir, self.m_actions_dir)
+
+    def _run_cached(self, extra_args=None):
+        cache_dir = os.path.join(self.cache_home, 'test-cache')
+        args = ['--cache-dir={}'.format(cache_dir),
+                '--actions-dir={}'.format(self.m_actions_dir)] + (extra_args or [])
+        return self.pack_client.run(args, self.stdout, client=self.client)
+
+    def test_convert_pack_cache_hit(self):
+        def _convert(filename, output_stream, profile=None, **kwargs):
+            output_stream.write('converted: {}\n'.format(filename))
+
+        self.session.write_converted_file.side_effect = _convert
+        self.assertEqual(self._run_cached(), 0)
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files))
+
+        self._reset_m_actions_dir()
+        self.assertEqual(self._run_cached(), 0)
+
+        # Everything came from the cache the second time around
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files))
+        for wf in self.action_wfs.values():
+            with open(wf, 'r') as f:
+                self.assertEqual(f.read(), 'converted: {}\n'.format(wf))
+
+    def test_convert_pack_cache_miss_on_changed_options(self):
+        self.assertEqual(self._run_cached(), 0)
+        self._reset_m_actions_dir()
+        self.assertEqual(self._run_cached(['-e', 'yaql']), 0)
+        self.assertEqual(self.session.write_converted_file.call_count, 2 * len(self.action_files))
+
+    def test_convert_pack_cache_hit_on_error(self):
+        self.session.write_converted_file.side_effect = ValueError('conversion blew up')
+        self.assertEqual(self._run_cached(), 1)
+        self.assertEqual(self._run_cached(), 1)
+
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files))
+        self.assertEqual(self.stderr.getvalue().count('ISSUE: conversion blew up\n'), 2)
+
+    def test_convert_pack_cache_miss_on_io_error(self):
+        self.session.write_converted_file.side_effect = IOError('disk went away')
+        self.assertEqual(self._run_cached(), 1)
+
+        # Problems with the files aren't cached, so the next run tries again
+        self.session.write_converted_file.side_effect = None
+        self._reset_m_actions_dir()
+        self.assertEqual(self._run_cached(), 0)
+
+        self.assertEqual(self.session.write_converted_file.call_count, 2 * len(self.action_files))
+        self.assertEqual(self.stderr.getvalue().count('ISSUE: disk went away\n'), 1)
+
+    def test_convert_pack_no_cache(self):
+        self.assertEqual(self._run_cached(['--no-cache']), 0)
+        self._reset_m_actions_dir()
+        self.assertEqual(self._run_cached(['--no-cache']), 0)
+        self.assertEqual(self.session.write_converted_file.call_count, 2 * len(self.action_files))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_home, 'test-cache')))
+
+    def test_convert_pack_default_cache_dir(self):
+        args = ['--actions-dir={}'.format(self.m_actions_dir)]
+        self.pack_client.run(args, self.stdout, client=self.client)
+        self.assertTrue(os.listdir(os.path.join(self.cache_home, 'orquestaconvert')))
+
+    def _make_packs_dir(self):
+        packs_dir = os.path.join(self.cache_home, 'packs')
+        shutil.copytree(self.p_actions_dir, os.path.join(packs_dir, 'pack1', 'actions'))
+        os.makedirs(os.path.join(packs_dir, 'pack2', 'actions', 'nested'))
+        os.makedirs(os.path.join(packs_dir, 'pack2', 'actions', 'workflows'))
+        os.makedirs(os.path.join(packs_dir, 'not_a_pack'))
+        shutil.copy(os.path.join(self.p_actions_dir, 'mistral-retry.yaml'),
+                    os.path.join(packs_dir, 'pack2', 'actions', 'nested'))
+        shutil.copy(os.path.join(self.p_wfs_dir, 'mistral-retry.yaml'),
+                    os.path.join(packs_dir, 'pack2', 'actions', 'workflows'))
+        return packs_dir
+
+    def test_iter_pack_workflow_files(self):
+        packs_dir = self._make_packs_dir()
+        workflows = list(self.pack_client.iter_pack_workflow_files('mistral-v2', packs_dir))
+
+        pack1_actions = os.path.join(packs_dir, 'pack1', 'actions')
+        pack2_actions = os.path.join(packs_dir, 'pack2', 'actions')
+        expected = sorted(
+            (os.path.join(pack1_actions, af), os.path.join(pack1_actions, 'workflows', af))
+            for af in self.action_files
+        ) + [
+            (os.path.join(pack2_actions, 'nested', 'mistral-retry.yaml'),
+             os.path.join(pack2_actions, 'workflows', 'mistral-retry.yaml')),
         ]
-        self.assertItemsEqual([call_args[0][0] for call_args in self.client.run.call_args_list],
-                              expected)
+        self.assertEqual(workflows, expected)
+
+    def test_get_workflow_files_skips_leftover_files(self):
+        a_f = os.path.join(self.m_actions_dir, 'mistral-retry.yaml')
+        shutil.copy(a_f, '{}.{}'.format(a_f, pack_client.BACKUP_EXTENSION))
+        shutil.copy(a_f, '{}.{}'.format(a_f, pack_client.TMP_EXTENSION))
+
+        workflows = self.pack_client.get_workflow_files('mistral-v2', self.m_actions_dir)
+        self.assertEqual(workflows, self.action_wfs)
+
+    def test_list_workflows_packs_dir(self):
+        packs_dir = self._make_packs_dir()
+        args = ['--list-workflows=mistral-v2', '--packs-dir={}'.format(packs_dir)]
+        self.pack_client.run(args, self.stdout, client=self.client)
+
+        lines = self.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), len(self.action_files) + 1)
+
+    def test_convert_packs_dir(self):
+        packs_dir = self._make_packs_dir()
+        args = ['--no-cache', '--packs-dir={}'.format(packs_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 0)
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files) + 1)
+
+    def _add_malformed_action(self, packs_dir):
+        # Sorts before the actions of pack1, so it is discovered first
+        bad_file = os.path.join(packs_dir, 'pack0', 'actions', 'broken.yaml')
+        os.makedirs(os.path.dirname(bad_file))
+        with open(bad_file, 'w') as f:
+            f.write('runner_type: mistral-v2\nentry_point: [unclosed\n')
+        return bad_file
+
+    @mock.patch('sys.stderr', new_callable=six.StringIO)
+    def test_list_workflows_packs_dir_malformed_yaml(self, stderr):
+        packs_dir = self._make_packs_dir()
+        bad_file = self._add_malformed_action(packs_dir)
+        args = ['--list-workflows=mistral-v2', '--packs-dir={}'.format(packs_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 1)
+        lines = self.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), len(self.action_files) + 1)
+        self.assertIn('ISSUE: ', stderr.getvalue())
+        self.assertIn('  - {}\n'.format(bad_file), stderr.getvalue())
+
+    @mock.patch('sys.stderr', new_callable=six.StringIO)
+    def test_convert_packs_dir_malformed_yaml(self, stderr):
+        packs_dir = self._make_packs_dir()
+        bad_file = self._add_malformed_action(packs_dir)
+        args = ['--no-cache', '--packs-dir={}'.format(packs_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 1)
+        self.assertEqual(self.session.write_converted_file.call_count, len(self.action_files) + 1)
+        self.assertIn('ERROR: Unable to convert all Mistral workflows.', stderr.getvalue())
+        self.assertIn('  - {}\n'.format(bad_file), stderr.getvalue())
+
+    def _map_workflows_pulls(self, jobs):
+        self.pack_client.args = self.pack_client.parser().parse_args(['--jobs', str(jobs)])
+        pulled = []
+
+        def _items():
+            for i in range(20):
+                pulled.append(i)
+                yield i
+
+        results = self.pack_client.map_workflows(abs, _items())
+        first = next(results)
+        pulled_before_first_result = len(pulled)
+        rest = list(results)
+        return [first] + rest, pulled_before_first_result
+
+    def test_map_workflows_serial_is_lazy(self):
+        results, pulled = self._map_workflows_pulls(1)
+        self.assertEqual(results, [(i, i) for i in range(20)])
+        self.assertEqual(pulled, 1)
+
+    def test_map_workflows_parallel_is_bounded(self):
+        results, pulled = self._map_workflows_pulls(2)
+        self.assertEqual(results, [(i, i) for i in range(20)])
+        self.assertEqual(pulled, 4)
+
+    def test_convert_batch_expressions(self):
+        conversions = {'key': '<% ctx().a %>'}
+        self.session.read_workflow.side_effect = lambda m_f, profile=None: ('data', m_f)
+        self.session.convert_expressions.return_value = conversions
+        args = ['--no-cache', '--batch-expressions', '--actions-dir={}'.format(self.m_actions_dir)]
+        result = self.pack_client.run(args, self.stdout, client=self.client)
+
+        self.assertEqual(result, 0)
+        # every workflow is parsed once, and the conversion gets it and the expressions
+        self.assertEqual(self.session.read_workflow.call_count, len(self.action_files))
+        self.assertEqual(sorted(self.session.convert_expressions.call_args[0][0]),
+                         sorted(('data', wf) for wf in self.action_wfs.values()))
+        for call_args in self.session.write_converted_file.call_args_list:
+            self.assertEqual(call_args[1]['workflow'], ('data', call_args[0][0]))
+            self.assertIs(call_args[1]['conversions'], conversions)
+
+        # and the next run doesn't get them
+        self._reset_m_actions_dir()
+        self.session.write_converted_file.reset_mock()
+        self.pack_client.run(['--no-cache', '--actions-dir={}'.format(self.m_actions_dir)],
+                             self.stdout, client=self.client)
+        self.assertIsNone(self.session.write_converted_file.call_args[1]['conversions'])
+        self.assertIsNone(self.session.write_converted_file.call_args[1]['workflow'])
+
+    def test_convert_workflow_pickled_workflow(self):
+        self.addCleanup(pack_client.init_convert_worker, None)
+        workflow = yaml_utils.load_yaml('a: b  # comment\n')
+        a_f, m_f = sorted(self.action_wfs.items())[0]
+        o_f = '{}.{}'.format(m_f, pack_client.TMP_EXTENSION)
+
+        pack_client.init_convert_worker({'key': 'converted'})
+        error, _ = pack_client.convert_workflow((self.session, [], a_f, m_f, o_f, None, False,
+                                                 yaml_utils.dumps_ruamel(workflow)))
+
+        self.assertIsNone(error)
+        kwargs = self.session.write_converted_file.call_args[1]
+        self.assertEqual(kwargs['conversions'], {'key': 'converted'})
+        self.assertIn('a: b  # comment\n', yaml_utils.obj_to_yaml(kwargs['workflow'][1]))
@@ -0,0 +1,229 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import glob
+import mock
+import os
+import pickle
+import six
+
+from orquestaconvert import client
+from orquestaconvert import expressions
+from orquestaconvert import session
+from orquestaconvert.utils import yaml_utils
+
+from tests import base_test_case
+
+
+class RecordingDict(dict):
+    # Records which keys were looked up, and whether they were there
+    def __init__(self, *args, **kwargs):
+        super(RecordingDict, self).__init__(*args, **kwargs)
+        self.found = set()
+        self.missed = set()
+
+    def __contains__(self, key):
+        found = super(RecordingDict, self).__contains__(key)
+        (self.found if found else self.missed).add(key)
+        return found
+
+
+class TestConversionSession(base_test_case.BaseCLITestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(TestConversionSession, self).setUp()
+        self.maxDiff = 20000
+
+    def test_from_args(self):
+        args = client.Client().options_parser().parse_args(['-e', 'yaql', '--force', '-v',
+                                                            '--task-jobs', '4'])
+        conversion = session.ConversionSession.from_args(args)
+
+        self.assertEqual(conversion.expr_type, 'yaql')
+        self.assertTrue(conversion.force)
+        self.assertTrue(conversion.verbose)
+        self.assertEqual(conversion.task_jobs, 4)
+
+    def test_client_session(self):
+        conversion = client.Client().session(['--expressions', 'yaql'])
+
+        self.assertEqual(conversion.expr_type, 'yaql')
+        self.assertFalse(conversion.force)
+        self.assertFalse(conversion.verbose)
+
+    def test_convert_many_files_parses_options_once(self):
+        filenames = ['nasa_apod_twitter_post.yaml', 'output_test.yaml', 'transition_strings.yaml']
+
+        with mock.patch.object(argparse.ArgumentParser, 'parse_args',
+                               wraps=argparse.ArgumentParser.parse_args,
+                               autospec=True) as parse_args:
+            conversion = client.Client().session([])
+            results = [conversion.convert_file(self.get_fixture_path('mistral/' + f))
+                       for f in filenames]
+
+        self.assertEqual(parse_args.call_count, 1)
+        self.assertEqual(results,
+                         [self.get_fixture_content('orquesta/' + f) for f in filenames])
+
+    def test_convert_yaml(self):
+        conversion = session.ConversionSession(expr_type='yaql')
+        mistral_wf = self.get_fixture_content('mistral/nasa_apod_twitter_post_yaql.yaml')
+
+        result = conversion.convert_yaml(mistral_wf)
+
+        self.assertMultiLineEqual(
+            result,
+            self.get_fixture_content('orquesta/nasa_apod_twitter_post_yaql.yaml'))
+
+    def test_write_converted_file(self):
+        conversion = session.ConversionSession(expr_type='jinja')
+
+        conversion.write_converted_file(
+            self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml'), self.stdout)
+
+        self.assertEqual(self.stdout.getvalue(),
+                         self.get_fixture_content('orquesta/nasa_apod_twitter_post.yaml'))
+
+    def test_validate_file(self):
+        conversion = session.ConversionSession(verbose=True)
+        wf = self.get_fixture_path('orquesta/nasa_apod_twitter_post.yaml')
+
+        conversion.validate_file(wf)
+
+        self.assertEqual(self.stdout.getvalue(),
+                         'Successfully validated workflow from {}\n'.format(wf))
+
+    def test_validate_workflow_spec_raises(self):
+        wf_spec = mock.MagicMock()
+        wf_spec.inspect_syntax.return_value = "some error string"
+
+        with self.assertRaises(ValueError):
+            session.ConversionSession().validate_workflow_spec(wf_spec)
+
+    def test_pickle(self):
+        conversion = session.ConversionSession(expr_type='yaql', force=True)
+        unpickled = pickle.loads(pickle.dumps(conversion))
+
+        self.assertEqual(vars(unpickled), vars(conversion))
+
+    def test_convert_expressions(self):
+        conversion = session.ConversionSession()
+        filenames = glob.glob(os.path.join(self.get_fixture_path('mistral'), '*.yaml'))
+        converted = 0
+        for filename in filenames:
+            workflow = conversion.read_workflow(filename)
+            conversions = conversion.convert_expressions([workflow])
+            try:
+                expected = conversion.convert_file(filename)
+            except Exception:
+                continue
+
+            # every expression that the conversion looks up is in the
+            # conversions, and nothing else is
+            looked_up = RecordingDict(conversions)
+            output = six.StringIO()
+            conversion.write_converted_file(filename, output, workflow=workflow, conversions=looked_up)
+
+            self.assertEqual(output.getvalue(), expected, filename)
+            self.assertEqual(looked_up.found, set(conversions), filename)
+            self.assertFalse([key for key in looked_up.missed
+                              if expressions.ExpressionConverter._delimiter_type(key[3])],
+                             filename)
+            converted += 1
+        self.assertGreater(converted, 5)
+
+    def test_convert_expressions_with_items(self):
+        mistral_wf = ("version: '2.0'\n"
+                      "wf:\n"
+                      "  tasks:\n"
+                      "    task1:\n"
+                      "      with-items: i in <% $.things %>\n"
+                      "      action: core.local cmd=<% $.i %>\n"
+                      "      input:\n"
+                      "        a: <% $.i %>\n"
+                      "        <% $.key %>: value\n"
+                      "      publish:\n"
+                      "        b: <% $.i %>\n"
+                      "      on-success:\n"
+                      "        - task2\n"
+                      "    task2:\n"
+                      "      action: core.noop\n")
+        conversion = session.ConversionSession(force=True)
+        conversions = conversion.convert_expressions([yaml_utils.load_yaml(mistral_wf)])
+
+        self.assertEqual(sorted(conversions.values()), ['<% ctx().i %>', '<% item(i) %>',
+                                                        'core.local cmd=<% item(i) %>'])
+
+    def test_convert_yaml_input_formatting(self):
+        # task inputs are copied, so the formatting of the Mistral workflow
+        # (flow style, comments and anchors) doesn't leak into the output
+        mistral_wf = ("version: '2.0'\n"
+                      "wf:\n"
+                      "  tasks:\n"
+                      "    t1:\n"
+                      "      action: core.local\n"
+                      "      input: &common\n"
+                      "        list: [1, 2, 3]\n"
+                      "        nested:\n"
+                      "          a: b    # secret note\n"
+                      "        cmd: <% $.x %>\n"
+                      "    t2:\n"
+                      "      action: core.local\n"
+                      "      input: *common\n")
+        task = ("    action: core.local\n"
+                "    input:\n"
+                "      list:\n"
+                "        - 1\n"
+                "        - 2\n"
+                "        - 3\n"
+                "      nested:\n"
+                "        a: b\n"
+                "      cmd: <% ctx().x %>\n")
+
+        result = session.ConversionSession().convert_yaml(mistral_wf)
+
+        self.assertMultiLineEqual(result, "---\nversion: '1.0'\ntasks:\n  t1:\n" + task + "  t2:\n" + task)
+
+    def test_convert_yaml_publish_not_aliased(self):
+        # every transition of a task publishes the same converted block, but
+        # each one has to be written out in full, not as an alias of another
+        mistral_wf = ("version: '2.0'\n"
+                      "wf:\n"
+                      "  tasks:\n"
+                      "    t1:\n"
+                      "      action: core.noop\n"
+                      "      publish:\n"
+                      "        data:\n"
+                      "          a: <% $.x %>\n"
+                      "          b: [1, 2]\n"
+                      "      on-success:\n"
+                      "        - t2: <% $.x = 1 %>\n"
+                      "        - t2: <% $.x = 2 %>\n"
+                      "        - t2\n"
+                      "      on-complete:\n"
+                      "        - t2: <% $.y %>\n"
+                      "    t2:\n"
+                      "      action: core.noop\n")
+        publish = ("        publish:\n"
+                   "          - data:\n"
+                   "              a: <% ctx().x %>\n"
+                   "              b:\n"
+                   "                - 1\n"
+                   "                - 2\n")
+
+        result = session.ConversionSession().convert_yaml(mistral_wf)
+
+        self.assertNotIn('&id', result)
+        self.assertNotIn('*id', result)
+        self.assertEqual(result.count(publish), 4)
@@ -0,0 +1,100 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+from tests import base_test_case
+
+
+# Runs a CLI module as __main__ with the given arguments, then prints the
+# names of all of the modules that got imported along the way
+LOADED_MODULES_SCRIPT = '''
+import json
+import runpy
+import sys
+
+sys.argv = [sys.argv[1]] + sys.argv[2:]
+try:
+    runpy.run_module(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.__stderr__.write(json.dumps(sorted(sys.modules)))
+'''
+
+# Modules that are slow to import, and that only the conversion and
+# validation code paths need
+HEAVY_MODULES = [
+    'jinja2',
+    'multiprocessing',
+    'orquesta',
+    'orquestaconvert.expressions',
+    'orquestaconvert.session',
+    'orquestaconvert.specs',
+    'orquestaconvert.workflows',
+    # ruamel itself is a namespace package that a .pth file may import at
+    # interpreter startup, so look for ruamel.yaml instead
+    'ruamel.yaml',
+    'yamlloader',
+    'yaql',
+]
+
+
+class TestStartupImports(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def _loaded_modules(self, module, args):
+        root_dir = os.path.dirname(self._get_base_path())
+        process = subprocess.Popen([sys.executable, '-c', LOADED_MODULES_SCRIPT, module] + args,
+                                   cwd=root_dir,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        _, stderr = process.communicate()
+        return json.loads(stderr.splitlines()[-1])
+
+    def assertNoHeavyModules(self, module, args):
+        loaded = self._loaded_modules(module, args)
+        heavy = [m for m in loaded
+                 if any(m == h or m.startswith(h + '.') for h in HEAVY_MODULES)]
+        self.assertEqual(heavy, [])
+        return loaded
+
+    def test_pack_client_list_workflows(self):
+        actions_dir = os.path.join('tests', 'fixtures', 'pack', 'pristine_actions')
+        loaded = self.assertNoHeavyModules('orquestaconvert.pack_client',
+                                           ['--list-workflows=mistral-v2',
+                                            '--actions-dir={}'.format(actions_dir)])
+        # make sure it actually got as far as scanning the metadata
+        self.assertIn('yaml', loaded)
+
+    def test_pack_client_help(self):
+        self.assertNoHeavyModules('orquestaconvert.pack_client', ['--help'])
+
+    def test_client_help(self):
+        self.assertNoHeavyModules('orquestaconvert.client', ['--help'])
+
+    def test_client_convert_loads_converter(self):
+        # and the other way around, to make sure the check works
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        loaded = self._loaded_modules('orquestaconvert.client', [fixture_path])
+        self.assertIn('orquestaconvert.session', loaded)
+        self.assertIn('ruamel.yaml', loaded)
+
+    def test_client_convert_serial_skips_multiprocessing(self):
+        # converting a workflow with a single job doesn't need a pool
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        loaded = self._loaded_modules('orquestaconvert.client', [fixture_path])
+        self.assertIn('orquestaconvert.workflows.base', loaded)
+        self.assertNotIn('multiprocessing', loaded)
@@ -0,0 +1,195 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import mock
+import os
+import shutil
+import tempfile
+import threading
+
+import orquesta
+
+import orquestaconvert
+from orquestaconvert.utils import cache_utils
+
+from tests import base_test_case
+
+
+class TestConversionCache(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def setUp(self):
+        super(TestConversionCache, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = cache_utils.ConversionCache(os.path.join(self.tmp_dir, 'cache'))
+        self.wf_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        self.output_path = os.path.join(self.tmp_dir, 'output.yaml')
+
+    def tearDown(self):
+        super(TestConversionCache, self).tearDown()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, path, content):
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def _read(self, path):
+        with open(path, 'r') as f:
+            return f.read()
+
+    def test_default_cache_dir(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/some/cache'}):
+            self.assertEqual(cache_utils.default_cache_dir(), '/some/cache/orquestaconvert')
+
+    def test_key_stable(self):
+        self.assertEqual(self.cache.key(['-e', 'yaql'], [self.wf_path]),
+                         self.cache.key(['-e', 'yaql'], [self.wf_path]))
+
+    def test_key_changes_with_options(self):
+        self.assertNotEqual(self.cache.key([], [self.wf_path]),
+                            self.cache.key(['--force'], [self.wf_path]))
+
+    def test_key_changes_with_content(self):
+        path = os.path.join(self.tmp_dir, 'wf.yaml')
+        self._write(path, 'a: b\n')
+        key = self.cache.key([], [path])
+        self._write(path, 'a: c\n')
+        self.assertNotEqual(key, self.cache.key([], [path]))
+
+    def test_key_changes_with_version(self):
+        key = self.cache.key([], [self.wf_path])
+        with mock.patch('orquestaconvert.__version__', '99.0'), \
+                mock.patch.object(cache_utils, '_converter_version', None):
+            self.assertNotEqual(key, self.cache.key([], [self.wf_path]))
+
+    def test_key_changes_with_orquesta_version(self):
+        key = self.cache.key([], [self.wf_path])
+        with mock.patch('orquesta.__version__', '99.0'), \
+                mock.patch.object(cache_utils, '_converter_version', None):
+            self.assertNotEqual(key, self.cache.key([], [self.wf_path]))
+
+    def test_key_changes_with_source(self):
+        key = self.cache.key([], [self.wf_path])
+        real_open = open
+
+        def _open(path, *args, **kwargs):
+            f = real_open(path, *args, **kwargs)
+            if path.endswith(os.path.join('utils', 'cache_utils.py')):
+                content = f.read() + b'# changed\n'
+                f.close()
+                return io.BytesIO(content)
+            return f
+
+        with mock.patch.object(cache_utils, 'open', _open, create=True), \
+                mock.patch.object(cache_utils, '_converter_version', None):
+            self.assertNotEqual(key, self.cache.key([], [self.wf_path]))
+
+    def test_converter_version(self):
+        version = cache_utils.converter_version()
+        self.assertTrue(version.startswith(orquestaconvert.__version__ + ' '))
+        self.assertTrue(version.endswith(' orquesta ' + orquesta.__version__))
+        self.assertIs(cache_utils.converter_version(), version)
+
+    def test_get_miss(self):
+        self.assertEqual(self.cache.get('missing', self.output_path), (False, None))
+        self.assertFalse(os.path.exists(self.output_path))
+
+    def test_put_get_output(self):
+        converted_path = os.path.join(self.tmp_dir, 'converted.yaml')
+        self._write(converted_path, 'version: 1.0\n')
+        self.cache.put('abc', converted_path)
+
+        self.assertEqual(self.cache.get('abc', self.output_path), (True, None))
+        self.assertEqual(self._read(self.output_path), 'version: 1.0\n')
+
+    def test_put_get_error(self):
+        self.cache.put('abc', error='something is wrong')
+        self.assertEqual(self.cache.get('abc', self.output_path), (True, 'something is wrong'))
+        self.assertFalse(os.path.exists(self.output_path))
+
+    def test_evict_least_recently_used(self):
+        self.cache.max_size = 10
+        for i, key in enumerate(['old', 'new']):
+            self.cache.put(key, error='x' * 6)
+            path = os.path.join(self.cache.directory, key + cache_utils.ERROR_EXTENSION)
+            os.utime(path, (1000 + i, 1000 + i))
+
+        self.cache.evict()
+
+        self.assertEqual(self.cache.get('old', self.output_path), (False, None))
+        self.assertEqual(self.cache.get('new', self.output_path), (True, 'x' * 6))
+
+    def test_evict_empty(self):
+        self.cache.evict()
+        self.assertEqual(self.cache.entries(), [])
+
+
+class TestLRUCache(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def test_get_or_compute(self):
+        cache = cache_utils.LRUCache()
+        func = mock.MagicMock(return_value='value')
+
+        self.assertEqual(cache.get_or_compute('key', func), 'value')
+        self.assertEqual(cache.get_or_compute('key', func), 'value')
+
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(dict(cache.stats()), {'hits': 1, 'misses': 1, 'entries': 1})
+
+    def test_evicts_least_recently_used(self):
+        cache = cache_utils.LRUCache(max_entries=2)
+        cache.get_or_compute('a', lambda: 1)
+        cache.get_or_compute('b', lambda: 2)
+        # 'a' is now more recently used than 'b'
+        cache.get_or_compute('a', lambda: 1)
+        cache.get_or_compute('c', lambda: 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get_or_compute('a', lambda: 'recomputed'), 1)
+        self.assertEqual(cache.get_or_compute('b', lambda: 'recomputed'), 'recomputed')
+
+    def test_disabled(self):
+        cache = cache_utils.LRUCache(enabled=False)
+        func = mock.MagicMock(return_value='value')
+
+        cache.get_or_compute('key', func)
+        cache.get_or_compute('key', func)
+
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(dict(cache.stats()), {'hits': 0, 'misses': 0, 'entries': 0})
+
+    def test_clear(self):
+        cache = cache_utils.LRUCache()
+        cache.get_or_compute('key', lambda: 'value')
+        cache.get_or_compute('key', lambda: 'value')
+        cache.clear()
+
+        self.assertEqual(dict(cache.stats()), {'hits': 0, 'misses': 0, 'entries': 0})
+        self.assertEqual(cache.get_or_compute('key', lambda: 'new value'), 'new value')
+
+    def test_threads(self):
+        cache = cache_utils.LRUCache(max_entries=50)
+
+        def _work():
+            for i in range(1000):
+                self.assertEqual(cache.get_or_compute(i % 100, lambda: (i % 100) * 2), (i % 100) * 2)
+
+        threads = [threading.Thread(target=_work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(cache.hits + cache.misses, 8000)
+        self.assertEqual(len(cache), 50)
@@ -0,0 +1,122 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import mock
+import six
+
+from orquestaconvert.utils import profile_utils
+
+from tests import base_test_case
+
+
+class TestProfileUtils(base_test_case.BaseTestCase):
+    __test__ = True
+
+    def _profile(self):
+        profile = profile_utils.PhaseProfile()
+        for i in range(1, 21):
+            profile.add('wf{}.yaml'.format(i), {profile_utils.PARSE: i / 1000.0,
+                                                profile_utils.CONVERT: 2 * i / 1000.0})
+        return profile
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(profile_utils.percentile(values, 50), 50)
+        self.assertEqual(profile_utils.percentile(values, 95), 95)
+        self.assertEqual(profile_utils.percentile(values, 100), 100)
+        self.assertEqual(profile_utils.percentile([3], 95), 3)
+        self.assertEqual(profile_utils.percentile([], 50), 0.0)
+
+    def test_phase(self):
+        profile = profile_utils.PhaseProfile()
+        timer = mock.MagicMock(side_effect=[1.0, 1.5, 2.0, 2.25, 3.0, 3.5])
+        with mock.patch('timeit.default_timer', timer):
+            with profile.phase('wf.yaml', profile_utils.PARSE):
+                pass
+            with profile.phase('wf.yaml', profile_utils.CONVERT):
+                pass
+            # phases that run more than once for a file add up
+            with profile.phase('wf.yaml', profile_utils.PARSE):
+                pass
+
+        self.assertEqual(dict(profile.files['wf.yaml']), {profile_utils.PARSE: 1.0,
+                                                          profile_utils.CONVERT: 0.25})
+
+    def test_phase_records_on_error(self):
+        profile = profile_utils.PhaseProfile()
+        with self.assertRaises(ValueError):
+            with profile.phase('wf.yaml', profile_utils.CONVERT):
+                raise ValueError('conversion blew up')
+
+        self.assertIn(profile_utils.CONVERT, profile.files['wf.yaml'])
+
+    def test_summary(self):
+        summary = self._profile().summary()
+
+        self.assertEqual(list(summary.keys()), profile_utils.PHASES + ['total'])
+        self.assertEqual(summary[profile_utils.PARSE]['count'], 20)
+        self.assertAlmostEqual(summary[profile_utils.PARSE]['p50'], 0.010)
+        self.assertAlmostEqual(summary[profile_utils.PARSE]['p95'], 0.019)
+        self.assertAlmostEqual(summary[profile_utils.PARSE]['max'], 0.020)
+        self.assertAlmostEqual(summary[profile_utils.CONVERT]['total'], 0.420)
+        self.assertAlmostEqual(summary['total']['max'], 0.060)
+        self.assertEqual(summary[profile_utils.EMIT]['count'], 0)
+
+    def test_to_json(self):
+        data = json.loads(self._profile().to_json())
+
+        self.assertEqual(len(data['files']), 20)
+        self.assertAlmostEqual(data['files']['wf3.yaml'][profile_utils.CONVERT], 0.006)
+        self.assertAlmostEqual(data['summary']['total']['p50'], 0.030)
+
+    def test_format_table(self):
+        lines = self._profile().format_table().splitlines()
+
+        self.assertEqual(lines[0].split()[:3], ['file', '(ms)', profile_utils.PARSE])
+        self.assertEqual(lines[1].split(), ['wf1.yaml', '1.000', '-', '2.000', '-', '-', '3.000'])
+        self.assertTrue(lines[21].startswith('---'))
+        self.assertEqual(lines[22].split(), ['p50', '10.000', '-', '20.000', '-', '-', '30.000'])
+        self.assertEqual(lines[-1].split()[0], 'total')
+
+    def test_write(self):
+        stream = six.moves.StringIO()
+        self._profile().write(stream, 'json')
+        self.assertEqual(len(json.loads(stream.getvalue())['files']), 20)
+
+    def test_counters(self):
+        profile = self._profile()
+        profile.count(profile_utils.EXPRESSION_CACHE_HITS, 9)
+        profile.count(profile_utils.EXPRESSION_CACHE_MISSES)
+
+        self.assertEqual(json.loads(profile.to_json())['counters'],
+                         {profile_utils.EXPRESSION_CACHE_HITS: 9,
+                          profile_utils.EXPRESSION_CACHE_MISSES: 1})
+        lines = profile.format_table().splitlines()
+        self.assertEqual(lines[-2].split()[-1], '9')
+        self.assertEqual(lines[-1].split()[-1], '1')
+
+    def test_merge(self):
+        profile = profile_utils.PhaseProfile()
+        profile.add('wf1.yaml', {profile_utils.PARSE: 1.0})
+        profile.count(profile_utils.EXPRESSION_CACHE_HITS, 2)
+
+        other = profile_utils.PhaseProfile()
+        other.add('wf1.yaml', {profile_utils.PARSE: 0.5})
+        other.add('wf2.yaml', {profile_utils.EMIT: 2.0})
+        other.count(profile_utils.EXPRESSION_CACHE_HITS, 3)
+
+        profile.merge(other)
+
+        self.assertEqual(dict(profile.files['wf1.yaml']), {profile_utils.PARSE: 1.5})
+        self.assertEqual(dict(profile.files['wf2.yaml']), {profile_utils.EMIT: 2.0})
+        self.assertEqual(profile.counters[profile_utils.EXPRESSION_CACHE_HITS], 5)
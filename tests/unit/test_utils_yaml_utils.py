@@ -10,7 +10,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import os
 import ruamel.yaml
+import six
+import tempfile
+import threading
 
 from orquestaconvert.utils import yaml_utils
 
@@ -69,3 +74,172 @@ class TestYamlUtils(base_test_case.BaseTestCase):
         }
         result = yaml_utils.obj_to_yaml(ruamel_data)
         self.assertEqual(result, self.get_fixture_content('yaml/no_line_wrap.yaml'))
+
+    def test_read_yaml_plain_types(self):
+        fixture_path = self.get_fixture_path('mistral/nasa_apod_twitter_post.yaml')
+        data, ruamel_data = yaml_utils.read_yaml(fixture_path)
+        self.assertIsInstance(ruamel_data, OrderedMap)
+        self.assertNotIsInstance(data, OrderedMap)
+        self.assertEqual(data, yaml_utils.yaml_to_obj(self.get_fixture_content(
+            'mistral/nasa_apod_twitter_post.yaml')))
+
+    def test_load_yaml_yaml11_scalars(self):
+        content = ("base: &base\n"
+                   "  x: 1\n"
+                   "  y: 2\n"
+                   "merged:\n"
+                   "  <<: *base\n"
+                   "  y: 3\n"
+                   "yes_value: yes\n"
+                   "on_value: on\n"
+                   "quoted: 'yes'\n"
+                   "tagged: !!str yes\n"
+                   "octal: 010\n"
+                   "exponent: 1e3\n"
+                   "float_exponent: 1.0e+3\n")
+        data, ruamel_data = yaml_utils.load_yaml(content)
+
+        self.assertEqual(data, yaml_utils.yaml_to_obj(content))
+        self.assertEqual(list(data['merged'].items()), [('x', 1), ('y', 3)])
+        self.assertIs(data['yes_value'], True)
+        self.assertIs(data['on_value'], True)
+        self.assertEqual(data['quoted'], 'yes')
+        self.assertEqual(data['tagged'], 'yes')
+        self.assertEqual(data['octal'], 8)
+        self.assertEqual(data['exponent'], '1e3')
+        self.assertEqual(data['float_exponent'], 1000.0)
+
+        # the round-trip data is still written out the way it was read
+        dumped = yaml_utils.obj_to_yaml(ruamel_data)
+        self.assertIn('yes_value: yes\n', dumped)
+        self.assertIn('octal: 010\n', dumped)
+        self.assertIn('exponent: 1e3\n', dumped)
+        self.assertIn('<<: *base\n', dumped)
+
+    def test_ruamel_to_obj(self):
+        ruamel_data = ruamel.yaml.round_trip_load("a:\n"
+                                                  "  - 1.5\n"
+                                                  "  - 0x1F\n"
+                                                  "  - |\n"
+                                                  "    literal\n"
+                                                  "b: true\n"
+                                                  "c:\n")
+        result = yaml_utils.ruamel_to_obj(ruamel_data)
+        self.assertEqual(result, {'a': [1.5, 31, 'literal\n'], 'b': True, 'c': None})
+        self.assertIs(type(result), collections.OrderedDict)
+        self.assertEqual(list(result.keys()), ['a', 'b', 'c'])
+        self.assertIs(type(result['a']), list)
+        self.assertEqual([type(v) for v in result['a']], [float, int, str])
+
+    def test_get_yaml_emitter_cached_per_indent(self):
+        emitter = yaml_utils.get_yaml_emitter()
+        self.assertIs(yaml_utils.get_yaml_emitter(2), emitter)
+        self.assertIsNot(yaml_utils.get_yaml_emitter(4), emitter)
+
+    def test_get_yaml_emitter_per_thread(self):
+        emitters = []
+        thread = threading.Thread(target=lambda: emitters.append(yaml_utils.get_yaml_emitter()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(emitters[0], yaml_utils.get_yaml_emitter())
+
+    def test_obj_to_yaml_indent(self):
+        ruamel_data = OrderedMap([('test_dict', OrderedMap([('a', ['x'])]))])
+        self.assertEqual(yaml_utils.obj_to_yaml(ruamel_data, indent=4),
+                         "---\n"
+                         "test_dict:\n"
+                         "    a:\n"
+                         "        - x\n")
+        self.assertEqual(yaml_utils.obj_to_yaml(ruamel_data),
+                         "---\n"
+                         "test_dict:\n"
+                         "  a:\n"
+                         "    - x\n")
+
+    def test_dump_yaml(self):
+        ruamel_data = OrderedMap([
+            ('test_dict', OrderedMap([
+                ('a', True)
+            ]))
+        ])
+        stream = six.moves.StringIO()
+        yaml_utils.dump_yaml(ruamel_data, stream)
+        self.assertEqual(stream.getvalue(), self.get_fixture_content('yaml/simple.yaml'))
+
+    def test_dump_yaml_error_discards_emitter(self):
+        emitter = yaml_utils.get_yaml_emitter()
+        with self.assertRaises(ruamel.yaml.representer.RepresenterError):
+            yaml_utils.dump_yaml({'key': object()}, six.moves.StringIO())
+        self.assertIsNot(yaml_utils.get_yaml_emitter(), emitter)
+
+    def test_dumps_ruamel_keeps_comments(self):
+        content = self.get_fixture_content('mistral/nasa_apod_twitter_post.yaml')
+        _, data = yaml_utils.load_yaml(content)
+
+        data_loaded = yaml_utils.loads_ruamel(yaml_utils.dumps_ruamel((data, 'other')))
+
+        self.assertEqual(data_loaded[1], 'other')
+        self.assertIs(type(data_loaded[0]), type(data))
+        self.assertIn('#type: direct', yaml_utils.obj_to_yaml(data_loaded[0]))
+        self.assertEqual(yaml_utils.obj_to_yaml(data_loaded[0]), yaml_utils.obj_to_yaml(data))
+
+    def test_scan_yaml_keys(self):
+        yaml_str = ("---\n"
+                    "name: test\n"
+                    "parameters:\n"
+                    "  runner_type:\n"
+                    "    type: string\n"
+                    "  other: [1, 2, {runner_type: nested}]\n"
+                    "? [complex, key]\n"
+                    ": value\n"
+                    "runner_type: mistral-v2\n"
+                    "entry_point: 'workflows/test.yaml'\n")
+        result = yaml_utils.scan_yaml_keys(yaml_str, ['runner_type', 'entry_point'])
+        self.assertEqual(result, {'runner_type': 'mistral-v2',
+                                  'entry_point': 'workflows/test.yaml'})
+
+    def test_scan_yaml_keys_stops_early(self):
+        # Everything after the requested keys is never parsed
+        yaml_str = ("runner_type: orquesta\n"
+                    "entry_point: workflows/test.yaml\n"
+                    "parameters: {broken: [\n")
+        result = yaml_utils.scan_yaml_keys(yaml_str, ['runner_type', 'entry_point'])
+        self.assertEqual(result, {'runner_type': 'orquesta',
+                                  'entry_point': 'workflows/test.yaml'})
+
+    def test_scan_yaml_keys_missing(self):
+        result = yaml_utils.scan_yaml_keys("name: test\n", ['runner_type'])
+        self.assertEqual(result, {})
+
+    def test_scan_yaml_keys_ambiguous(self):
+        for yaml_str in ["- runner_type\n",
+                         "runner_type: 123\n",
+                         "runner_type: [a, b]\n",
+                         "runner_type: !!str orquesta\n",
+                         "base: &base {runner_type: orquesta}\n<<: *base\n",
+                         "a: &a runner_type\n*a : orquesta\n"]:
+            with self.assertRaises(yaml_utils.AmbiguousYamlError):
+                yaml_utils.scan_yaml_keys(yaml_str, ['runner_type'])
+
+    def test_read_yaml_keys(self):
+        fixture_path = self.get_fixture_path('pack/pristine_actions/mistral-retry.yaml')
+        result = yaml_utils.read_yaml_keys(fixture_path, ['runner_type', 'entry_point'])
+        self.assertEqual(result, {'runner_type': 'mistral-v2',
+                                  'entry_point': 'workflows/mistral-retry.yaml'})
+
+    def test_read_yaml_keys_falls_back_to_full_parse(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+            f.write("base: &base {runner_type: orquesta}\n"
+                    "<<: *base\n"
+                    "entry_point: 123\n")
+        self.addCleanup(os.remove, f.name)
+
+        result = yaml_utils.read_yaml_keys(f.name, ['runner_type', 'entry_point'])
+        self.assertEqual(result, {'runner_type': 'orquesta', 'entry_point': 123})
+
+    def test_read_yaml_keys_not_a_mapping(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+            f.write("- runner_type\n")
+        self.addCleanup(os.remove, f.name)
+
+        self.assertEqual(yaml_utils.read_yaml_keys(f.name, ['runner_type']), {})
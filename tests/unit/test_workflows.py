@@ -10,11 +10,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import mock
+import os
 import re
 import ruamel.yaml
+import sys
+import warnings
 
 from orquestaconvert.expressions import jinja
 from orquestaconvert.expressions import yaql as yql
+from orquestaconvert.utils import yaml_utils
 from orquestaconvert.workflows import base as workflows_base
 
 from tests import base_test_case
@@ -132,6 +138,73 @@ class TestWorkflows(base_test_case.BaseTestCase):
         actual_output = converter.extract_context_variables(output_block)
         self.assertEqual(actual_output, expected_output)
 
+    def test_extract_context_variables_deeply_nested(self):
+        converter = workflows_base.WorkflowConverter()
+        output_block = '{{ ctx().innermost }}'
+        for i in range(sys.getrecursionlimit() + 100):
+            output_block = [output_block] if i % 2 else OrderedMap([('<% ctx().x{} %>'.format(i % 10), output_block)])
+
+        actual_output = converter.extract_context_variables(output_block)
+        self.assertEqual(actual_output, set(['innermost'] + ['x{}'.format(i) for i in range(0, 10, 2)]))
+
+    def test_extract_context_variables_cached(self):
+        workflows_base.CONTEXT_VARIABLES_CACHE.clear()
+        self.addCleanup(workflows_base.CONTEXT_VARIABLES_CACHE.clear)
+        converter = workflows_base.WorkflowConverter()
+
+        output_variables = converter.extract_context_variables(OrderedMap([
+            ('a', '<% ctx().x + ctx().y %>'),
+            ('b', ['<% ctx().x + ctx().y %>', 'literal']),
+        ]))
+        when_expr = converter.replace_immediately_referenced_variables(
+            'task_name', '<% ctx().x + ctx().y %>', {'x': '<% result() %>'})
+
+        self.assertEqual(output_variables, set(['x', 'y']))
+        self.assertEqual(when_expr, '<% (result()) + ctx().y %>')
+        stats = workflows_base.CONTEXT_VARIABLES_CACHE.stats()
+        # 'literal' doesn't have any variables in it, so it isn't searched
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 1, 1))
+
+    def test_replace_immediately_referenced_variables(self):
+        converter = workflows_base.WorkflowConverter()
+        publish = {'x': '<% result().x + 1 %>', 'y': '<% ctx().x %>', 'z': '{{ result().z }}'}
+
+        cases = [
+            ('<% ((ctx().x)) %>', '<% (result().x + 1) %>'),
+            ('<% len(ctx().x) %>', '<% len(result().x + 1) %>'),
+            ('<% (ctx(x)) %>', '<% (result().x + 1) %>'),
+            ('<% 4 * ctx().x > 0 %>', '<% 4 * (result().x + 1) > 0 %>'),
+            # every reference is replaced, even when they share a separator
+            ('<% ctx().x ctx().x %>', '<% (result().x + 1) (result().x + 1) %>'),
+            # the expressions the variables are replaced with aren't searched
+            ('<% ctx().y and ctx().x %>', '<% (ctx().x) and (result().x + 1) %>'),
+            ('<% ctx().x_y or asdfctx(x) %>', '<% ctx().x_y or asdfctx(x) %>'),
+        ]
+        for when_expr, expected in cases:
+            self.assertEqual(converter.replace_immediately_referenced_variables('task_name', when_expr, publish),
+                             expected)
+
+    def test_replace_immediately_referenced_variables_other_type(self):
+        converter = workflows_base.WorkflowConverter()
+        publish = {'x': '<% result().x %>', 'z': '{{ result().z }}'}
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            when_expr = converter.replace_immediately_referenced_variables(
+                'task_name', '<% ctx().x and ctx().z %>', publish)
+
+        self.assertEqual(when_expr, '<% (result().x) and ctx().z %>')
+        self.assertEqual(len(caught), 1)
+        self.assertIn("references the 'z' context variable", str(caught[0].message))
+
+    def test_variable_reference_rgx_cached(self):
+        workflows_base.VARIABLE_REFERENCE_RGX_CACHE.clear()
+        self.addCleanup(workflows_base.VARIABLE_REFERENCE_RGX_CACHE.clear)
+
+        rgx = workflows_base.variable_reference_rgx(['a', 'b'])
+        self.assertIs(workflows_base.variable_reference_rgx(set(['b', 'a'])), rgx)
+        self.assertIsNot(workflows_base.variable_reference_rgx(['a']), rgx)
+
     def test_convert_task_transition_simple(self):
         converter = workflows_base.WorkflowConverter()
         transitions = ['a', 'b', 'c']
@@ -448,6 +521,85 @@ class TestWorkflows(base_test_case.BaseTestCase):
                          r"values of any common keys are the same\.")
         self.assertRegex(str(ctx_m.exception), rgx)
 
+    def test_convert_task_transitions_converts_publish_once(self):
+        converter = workflows_base.WorkflowConverter()
+        task_spec = OrderedMap([
+            ('publish', OrderedMap([
+                ('good_data', '{{ _.good }}'),
+            ])),
+            ('publish-on-error', OrderedMap([
+                ('bad_data', '{{ _.bad }}'),
+            ])),
+            ('on-success', [OrderedMap([('task{}'.format(i), '{{{{ _.x == {} }}}}'.format(i))])
+                            for i in range(10)] + ['always_a']),
+            ('on-error', [OrderedMap([('error_task{}'.format(i), '{{{{ _.e == {} }}}}'.format(i))])
+                          for i in range(10)]),
+            ('on-complete', [OrderedMap([('complete_task', '{{ _.d }}')]), 'always_b']),
+        ])
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        with mock.patch.object(workflows_base.expressions.ExpressionConverter, 'convert_dict',
+                               wraps=workflows_base.expressions.ExpressionConverter.convert_dict) as convert_dict:
+            result = converter.convert_task_transitions("task_name", task_spec, expr_converter, set())
+
+        # publish and publish-on-error, on-complete publishes both of them
+        self.assertEqual(convert_dict.call_count, 2)
+        self.assertEqual(len(result['next']), 23)
+        publishes = [t['publish'] for t in result['next']]
+        self.assertEqual(publishes[:11], [[{'good_data': '{{ ctx().good }}'}]] * 11)
+        self.assertEqual(publishes[11:21], [[{'bad_data': '{{ ctx().bad }}'}]] * 10)
+        self.assertEqual(publishes[21:], [[{'good_data': '{{ ctx().good }}'},
+                                           {'bad_data': '{{ ctx().bad }}'}]] * 2)
+
+    def test_convert_task_transitions_unused_publish(self):
+        converter = workflows_base.WorkflowConverter()
+        task_spec = OrderedMap([
+            ('publish', OrderedMap([('ratio', 1.5)])),
+            ('publish-on-error', OrderedMap([('bad_data', '{{ _.bad }}')])),
+            ('on-error', ['error_task']),
+        ])
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        # no transition publishes the publish block, so its value isn't
+        # converted, and doesn't get a warning
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            result = converter.convert_task_transitions("task_name", task_spec, expr_converter, set())
+
+        self.assertEqual(caught, [])
+        self.assertEqual(result['next'], [OrderedMap([('when', '{{ failed() }}'),
+                                                      ('publish', [{'bad_data': '{{ ctx().bad }}'}]),
+                                                      ('do', ['error_task'])])])
+
+        # unless it's published to the workflow context
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            converter.convert_task_transitions("task_name", task_spec, expr_converter, {'ratio'})
+
+        self.assertEqual([str(w.message) for w in caught],
+                         ["Could not recognize expression '1.5'; results may not be accurate."])
+
+    def test_expression_keys_unused_publish(self):
+        converter = workflows_base.WorkflowConverter()
+        mistral_wf = OrderedMap([
+            ('tasks', OrderedMap([
+                ('task1', OrderedMap([
+                    ('publish', OrderedMap([('a', '{{ _.a }}')])),
+                    ('publish-on-error', OrderedMap([('b', '{{ _.b }}')])),
+                    ('on-error', [OrderedMap([('task2', '{{ _.c }}')])]),
+                ])),
+            ])),
+        ])
+
+        # no transition publishes the publish block
+        self.assertEqual([expr for _, expr, _ in converter.expression_keys(mistral_wf)],
+                         ['{{ _.b }}', '{{ _.c }}'])
+
+        # but the workflow output may need it
+        mistral_wf['output'] = OrderedMap([('a', '{{ _.a }}')])
+        self.assertEqual([expr for _, expr, _ in converter.expression_keys(mistral_wf)],
+                         ['{{ _.a }}', '{{ _.a }}', '{{ _.b }}', '{{ _.c }}'])
+
     def test_convert_with_items(self):
         wi = {
             'with-items': 'b in <% [3, 4, 5] %>',
@@ -516,6 +668,17 @@ class TestWorkflows(base_test_case.BaseTestCase):
         }
         self.assertEqual(expected, actual)
 
+    def test_convert_with_items_expr_task_ctx(self):
+        converter = workflows_base.WorkflowConverter()
+        task_ctx = workflows_base.TaskContext('task_name')
+        converter.convert_with_items_expr(['a in <% $.x %>', 'b in <% $.y %>'],
+                                          yql.YaqlExpressionConverter, task_ctx)
+
+        self.assertEqual(task_ctx.item_vars, ['a', 'b'])
+        self.assertEqual(converter.convert_action('<% $.a %>', task_ctx), '<% item(a) %>')
+        # without the task context, the item vars aren't known
+        self.assertEqual(converter.convert_action('<% $.a %>'), '<% ctx().a %>')
+
     def test_convert_with_items_expr_list(self):
         wi_list = [
             'a in <% [0, 1, 2] %>',
@@ -957,3 +1120,135 @@ class TestWorkflows(base_test_case.BaseTestCase):
                 ('version', '1.0'),
                 ('type', 'junk'),
             ]))
+
+    def _fixture_workflows(self):
+        mistral_wfs = []
+        for filename in sorted(glob.glob(os.path.join(self.get_fixture_path('mistral'), '*.yaml'))):
+            if os.path.basename(filename) == 'unsupported_attributes.yaml':
+                continue
+            _, data = yaml_utils.read_yaml(filename)
+            mistral_wfs.extend(v for k, v in data.items() if k != 'version')
+        return mistral_wfs
+
+    def test_convert_many_matches_serial(self):
+        converter = workflows_base.WorkflowConverter()
+        mistral_wfs = self._fixture_workflows() * 10
+
+        serial = [yaml_utils.obj_to_yaml(converter.convert(wf, force=True)) for wf in mistral_wfs]
+        threaded = converter.convert_many(mistral_wfs, force=True, threads=8)
+
+        self.assertEqual([yaml_utils.obj_to_yaml(wf) for wf in threaded], serial)
+
+    def test_convert_many_item_vars_stay_in_their_task(self):
+        # with-items variables of a task in one workflow must not leak into
+        # the tasks of the workflows that are converted at the same time
+        with_items_wf = OrderedMap([
+            ('tasks', OrderedMap([
+                ('task{}'.format(i), OrderedMap([
+                    ('with-items', 'x in <% $.xs %>'),
+                    ('action', 'core.local'),
+                    ('input', OrderedMap([('cmd', '<% $.x %>')])),
+                ])) for i in range(20)
+            ])),
+        ])
+        plain_wf = OrderedMap([
+            ('tasks', OrderedMap([
+                ('task{}'.format(i), OrderedMap([
+                    ('action', 'core.local'),
+                    ('input', OrderedMap([('cmd', '<% $.x %>')])),
+                ])) for i in range(20)
+            ])),
+        ])
+        converter = workflows_base.WorkflowConverter()
+
+        results = converter.convert_many([with_items_wf, plain_wf] * 20, threads=8)
+
+        for i, result in enumerate(results):
+            expected = '<% item(x) %>' if i % 2 == 0 else '<% ctx().x %>'
+            for task in result['tasks'].values():
+                self.assertEqual(task['input']['cmd'], expected)
+
+    def test_convert_many_raises(self):
+        converter = workflows_base.WorkflowConverter()
+        with self.assertRaises(NotImplementedError):
+            converter.convert_many([OrderedMap([('version', '1.0')]),
+                                    OrderedMap([('type', 'reverse')])], threads=2)
+
+    def _big_workflow_tasks(self, count, target=False):
+        # with target, every task has an unsupported attribute, which is
+        # copied to the output as is with force, comments and all
+        tasks = '\n'.join(
+            "  task{i}:\n"
+            "    # the task comment of task{i}\n"
+            "    with-items: x in <% $.xs_{i} %>\n"
+            "    action: core.local\n"
+            "    input:\n"
+            "      cmd: echo <% $.x %> {{{{ _.y_{i} }}}}\n"
+            "{target}"
+            "    publish:\n"
+            "      y_{i}: <% task(task{i}).result %>\n"
+            "    on-success:\n"
+            "      - task{next}: <% $.y_{i} %>\n".format(
+                i=i, next=i + 1,
+                target="    target:\n      host: h{}  # the target comment of task{}\n".format(i, i) if target else '')
+            for i in range(count))
+        _, data = yaml_utils.load_yaml('tasks:\n' + tasks)
+        return data['tasks']
+
+    def test_convert_tasks_parallel(self):
+        mistral_tasks = self._big_workflow_tasks(30, target=True)
+        converter = workflows_base.WorkflowConverter()
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        serial = converter.convert_tasks(mistral_tasks, expr_converter, set(), force=True)
+        with mock.patch.object(workflows_base, 'PARALLEL_TASKS_THRESHOLD', 20), \
+                mock.patch.object(workflows_base, 'TASK_CHUNK_SIZE', 7), \
+                mock.patch.object(converter, 'convert_tasks_parallel',
+                                  wraps=converter.convert_tasks_parallel) as convert_tasks_parallel:
+            parallel = converter.convert_tasks(mistral_tasks, expr_converter, set(), force=True, jobs=3)
+
+        self.assertEqual(convert_tasks_parallel.call_count, 1)
+        self.assertEqual(list(parallel.keys()), ['task{}'.format(i) for i in range(30)])
+        self.assertIn('# the target comment of task29', yaml_utils.obj_to_yaml(parallel))
+        self.assertEqual(yaml_utils.obj_to_yaml(parallel), yaml_utils.obj_to_yaml(serial))
+
+    def test_convert_tasks_parallel_pickled(self):
+        # when the worker processes aren't forked, the tasks are pickled
+        # for them, and that mustn't lose the comments either
+        mistral_tasks = self._big_workflow_tasks(30, target=True)
+        converter = workflows_base.WorkflowConverter()
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        serial = converter.convert_tasks(mistral_tasks, expr_converter, set(), force=True)
+        with mock.patch.object(workflows_base, 'PARALLEL_TASKS_THRESHOLD', 20), \
+                mock.patch.object(workflows_base, 'TASK_CHUNK_SIZE', 7), \
+                mock.patch('multiprocessing.get_start_method', return_value='spawn'), \
+                mock.patch.object(workflows_base.yaml_utils, 'dumps_ruamel',
+                                  wraps=yaml_utils.dumps_ruamel) as dumps_ruamel:
+            parallel = converter.convert_tasks(mistral_tasks, expr_converter, set(), force=True, jobs=3)
+
+        self.assertIsInstance(dumps_ruamel.call_args_list[0][0][0][1], workflows_base.ConversionContext)
+        self.assertIn('# the target comment of task29', yaml_utils.obj_to_yaml(parallel))
+        self.assertEqual(yaml_utils.obj_to_yaml(parallel), yaml_utils.obj_to_yaml(serial))
+
+    def test_convert_tasks_parallel_threshold(self):
+        mistral_tasks = self._big_workflow_tasks(10)
+        converter = workflows_base.WorkflowConverter()
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        with mock.patch.object(workflows_base, 'PARALLEL_TASKS_THRESHOLD', 20), \
+                mock.patch.object(converter, 'convert_tasks_parallel') as convert_tasks_parallel:
+            converter.convert_tasks(mistral_tasks, expr_converter, set(), jobs=3)
+
+        self.assertEqual(convert_tasks_parallel.call_count, 0)
+
+    def test_convert_tasks_parallel_raises(self):
+        mistral_tasks = self._big_workflow_tasks(30)
+        mistral_tasks['task25']['timeout'] = 10
+        converter = workflows_base.WorkflowConverter()
+        expr_converter = jinja.JinjaExpressionConverter()
+
+        with mock.patch.object(workflows_base, 'PARALLEL_TASKS_THRESHOLD', 20), \
+                mock.patch.object(workflows_base, 'TASK_CHUNK_SIZE', 7):
+            with self.assertRaises(NotImplementedError):
+                converter.convert_tasks(mistral_tasks, expr_converter, set(), jobs=3)